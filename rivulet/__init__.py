@@ -1,3 +1,4 @@
 from .__version__ import __version__
+from .riv_program import compile, Program, Result
 
 all = [__version__]
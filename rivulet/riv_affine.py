@@ -0,0 +1,358 @@
+"Closed-form execution of while loops whose bodies are affine updates of cells"
+
+ONE = -1    # key of the constant term in an affine expression
+
+# commands whose effect on a cell is affine in the cells they read
+AFFINE_COMMANDS = (None, "addition_assignment", "subtraction_assignment", "overwrite",
+                   "multiplication_assignment", "insert", "append", "pop", "pop_and_append")
+
+
+def _add(a, b, sign=1):
+    "Sum of two affine expressions, dicts of variable index to coefficient"
+    ret = dict(a)
+    for k, v in b.items():
+        ret[k] = ret.get(k, 0) + sign * v
+        if ret[k] == 0:
+            del ret[k]
+    return ret
+
+
+def _scale(a, c):
+    return {k: v * c for k, v in a.items()} if c else {}
+
+
+def _constant(a):
+    "The value of a constant expression, or None if it depends on a cell"
+    if any(k != ONE for k in a):
+        return None
+    return a.get(ONE, 0)
+
+
+def _mat_mul(a, b):
+    size = len(a)
+    cols = list(zip(*b))
+    return [[sum(x * y for x, y in zip(a[r], cols[c]) if x and y) for c in range(size)]
+            for r in range(size)]
+
+
+def _mat_pow(m, power):
+    "m ** power by repeated squaring, exact for ints"
+    size = len(m)
+    result = [[int(r == c) for c in range(size)] for r in range(size)]
+    while power:
+        if power & 1:
+            result = _mat_mul(result, m)
+        power >>= 1
+        if power:
+            m = _mat_mul(m, m)
+    return result
+
+
+class AffinePlan:
+    """One iteration of a loop body as an affine map over a fixed set of cells
+
+    Built for the list lengths the loop was entered with: every glyph's cell
+    numbers are fixed by them, and the body must leave them unchanged.
+    """
+
+    def __init__(self, variables, rows, outputs, question):
+        self.variables = variables      # (list, cell) of each variable
+        self.rows = rows                # new value of each variable, as sparse (idx, coef) pairs and a constant
+        self.outputs = outputs          # (list, rows) appended to lists that are only ever appended to
+        self.question = question        # index of the variable the while question tests
+
+        # the question cell changes by step(v) each iteration; if step is unchanged by
+        # the map, the count of iterations has a closed form
+        self.step = None
+        if not outputs:
+            step = _add(self.__expr(question), {question: 1}, -1)
+            if _add(self.__substitute(step), step, -1) == {}:
+                self.step = step
+
+
+    def __expr(self, idx):
+        terms, const = self.rows[idx]
+        expr = dict(terms)
+        if const:
+            expr[ONE] = const
+        return expr
+
+
+    def __substitute(self, expr):
+        "expr evaluated on the variables after one iteration"
+        ret = {}
+        for k, v in expr.items():
+            ret = _add(ret, {ONE: v} if k == ONE else _scale(self.__expr(k), v))
+        return ret
+
+
+    @staticmethod
+    def __eval(row, values):
+        terms, const = row
+        return sum(c * values[i] for i, c in terms) + const
+
+
+    def run(self, values, limit=None):
+        """Run the loop from values until its final, rolled-back iteration
+
+        Returns the values it leaves, the output to append and the number of
+        iterations run (including the rolled-back one). Returns None if the
+        loop never ends, or False if it would run more than limit iterations.
+        """
+        if self.step is not None:
+            return self.__run_closed_form(values, limit)
+
+        rows = self.rows
+        outputs = [(lst, []) for lst, _ in self.outputs]
+        iterations = 0
+        while True:
+            iterations += 1
+            if limit is not None and iterations > limit:
+                return False
+            new = [self.__eval(row, values) for row in rows]
+            if new[self.question] <= 0:
+                return values, outputs, iterations
+            for (_, out_rows), (_, out) in zip(self.outputs, outputs):
+                out.extend(self.__eval(row, values) for row in out_rows)
+            values = new
+
+
+    def __run_closed_form(self, values, limit):
+        step = self.step.get(ONE, 0) + sum(c * values[k] for k, c in self.step.items() if k != ONE)
+        start = values[self.question]
+        if start + step <= 0:
+            return values, [], 1
+        if step >= 0:
+            return None
+        # first iteration k where start + k * step <= 0
+        iterations = -(-start // -step)
+        if limit is not None and iterations > limit:
+            return False
+
+        size = len(values)
+        matrix = [[0] * (size + 1) for _ in range(size + 1)]
+        for r, (terms, const) in enumerate(self.rows):
+            for idx, coef in terms:
+                matrix[r][idx] = coef
+            matrix[r][size] = const
+        matrix[size][size] = 1
+
+        power = _mat_pow(matrix, iterations - 1)
+        vector = list(values) + [1]
+        values = [sum(c * x for c, x in zip(row, vector) if c) for row in power[:size]]
+        return values, [], iterations
+
+
+class AffineLoops:
+    """Finds while blocks that are affine loops and runs them in closed form
+
+    Candidates are found statically: blocks of glyphs (no sub-blocks) using
+    only affine commands, whose one question is a while question on a cell
+    at the end of the block. Whether the body keeps its cells fixed depends
+    on list lengths, so plans are built when a loop is reached, for the
+    lengths it is reached with. Plans aren't changed once built, so runs of
+    the same program can share them by passing the same dict as plans.
+    """
+
+    def __init__(self, tree, plans=None):
+        self.blocks = {}
+        self.plans = {} if plans is None else plans
+        self.loops_run = 0
+        self.iterations_run = 0
+        self.exceeded = False   # whether the last loop run would have gone past its limit
+        self.__find(tree, ())
+
+
+    def __find(self, block, path):
+        if all(isinstance(g, dict) for g in block) and self.__is_candidate(block):
+            outputs = self.__output_lists(block)
+            self.blocks[path] = (block, outputs, self.__lists_used(block) - outputs)
+        for idx, g in enumerate(block):
+            if not isinstance(g, dict):
+                self.__find(g, path + (idx,))
+
+
+    @staticmethod
+    def __is_candidate(block):
+        questions = [t for g in block for t in g["tokens"] if t["type"] == "question_marker"]
+        if len(questions) != 1 or questions[0] is not block[-1]["tokens"][-1]:
+            return False
+        if questions[0]["block_type"] != "while" or questions[0]["applies_to"] != "cell":
+            return False
+        for g in block:
+            for t in g["tokens"]:
+                if t["type"] == "question_marker":
+                    continue
+                action = t["action"]
+                command = action.get("command") if action else None
+                if command not in AFFINE_COMMANDS:
+                    return False
+                if action and action.get("subtype") == "list2list":
+                    return False
+                if command == "pop_and_append" and t["subtype"] != "ref":
+                    return False
+        return True
+
+
+    @staticmethod
+    def __lists_used(block):
+        used = set()
+        for g in block:
+            for t in g["tokens"]:
+                if "list" in t:
+                    used.add(t["list"])
+                if "ref_cell" in t:
+                    used.add(t["ref_cell"][0])
+        return used
+
+
+    @staticmethod
+    def __output_lists(block):
+        "Lists the block only appends to and never reads"
+        appended = set()
+        used = set()
+        for g in block:
+            for t in g["tokens"]:
+                if t["type"] == "question_marker":
+                    used.add(t["ref_cell"][0])
+                    continue
+                command = t["action"].get("command") if t["action"] else None
+                if command in ("append", "pop_and_append"):
+                    appended.add(t["list"])
+                else:
+                    used.add(t["list"])
+                if t["subtype"] == "ref":
+                    used.add(t["ref_cell"][0])
+        return frozenset(appended - used)
+
+
+    def run(self, path, state, limit=None):
+        """Run the loop at path to completion if it is affine for the current state
+
+        Returns the number of iterations run, or None if it must be interpreted,
+        including when it would run more than limit iterations (which sets exceeded).
+        """
+        self.exceeded = False
+        block, outputs, used = self.blocks[path]
+        shape = (path,) + tuple(len(state[lst]) for lst in sorted(used) if lst in state)
+        if shape not in self.plans:
+            self.plans[shape] = self.__compile(block, outputs, state)
+        plan = self.plans[shape]
+        if plan is None:
+            return None
+
+        values = [state[lst][cell] for lst, cell in plan.variables]
+        if any(type(v) is not int for v in values):
+            return None
+
+        result = plan.run(values, limit)
+        if not result:
+            self.exceeded = result is False
+            return None
+        values, appended, iterations = result
+
+        for (lst, cell), val in zip(plan.variables, values):
+            state[lst][cell] = val
+        for lst, out in appended:
+            state[lst].extend(out)
+
+        self.loops_run += 1
+        self.iterations_run += iterations
+        return iterations
+
+
+    @staticmethod
+    def __compile(block, outputs, state):
+        "Run the body once on symbolic values; None if it isn't affine"
+        lists = {}
+        variables = []
+        question = None
+
+        def sym(lst):
+            if lst not in lists:
+                if lst in outputs:
+                    lists[lst] = []
+                else:
+                    lists[lst] = [{len(variables) + i: 1} for i in range(len(state[lst]))]
+                    variables.extend((lst, i) for i in range(len(state[lst])))
+            return lists[lst]
+
+        def apply(command, current, source):
+            if command in (None, "addition_assignment"):
+                return _add(current, source)
+            if command == "subtraction_assignment":
+                return _add(current, source, -1)
+            if command == "overwrite":
+                return source
+            # multiplication_assignment is affine if either side is constant
+            if _constant(source) is not None:
+                return _scale(current, _constant(source))
+            if _constant(current) is not None:
+                return _scale(source, _constant(current))
+            return None
+
+        for glyph in block:
+            for token in glyph["tokens"]:
+                if token["type"] == "question_marker":
+                    lst, cell = token["ref_cell"]
+                    if lst not in state or lst in outputs or cell >= len(sym(lst)):
+                        return None
+                    question = (lst, cell)
+                    continue
+
+                if token["list"] not in state:
+                    return None
+                target = sym(token["list"])
+
+                if token["type"] == "touch":
+                    if len(target) < token["assign_to_cell"]:
+                        return None
+                    target.extend({} for _ in range(token["length"] - len(target)))
+                    continue
+                command = token["action"].get("command") if token["action"] else None
+                cell = token.get("assign_to_cell")
+
+                if cell is not None and len(target) == cell and command not in ("pop_and_append", "append"):
+                    target.append({})
+
+                if token["subtype"] == "value":
+                    source = {ONE: token["value"]} if token["value"] else {}
+                else:
+                    ref_list, ref_cell = token["ref_cell"]
+                    # the interpreter's bounds checks raise, so leave those to it
+                    if ref_list not in state or ref_cell >= len(sym(ref_list)):
+                        return None
+                    source = sym(ref_list)[ref_cell]
+
+                if command == "insert":
+                    target.insert(cell, source)
+                elif command == "append":
+                    target.append(source)
+                elif command == "pop_and_append":
+                    target.append(sym(ref_list).pop(ref_cell))
+                elif token["action"] and token["action"].get("subtype") == "list":
+                    for i, current in enumerate(target):
+                        target[i] = apply(command, current, source)
+                        if target[i] is None:
+                            return None
+                else:
+                    if cell >= len(target):
+                        return None
+                    target[cell] = apply("addition_assignment" if command == "pop" else command,
+                                         target[cell], source)
+                    if target[cell] is None:
+                        return None
+                    if command == "pop" and token["subtype"] == "ref":
+                        sym(ref_list).pop(ref_cell)
+
+        # the body must leave every list it reads the length it found it
+        for lst, exprs in lists.items():
+            if lst not in outputs and len(exprs) != len(state[lst]):
+                return None
+
+        def row(expr):
+            return (tuple((k, v) for k, v in expr.items() if k != ONE), expr.get(ONE, 0))
+
+        rows = [row(lists[lst][cell]) for lst, cell in variables]
+        appended = [(lst, [row(e) for e in lists[lst]]) for lst in sorted(outputs) if lists.get(lst)]
+        return AffinePlan(variables, rows, appended, variables.index(question))
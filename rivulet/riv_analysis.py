@@ -0,0 +1,144 @@
+"Static analysis of what blocks of glyphs read and write"
+
+
+class BlockEffects:
+    """The locations a block can read and write, found from its tokens
+
+    Cells are (list, cell) pairs. A list whose cells can move (through insert,
+    append or pop) or that is read or written as a whole is tracked as a whole
+    list instead of by cell, since its cell numbers no longer mean the same
+    thing from one glyph to the next.
+
+    A block can only be rolled back by a question in one of its own glyphs;
+    those in sub-blocks roll back the sub-block. Rolling back restores the
+    lists written anywhere in the block, including its sub-blocks. So the
+    cells such a block writes are also read: rolled back, they end with
+    the values they had when it was entered, even those it overwrites.
+    """
+
+    def __init__(self):
+        self.cells_read = set()
+        self.cells_written = set()
+        self.sized = set()          # lists accessed by cell, whose lengths matter
+        self.touched = set()        # lists a touch can lengthen, without changing a value
+        self.whole_read = set()
+        self.whole_written = set()
+        self.whole = ()             # lists read or written as a whole, set by finish
+        self.lists_written = ()     # every list written, by cell or as a whole, set by finish
+        self.rolls_back = False     # whether a glyph of the block (not a sub-block) has a question
+
+
+    def add_glyph(self, glyph):
+        "Add the reads and writes of every token in a glyph"
+        for token in glyph["tokens"]:
+            self.__add_token(token)
+
+
+    def add_block(self, other):
+        "Add the reads and writes of a sub-block"
+        self.cells_read.update(other.cells_read)
+        self.cells_written.update(other.cells_written)
+        self.sized.update(other.sized)
+        self.touched.update(other.touched)
+        self.whole_read.update(other.whole_read)
+        self.whole_written.update(other.whole_written)
+
+
+    def __read_cell(self, ref_cell):
+        self.cells_read.add(tuple(ref_cell))
+        self.sized.add(ref_cell[0])
+
+
+    def __add_token(self, token):
+        if token["type"] == "question_marker":
+            self.rolls_back = True
+            if token["applies_to"] == "list":
+                self.whole_read.add(token["ref_list"])
+            else:
+                self.__read_cell(token["ref_cell"])
+            return
+
+        # a touch only creates cells, so its list's length is its only effect: the
+        # cells it reaches can hold live values a cached result mustn't replace
+        if token["type"] == "touch":
+            self.touched.add(token["list"])
+            self.sized.add(token["list"])
+            return
+
+        target = token["list"]
+        action = token["action"]
+        command = action.get("command") if action else None
+        list2list = action is not None and action.get("subtype") == "list2list"
+
+        if token["subtype"] == "ref" and not list2list:
+            self.__read_cell(token["ref_cell"])
+
+        if list2list:
+            self.whole_read.add(token.get("ref_list", token["ref_cell"][0]))
+            self.whole_written.add(target)
+        elif command == "pop_and_append":
+            self.whole_written.add(target)
+            self.whole_written.add(token["ref_cell"][0])
+        elif command in ("insert", "append") or (action and action.get("subtype") == "list"):
+            self.whole_written.add(target)
+        else:
+            cell = (target, token["assign_to_cell"])
+            if command != "overwrite":
+                self.cells_read.add(cell)
+            self.cells_written.add(cell)
+            self.sized.add(target)
+            if command == "pop" and token["subtype"] == "ref":
+                self.whole_written.add(token["ref_cell"][0])
+
+
+    def finish(self):
+        "Drop cells of lists tracked as a whole, and fix the order of every location"
+        if self.rolls_back:
+            self.cells_read = set(self.cells_read) | set(self.cells_written)
+        whole = set(self.whole_read) | set(self.whole_written)
+        self.whole = tuple(sorted(whole))
+        self.lists_written = tuple(sorted(set(self.whole_written) | set(self.touched)
+                                          | {lst for lst, _ in self.cells_written}))
+        self.cells_read = tuple(sorted(c for c in self.cells_read if c[0] not in whole))
+        self.cells_written = tuple(sorted(c for c in self.cells_written if c[0] not in whole))
+        self.sized = tuple(sorted(set(self.sized) - whole))
+        self.touched = tuple(sorted(self.touched))
+        self.whole_read = tuple(sorted(self.whole_read))
+        self.whole_written = tuple(sorted(self.whole_written))
+        return self
+
+
+def guard_question(glyph):
+    """The question deciding whether a glyph rolls back (its last), if none of
+    the glyph's strands write the list it asks about, else None
+
+    Such a question has the same answer before the glyph's strands run as
+    after, so can be asked first.
+    """
+    questions = [t for t in glyph["tokens"] if t["type"] == "question_marker"]
+    if not questions:
+        return None
+    question = questions[-1]
+    effects = BlockEffects()
+    effects.add_glyph(glyph)
+    asked = question["ref_list"] if question["applies_to"] == "list" else question["ref_cell"][0]
+    return None if asked in effects.finish().lists_written else question
+
+
+def analyze_blocks(tree, path=()):
+    """Find the effects of every block in a tree of Blocks (or the nested lists of treeify_glyphs)
+
+    Returns a dict of BlockEffects keyed by each block's path: the indices
+    leading to it from the top of the tree.
+    """
+    found = {}
+    effects = BlockEffects()
+    for idx, g in enumerate(tree):
+        if not isinstance(g, dict):
+            found.update(analyze_blocks(g, path + (idx,)))
+            sub = found[path + (idx,)]
+            effects.add_block(sub)
+        else:
+            effects.add_glyph(g)
+    found[path] = effects.finish()
+    return found
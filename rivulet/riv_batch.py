@@ -0,0 +1,196 @@
+"Running many Rivulet programs over a pool of worker processes"
+from argparse import ArgumentParser
+from collections import deque
+import json
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+from pathlib import Path
+import sys
+import time
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_parser import Parser
+
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+STEP_LIMIT = "step_limit"
+
+
+def _json_value(value):
+    "Cell values JSON can't hold (complex numbers from roots of negatives) are written as strings"
+    return str(value)
+
+
+def summarize(state):
+    "The length of every list, and the number of cells and largest int bit length across them"
+    ints = [abs(v) for cells in state.values() for v in cells if isinstance(v, int)]
+    return {
+        "lengths": {str(key): len(cells) for key, cells in state.items()},
+        "cells": sum(len(cells) for cells in state.values()),
+        "max_bits": max(ints).bit_length() if ints else 0,
+    }
+
+
+def run_one(path, parser, max_glyphs=0):
+    "Run one program, returning its manifest record"
+    record = {"program": str(path)}
+    start = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            program = file.read()
+        intr = Interpreter()
+        execution = intr.start(program, parser=parser)
+        intr.advance(execution, max_glyphs or None)
+
+        record["status"] = OK if execution.done else STEP_LIMIT
+        record["glyphs_run"] = execution.glyphs_run
+        record["list1"] = list(execution.state.get(1, []))
+        record["state"] = summarize(execution.state)
+    except Exception as e: # pylint: disable=broad-exception-caught
+        record["status"] = ERROR
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def _work(conn, max_glyphs):
+    "Worker process: keeps one Parser and runs each program sent to it until sent None"
+    parser = Parser()
+    while True:
+        path = conn.recv()
+        if path is None:
+            return
+        conn.send(run_one(path, parser, max_glyphs))
+
+
+class _Worker:
+    "A worker process and the program it is running, if any"
+
+    def __init__(self, context, max_glyphs):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_work, args=(child, max_glyphs), daemon=True)
+        self.process.start()
+        child.close()
+        self.path = None
+        self.started = None
+
+
+    def send(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self.conn.send(path)
+
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+def find_programs(paths):
+    "The .riv files named, and those in any directories named, in order"
+    found = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            found.extend(sorted(path.glob("*.riv")))
+        else:
+            found.append(path)
+    return found
+
+
+def run_batch(programs, manifest, jobs=None, timeout=None, max_glyphs=0):
+    """Run programs over jobs worker processes, writing a JSON line to the
+    manifest stream for each as it finishes
+
+    A program still running after timeout seconds has its worker killed and
+    replaced. Programs stop after max_glyphs glyphs, if set. Returns the
+    number of programs finishing with each status.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    # forked workers start with the package already imported
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+
+    pending = deque(programs)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pending)))
+    workers = [_Worker(context, max_glyphs) for _ in range(jobs)]
+    counts = {}
+
+    def write(record):
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+        manifest.write(json.dumps(record, default=_json_value) + "\n")
+        manifest.flush()
+
+    def replace(worker):
+        worker.stop(kill=True)
+        workers[workers.index(worker)] = _Worker(context, max_glyphs)
+
+    try:
+        while True:
+            for worker in workers:
+                if worker.path is None and pending:
+                    worker.send(str(pending.popleft()))
+            busy = [w for w in workers if w.path is not None]
+            if not busy:
+                break
+
+            wait_for = None
+            if timeout:
+                now = time.perf_counter()
+                wait_for = max(0, min(w.started + timeout for w in busy) - now)
+
+            for conn in wait([w.conn for w in busy], wait_for):
+                worker = next(w for w in busy if w.conn is conn)
+                try:
+                    record = conn.recv()
+                except EOFError:
+                    record = {"program": worker.path, "status": ERROR, "error": "worker process exited",
+                              "seconds": time.perf_counter() - worker.started}
+                    replace(worker)
+                write(record)
+                worker.path = None
+
+            if timeout:
+                now = time.perf_counter()
+                for worker in busy:
+                    if worker.path is not None and now - worker.started >= timeout:
+                        write({"program": worker.path, "status": TIMEOUT, "seconds": now - worker.started})
+                        replace(worker)
+    finally:
+        for worker in workers:
+            worker.stop()
+    return counts
+
+
+def main(argv):
+    "Entry point for `riv batch`"
+    arg_parser = ArgumentParser(prog="riv batch", description="Run many Rivulet programs in parallel")
+    arg_parser.add_argument("programs", nargs="+", help="program files, or directories of .riv files")
+    arg_parser.add_argument("-o", dest="manifest", default="-",
+                            help="file to write the JSON-lines manifest to (default stdout)")
+    arg_parser.add_argument("-j", dest="jobs", type=int, default=None,
+                            help="number of worker processes (default one per core)")
+    arg_parser.add_argument("--timeout", dest="timeout", type=float, default=None,
+                            help="seconds a program may run before its worker is killed")
+    arg_parser.add_argument("--max-glyphs", dest="max_glyphs", type=int, default=0,
+                            help="stop each program after this many glyphs")
+    args = arg_parser.parse_args(argv)
+
+    programs = find_programs(args.programs)
+    if args.manifest == "-":
+        counts = run_batch(programs, sys.stdout, args.jobs, args.timeout, args.max_glyphs)
+    else:
+        with open(args.manifest, "w", encoding="utf-8") as manifest:
+            counts = run_batch(programs, manifest, args.jobs, args.timeout, args.max_glyphs)
+        print(f"{len(programs)} programs: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())))
+    return 0 if set(counts) <= {OK} else 1
@@ -0,0 +1,66 @@
+"The block structure of a Rivulet program, built from the levels of its glyphs"
+
+
+class Block(tuple):
+    """A block: its glyphs and sub-blocks, in order
+
+    Built once per program and never changed. The glyphs are the parser's
+    own dicts, not copies. Each block knows where it sits in the tree (path,
+    the indices leading to it from the top) and its entry and exit links:
+    the id of the first glyph it runs, and of the glyph run after it ends.
+    Until the interpreter narrows them from the block's effects, every
+    block is snapshot in full.
+    """
+
+    def __new__(cls, children, path=(), level=0):
+        return super().__new__(cls, children)
+
+
+    def __init__(self, children, path=(), level=0):
+        super().__init__()
+        self.path = path            # indices leading to this block from the top of the tree
+        self.level = level          # depth of the block, 0 for the top
+        first = children[0] if children else None
+        self.first = first.first if isinstance(first, Block) else (first or {}).get("id")
+        self.following = None       # id of the glyph after the block's last, None at the end
+        self.rolls_back = True      # whether the block can be rolled back, so needs a snapshot
+        self.saved = None           # positions in State.lists of the lists to snapshot, None for all
+
+
+    def to_lists(self):
+        "The tree as nested lists of glyphs"
+        return [g.to_lists() if isinstance(g, Block) else g for g in self]
+
+
+def build_blocks(glyphs, top_level=1):
+    """Build the tree of blocks for a program's glyphs in one pass over their levels
+
+    A glyph deeper than the one before it opens a block for each level it is
+    deeper; one shallower closes blocks back to its own level.
+    """
+    # blocks being filled, as (level, children, path); the top one is last
+    open_blocks = [(top_level, [], ())]
+    # closed blocks waiting to learn the id of the glyph after them
+    awaiting = []
+
+    def close():
+        level, children, path = open_blocks.pop()
+        block = Block(children, path, level - top_level)
+        open_blocks[-1][1].append(block)
+        awaiting.append(block)
+
+    for g in glyphs:
+        level = g["level"]
+        while len(open_blocks) > 1 and level < open_blocks[-1][0]:
+            close()
+        while level > open_blocks[-1][0]:
+            parent_level, siblings, parent_path = open_blocks[-1]
+            open_blocks.append((parent_level + 1, [], parent_path + (len(siblings),)))
+        for block in awaiting:
+            block.following = g.get("id")
+        awaiting.clear()
+        open_blocks[-1][1].append(g)
+
+    while len(open_blocks) > 1:
+        close()
+    return Block(open_blocks[0][1])
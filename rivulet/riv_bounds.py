@@ -0,0 +1,147 @@
+"Static analysis of list lengths, proving cell references in range"
+
+
+def _join(a, b):
+    "Lengths holding on either of two paths"
+    ret = {}
+    for lst, (lo, hi) in a.items():
+        lo2, hi2 = b[lst]
+        ret[lst] = (min(lo, lo2), None if hi is None or hi2 is None else max(hi, hi2))
+    return ret
+
+
+def _widen(old, new):
+    "new, with any bound still moving given up on, so loops reach a fixed point"
+    ret = {}
+    for lst, (lo, hi) in new.items():
+        old_lo, old_hi = old[lst]
+        ret[lst] = (0 if lo < old_lo else lo, None if hi is None or old_hi is None or hi > old_hi else hi)
+    return ret
+
+
+class BoundsAnalysis:
+    """Tracks the range of each list's length through a program's blocks
+
+    Lengths are (lo, hi) ranges, with hi None if unbounded. Every list starts
+    empty. A block can be left by rolling back, to its length at the start of
+    an iteration, or by finishing; a while block's iterations start from the
+    lengths on entry or at any while question, found by repeating the body
+    until they stop changing.
+
+    Each ref token is marked with in_bounds: whether its cell is in range on
+    every path reaching it, so the interpreter can skip checking it.
+    """
+
+    def __init__(self, lists):
+        self.lists = frozenset(lists)
+        self.report = []
+        self.__out = {}     # token id -> message, for references out of range on every path
+
+
+    def analyze(self, tree):
+        "Mark the tokens of a tree of Blocks, returning a line of report for each reference never in range"
+        self.__block(tree, {lst: (0, 0) for lst in self.lists})
+        self.report = list(self.__out.values())
+        return self.report
+
+
+    def __block(self, block, entry):
+        "The lengths after running block from entry"
+        repeats = any(t["type"] == "question_marker" and t["block_type"] == "while"
+                      for g in block if isinstance(g, dict) for t in g["tokens"])
+        while True:
+            end, at_questions, repeat_at = self.__body(block, entry)
+            if not repeats:
+                break
+            new_entry = entry
+            for lengths in repeat_at:
+                new_entry = _join(new_entry, lengths)
+            if new_entry == entry:
+                break
+            entry = _widen(entry, new_entry)
+
+        # left by finishing, or by rolling back to the start of an iteration
+        return _join(end, entry) if at_questions else end
+
+
+    def __body(self, block, entry):
+        lengths = dict(entry)
+        at_questions = False
+        repeat_at = []
+        for g in block:
+            if not isinstance(g, dict):
+                lengths = self.__block(g, lengths)
+                continue
+            for token in g["tokens"]:
+                if token["type"] == "question_marker":
+                    at_questions = True
+                    if token["block_type"] == "while":
+                        repeat_at.append(dict(lengths))
+                else:
+                    self.__token(g, token, lengths)
+        return lengths, at_questions, repeat_at
+
+
+    def __token(self, glyph, token, lengths):
+        target = token["list"]
+        if target not in lengths:
+            return
+        lo, hi = lengths[target]
+
+        if token["type"] == "touch":
+            lengths[target] = (max(lo, token["length"]), None if hi is None else max(hi, token["length"]))
+            return
+
+        action = token["action"]
+        command = action.get("command") if action else None
+        list2list = action is not None and action.get("subtype") == "list2list"
+
+        # a cell one past the end is created before the token reads its source, as in the
+        # interpreter; only a token writing the cell itself needs it to exist, as an insert
+        # past the end goes to the end and a whole-list command writes every cell there is
+        cell = token.get("assign_to_cell")
+        if cell is not None and command not in ("append", "pop_and_append"):
+            indexed = not list2list and command != "insert" and \
+                (command in (None, "pop") or action.get("subtype") != "list")
+            if indexed:
+                lo = max(lo, cell + 1)
+            elif lo == cell:
+                lo = cell + 1
+            hi = None if hi is None else max(hi, cell + 1)
+            lengths[target] = (lo, hi)
+
+        if token["subtype"] == "ref" and not list2list:
+            self.__check(glyph, token, lengths)
+
+        ref_list = token["ref_cell"][0] if token["subtype"] == "ref" else None
+        if command in ("insert", "append"):
+            lengths[target] = (lo + 1, None if hi is None else hi + 1)
+        elif command == "pop_and_append" and ref_list in lengths:
+            self.__shrink(lengths, ref_list)
+            lo, hi = lengths[target]
+            lengths[target] = (lo + 1, None if hi is None else hi + 1)
+        elif command == "pop" and ref_list in lengths:
+            self.__shrink(lengths, ref_list)
+
+
+    @staticmethod
+    def __shrink(lengths, lst):
+        lo, hi = lengths[lst]
+        lengths[lst] = (max(lo - 1, 0), None if hi is None else max(hi - 1, 0))
+
+
+    def __check(self, glyph, token, lengths):
+        ref_list, ref_cell = token["ref_cell"]
+        key = id(token)
+        if ref_list not in lengths:
+            token["in_bounds"] = False
+            self.__out[key] = f"glyph {glyph.get('id')}: reference to list {ref_list}, which the program has no line for"
+            return
+        lo, hi = lengths[ref_list]
+        # a token in a loop is checked on every pass, and keeps the verdict of the last
+        token["in_bounds"] = ref_cell < lo
+        if hi is not None and ref_cell >= hi:
+            self.__out[key] = f"glyph {glyph.get('id')}: reference to cell {ref_cell} of list {ref_list}, " \
+                f"which has at most {hi} cells there"
+        else:
+            self.__out.pop(key, None)
@@ -0,0 +1,104 @@
+"A cache on disk of the final states of programs that have run to the end"
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+# total size of the entries kept, by default
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+SUFFIX = ".json"
+
+
+def default_directory():
+    "The cache directory under XDG_CACHE_HOME, or ~/.cache"
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "rivulet" / "results"
+
+
+def _encode(value):
+    "Complex numbers (from roots of negatives) are the only cell values JSON can't hold"
+    if isinstance(value, complex):
+        return {"complex": [value.real, value.imag]}
+    raise TypeError(f"cannot cache a cell holding {value!r}")
+
+
+def _decode(obj):
+    if "complex" in obj:
+        return complex(*obj["complex"])
+    return obj
+
+
+class ResultCache:
+    """Final states of program runs, one file per run, kept under max_bytes
+
+    A Rivulet program reads no input, so a run is decided by the program's
+    text, the interpreter version and the options that change what it does;
+    key makes the name of an entry from those. Entries are evicted least
+    recently used first once the cache is over max_bytes. A missing or
+    unreadable entry is a miss, so the directory can be cleared at any time.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory) if directory is not None else default_directory()
+        self.max_bytes = max_bytes
+
+
+    @staticmethod
+    def key(program, version, options):
+        "The key of a run of program (its text) by an interpreter version with options, a dict"
+        text = json.dumps([program, version, options], sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+    def __path(self, key):
+        return self.directory / (key + SUFFIX)
+
+
+    def get(self, key):
+        "The entry for key, a dict of its state and output, or None"
+        path = self.__path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file, object_hook=_decode)
+            state = {int(line): cells for line, cells in entry["state"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        os.utime(path)
+        return {"state": state, "output": entry["output"]}
+
+
+    def put(self, key, state):
+        "Store a final state, a dict of line number to list of values, under key"
+        entry = {"state": state, "output": state.get(1, [])}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.__path(key)
+        # each writer has its own partial file, so runs in other threads or processes can store the same key
+        partial = self.directory / f"{key}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(partial, "w", encoding="utf-8") as file:
+            json.dump(entry, file, default=_encode)
+        os.replace(partial, path)
+        self.evict()
+
+
+    def evict(self):
+        "Remove the least recently used entries until the cache is within max_bytes"
+        entries = []
+        for path in self.directory.glob("*" + SUFFIX):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+    def clear(self):
+        "Remove every entry"
+        for path in self.directory.glob("*" + SUFFIX):
+            path.unlink(missing_ok=True)
@@ -11,3 +11,40 @@ class InternalError(Exception):
 
     def __init__(self, message):
         super().__init__(f"INTERNAL ERROR: {message}")
+
+class CheckpointError(Exception):
+    "A checkpoint that cannot be used to resume a program"
+
+    def __init__(self, message):
+        super().__init__(f"CHECKPOINT ERROR: {message}")
+
+class ProfileError(Exception):
+    "A run profile that cannot be read"
+
+    def __init__(self, message):
+        super().__init__(f"PROFILE ERROR: {message}")
+
+class LimitExceededError(Exception):
+    "A program going over one of the limits set on its execution"
+
+    def __init__(self, limit, allowed, glyph=None):
+        super().__init__(limit, allowed, glyph)
+        self.limit = limit          # name of the limit, as in Limits
+        self.allowed = allowed      # the value it was set to
+        self.glyph = glyph          # id of the glyph running when it was exceeded
+
+    def __str__(self):
+        return f"LIMIT EXCEEDED: {self.limit} of {self.allowed} exceeded at glyph {self.glyph}"
+
+class InfiniteLoopError(Exception):
+    "A while block found to have returned to a state it was in before, so to loop forever"
+
+    def __init__(self, glyph, iteration, period):
+        super().__init__(glyph, iteration, period)
+        self.glyph = glyph          # id of the glyph repeating the block
+        self.iteration = iteration  # the iteration the block was starting when found
+        self.period = period        # iterations between repeats of the same state
+
+    def __str__(self):
+        return f"INFINITE LOOP: glyph {self.glyph} repeats its block forever; " \
+            f"at iteration {self.iteration} the state was the same as {self.period} iterations before"
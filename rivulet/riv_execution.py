@@ -0,0 +1,234 @@
+"The position and state of a running Rivulet program, and checkpoints of it"
+import asyncio
+import hashlib
+import io
+import json
+import os
+import pickle
+import struct
+import time
+import zlib
+from rivulet.riv_exceptions import CheckpointError
+
+CHECKPOINT_MAGIC = b"RIVC"
+CHECKPOINT_VERSION = 3
+
+_HEADER = struct.Struct("<4sB32s")
+
+# the classes a checkpoint's state and snapshots are made of, the only ones it may hold
+_CHECKPOINT_CLASSES = frozenset([
+    ("rivulet.riv_state", "State"),
+    ("rivulet.riv_state", "Cells"),
+    ("rivulet.riv_state", "Snapshot"),
+    ("rivulet.riv_mmap", "MappedStorage"),
+    ("array", "array"),
+    ("array", "_array_reconstructor"),
+    ("collections", "deque"),
+    ("builtins", "complex"),
+])
+
+# glyphs run between checks of the clock in Execution.run
+SLICE_GLYPHS = 64
+
+
+def program_hash(glyphs):
+    "A digest of the parsed program, used to check a checkpoint belongs to it"
+    return hashlib.sha256(json.dumps(glyphs, sort_keys=True).encode("utf-8")).digest()
+
+
+# the snapshot of a frame whose block a profile never saw roll back, so wasn't taken
+UNSAVED = object()
+
+
+def snapshot(state, block=None):
+    "A copy of the state block can roll back to, of only the lists it can write; None if it can't roll back"
+    if block is None:
+        return state.copy()
+    return state.copy(block.saved) if block.rolls_back else None
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    "Unpickles a checkpoint's body, refusing any class it shouldn't hold, whose loading could run code"
+
+    def find_class(self, module, name):
+        if (module, name) not in _CHECKPOINT_CLASSES:
+            raise CheckpointError(f"Checkpoint holds {module}.{name}, which isn't part of a program's state")
+        return super().find_class(module, name)
+
+
+class Frame:
+    "A block being executed, with its position, iteration and the state to roll back to"
+    __slots__ = ("block", "path", "pos", "iteration", "snapshot", "memo_key", "entry_glyphs", "closed_form",
+                 "loop_watch")
+
+    def __init__(self, block, path, snap, pos=0, iteration=0):
+        self.block = block          # the block's list of glyphs and sub-blocks
+        self.path = path            # indices leading from the program's tree to this block
+        self.pos = pos              # index of the next glyph or sub-block to run
+        self.iteration = iteration  # how many times a while glyph has repeated the block
+        self.snapshot = snap        # state at the start of this iteration
+        self.memo_key = None        # key to cache the block's result under when it ends
+        self.entry_glyphs = 0       # glyphs run by the execution when the block was entered
+        self.closed_form = True     # whether to try running the block in closed form
+        self.loop_watch = None      # LoopWatch of the states iterations start in, if watching for endless loops
+
+
+class RunContext:
+    """What one run of a program uses besides its state and position: what
+    watches it, where it is saved, its limits and the optimizations built for it
+
+    An Interpreter and the programs it has loaded are shared by its runs;
+    everything a run changes as it goes is kept here instead.
+    """
+
+    def __init__(self, verbose=False, trace=None, checkpoint_file=None, checkpoint_every=0, limits=None,
+                 hooks=None):
+        self.verbose = verbose
+        self.trace = trace                      # TraceRecorder the run is written to, if traced
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_every = checkpoint_every if checkpoint_file else 0
+        self.limits = limits                    # Limits of the run, by default the interpreter's
+        self.hooks = hooks                      # Hooks the run calls, by default the interpreter's
+        self.debug = None                       # PythonTranspiler describing glyphs, if verbose
+        self.described = {}                     # glyph id -> its description, once printed
+        self.collect_writes = False             # whether glyphs list their writes, for a trace or hooks
+        self.opt_report = []
+        self.memo = None
+        self.affine = None
+        self.tiers = None
+        self.unsaved = frozenset()              # paths of blocks not snapshot, from a profile
+        self.restart = None                     # state, position and glyphs run to start again from, if so
+        self.telemetry = None                   # Telemetry the run publishes to, by default the interpreter's
+
+
+class Execution:
+    """A program in progress: its state and the stack of blocks being executed
+
+    The innermost block is last in frames. A finished execution has no frames.
+    Executions returned by Interpreter.start can be advanced a few glyphs at a
+    time; between calls, state and position can be inspected freely.
+    """
+
+    def __init__(self, tree, state, digest):
+        self.tree = tree
+        self.state = state
+        self.digest = digest
+        self.frames = [Frame(tree, (), snapshot(state, tree))]
+        self.glyphs_run = 0
+        self.seconds = 0.0          # wall time spent running, counted against Limits.max_seconds
+        self.interpreter = None
+        self.context = None         # RunContext, set by the interpreter preparing the execution
+        self.cancelled = False
+
+
+    @property
+    def done(self):
+        "Whether the program has finished"
+        return not self.frames
+
+
+    @property
+    def current_glyph(self):
+        "The id of the next glyph to run, or None if finished"
+        for frame in reversed(self.frames):
+            if frame.pos < len(frame.block):
+                g = frame.block[frame.pos]
+                return g["id"] if isinstance(g, dict) else g.first
+        return None
+
+
+    def step(self, glyphs=1):
+        "Run at least the given number of glyphs, or until finished, returning the number run"
+        if self.cancelled:
+            return 0
+        return self.interpreter.advance(self, glyphs)
+
+
+    def steps(self, by="glyph"):
+        "Generator that runs the program, yielding after each glyph or each loop iteration"
+        if by not in ("glyph", "iteration"):
+            raise ValueError(f"Can only step by glyph or iteration, not {by}")
+        while not self.done and not self.cancelled:
+            if by == "glyph":
+                self.interpreter.advance(self, 1)
+            else:
+                self.interpreter.advance(self, until_repeat=True)
+            yield self
+
+
+    async def run(self, slice_ms=10):
+        """Run to completion, yielding to the event loop every slice_ms milliseconds
+
+        Cancelling the awaiting task stops the execution between glyphs.
+        Returns the final state.
+        """
+        try:
+            while not self.done and not self.cancelled:
+                deadline = time.perf_counter() + slice_ms / 1000
+                self.step(SLICE_GLYPHS)
+                while not self.done and not self.cancelled and time.perf_counter() < deadline:
+                    self.step(SLICE_GLYPHS)
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        return self.state
+
+
+    def cancel(self):
+        "Stop the execution; its state and position stay as they were after the last glyph"
+        self.cancelled = True
+
+
+    def to_bytes(self):
+        "Serialize the execution's position and state"
+        payload = {
+            "state": self.state,
+            "glyphs_run": self.glyphs_run,
+            "frames": [(f.path, f.pos, f.iteration, f.snapshot) for f in self.frames],
+        }
+        body = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        return _HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.digest) + body
+
+
+    @classmethod
+    def from_bytes(cls, data, tree, digest):
+        "Restore an execution of the program with the given tree and digest"
+        if len(data) < _HEADER.size:
+            raise CheckpointError("File is too short to be a checkpoint")
+        magic, version, saved_digest = _HEADER.unpack_from(data, 0)
+        if magic != CHECKPOINT_MAGIC:
+            raise CheckpointError("Not a Rivulet checkpoint")
+        if version != CHECKPOINT_VERSION:
+            raise CheckpointError(f"Unsupported checkpoint version {version}")
+        if saved_digest != digest:
+            raise CheckpointError("Checkpoint was written by a different program")
+
+        payload = _CheckpointUnpickler(io.BytesIO(zlib.decompress(data[_HEADER.size:]))).load()
+
+        execution = cls(tree, payload["state"], digest)
+        execution.glyphs_run = payload["glyphs_run"]
+        execution.frames = []
+        for path, pos, iteration, snap in payload["frames"]:
+            block = tree
+            for idx in path:
+                block = block[idx]
+            execution.frames.append(Frame(block, path, snap, pos, iteration))
+        return execution
+
+
+    def save(self, path):
+        "Write a checkpoint atomically: readers see the old one or the new one, never part of either"
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(self.to_bytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+
+    @classmethod
+    def load(cls, path, tree, digest):
+        "Read a checkpoint written by save"
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read(), tree, digest)
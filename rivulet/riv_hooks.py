@@ -0,0 +1,59 @@
+"Callbacks embedders register to observe a running Rivulet program"
+
+EVENTS = ("glyph", "rollback", "iteration", "write")
+
+
+class Hooks:
+    """The callbacks registered for each event, called in the order added
+
+    - glyph(glyph_id, iteration, action): a glyph has run; action is the
+      Interpreter.Action it ended with
+    - rollback(glyph_id): the glyph's block has been rolled back and exited
+    - iteration(glyph_id, iteration): the glyph has repeated its while
+      block, which starts the given iteration
+    - write(glyph_id, op, line, index, value): the glyph changed a list,
+      one of the riv_trace write operations (SET, INSERT, APPEND, POP,
+      REPLACE) with the same arguments as in a trace; a REPLACE's value is
+      a copy of the list's Cells, sharing any pages kept out of memory
+
+    Events nobody registered for aren't collected at all.
+    """
+
+    def __init__(self):
+        self.glyph = []
+        self.rollback = []
+        self.iteration = []
+        self.write = []
+
+
+    def add(self, event, callback):
+        "Register callback for an event, returning it"
+        if event not in EVENTS:
+            raise ValueError(f"No hook event {event}, only {', '.join(EVENTS)}")
+        getattr(self, event).append(callback)
+        return callback
+
+
+    def copy(self):
+        "Hooks calling the same callbacks, to add more to without changing these"
+        ret = Hooks()
+        for event in EVENTS:
+            getattr(ret, event).extend(getattr(self, event))
+        return ret
+
+
+    def remove(self, callback):
+        "Unregister callback from every event it was registered for"
+        for event in EVENTS:
+            getattr(self, event)[:] = [c for c in getattr(self, event) if c is not callback]
+
+
+    def clear(self):
+        for event in EVENTS:
+            getattr(self, event).clear()
+
+
+    @property
+    def active(self):
+        "Whether any callback is registered"
+        return bool(self.glyph or self.rollback or self.iteration or self.write)
@@ -1,17 +1,42 @@
 "Interpreter for the Rivulet programming language"
 from argparse import ArgumentParser
+from collections import OrderedDict
 from enum import Enum
-import json
 import math
-from rivulet.riv_exceptions import RivuletSyntaxError
+import sys
+import threading
+import time
+from rivulet.riv_affine import AffineLoops
+from rivulet.riv_analysis import analyze_blocks, guard_question
+from rivulet.riv_blocks import Block, build_blocks
+from rivulet.riv_bounds import BoundsAnalysis
+from rivulet.riv_cache import ResultCache, DEFAULT_MAX_BYTES as DEFAULT_CACHE_BYTES
+from rivulet.riv_exceptions import InfiniteLoopError, LimitExceededError, RivuletSyntaxError
+from rivulet.riv_execution import Execution, Frame, RunContext, UNSAVED, program_hash, snapshot
+from rivulet.riv_hooks import Hooks
+from rivulet.riv_limits import Limits
+from rivulet.riv_loops import LoopWatch
+from rivulet.riv_memo import BlockMemo, DEFAULT_SIZE as DEFAULT_MEMO_SIZE
+from rivulet.riv_mmap import MappedStorage
+from rivulet.riv_optimizer import PeepholeOptimizer
 from rivulet.riv_parser import Parser
+from rivulet.riv_profile import ProfileRecorder, RunProfile
 from rivulet.riv_python_transpiler import PythonTranspiler
+from rivulet.riv_state import State
 from rivulet.riv_svg_generator import SvgGenerator
+from rivulet import riv_telemetry
+from rivulet.riv_telemetry import Telemetry, PUBLISH_EVERY, GLYPHS, GLYPH_ID, DEPTH, ROLLBACKS
 from rivulet.riv_themes import Themes
+from rivulet.riv_tiers import TieredBlocks, DEFAULT_THRESHOLD as DEFAULT_TIER_THRESHOLD, ROLLED_BACK, REPEATED
+from rivulet import riv_trace
+from rivulet.riv_trace import TraceRecorder
 from rivulet import __version__
 
 VERSION = __version__
 
+# programs whose parses and blocks each Interpreter keeps to run again
+LOADED_SIZE = 16
+
 class Interpreter:
     "Interpreter for the Rivulet programming language, main entry point"
 
@@ -23,137 +48,707 @@ class Interpreter:
 
 
     def __init__(self):
-        self.outfile = None
-        self.verbose = False
-        self.debug = None
-
-
-    def interpret_file(self, progfile, verbose, theme):
+        # settings, shared by every run; set them before runs start
+        self.memoize = True
+        self.memo_size = DEFAULT_MEMO_SIZE
+        self.closed_form = True
+        self.tier = True
+        self.question_first = False
+        self.detect_loops = False
+        self.tier_threshold = DEFAULT_TIER_THRESHOLD
+        self.optimize = True
+        self.limits = Limits()
+        self.hooks = Hooks()
+        self.map_lists_above = None     # cells a list holds before it moves out of memory, if set
+        self.map_directory = None       # where those lists' files go, by default the temporary directory
+        self.profile = None             # RunProfile of an earlier run, guiding runs of the same program
+        self.telemetry = None           # Telemetry runs publish their counters to, one run at a time
+        # the optimizations of the most recent run, also kept in its RunContext
+        self.memo = None
+        self.affine = None
+        self.tiers = None
+        self.opt_report = []
+        self.results = None     # a ResultCache interpret_program answers from, if set
+        self.__loaded = OrderedDict()
+        self.__loading = threading.Lock()
+
+
+    def on_glyph(self, callback):
+        "Call callback(glyph_id, iteration, action) after each glyph runs"
+        return self.hooks.add("glyph", callback)
+
+
+    def on_rollback(self, callback):
+        "Call callback(glyph_id) after a glyph rolls back its block"
+        return self.hooks.add("rollback", callback)
+
+
+    def on_iteration(self, callback):
+        "Call callback(glyph_id, iteration) when a glyph repeats its while block"
+        return self.hooks.add("iteration", callback)
+
+
+    def on_write(self, callback):
+        "Call callback(glyph_id, op, line, index, value) for each change a glyph makes to a list"
+        return self.hooks.add("write", callback)
+
+
+    def interpret_file(self, progfile, verbose, theme, trace=None, **checkpoint):
         "Interpret a Rivulet program file"
-        self.verbose = verbose
-
         with open(progfile, "r", encoding="utf-8") as file:
             program = file.read()
 
-        return self.interpret_program(program, verbose, theme)
+        return self.interpret_program(program, verbose, theme, trace, **checkpoint)
     
 
-    def interpret_program(self, program, verbose, theme):
-        "Interpret a Rivulet program passed by text"
-        self.verbose = verbose
-
-        parser = Parser()
-
-        glyphs = parser.parse_program(program)
-
-        return self.__interpret(glyphs)
+    def interpret_program(self, program, verbose, theme, trace=None,
+                          checkpoint_file=None, checkpoint_every=0, resume=False):
+        """Interpret a Rivulet program passed by text, returning the final state
+        
+        The state maps line numbers to lists of values: it is the run's own
+        State, its lists not copied out (State.to_dict does that), or a dict
+        when read from the cache.
+        If trace is given, a binary trace of execution is written to that path.
+        If checkpoint_every is set, the execution is saved to checkpoint_file
+        every that many glyphs; resume continues from the saved checkpoint.
+        """
+        context = RunContext(verbose, None, checkpoint_file, checkpoint_every)
+
+        # a run that is watched, or saved part way, has to actually run
+        cached = self.results is not None and not (verbose or trace or checkpoint_file or self.hooks.active)
+        if cached:
+            key = self.result_key(program)
+            entry = self.results.get(key)
+            if entry is not None:
+                self.opt_report = ["result read from the cache; the program was not run"]
+                self.tiers = None
+                if self.telemetry:
+                    self.telemetry.start()
+                    self.telemetry.publish_cached(entry["state"])
+                return entry["state"]
+
+        loaded = self.load(program, watched=verbose or bool(trace))
+
+        if not trace:
+            state = self.__interpret(loaded, context, resume)
+            if cached:
+                self.results.put(key, state.to_dict())
+            return state
+
+        with open(trace, "wb") as file:
+            context.trace = TraceRecorder(file, program, loaded[1])
+            return self.__interpret(loaded, context, resume)
+
+
+    def result_key(self, program):
+        """The key of a run of program (its text) in the result cache
+
+        Only the options that can change a run's outcome are part of it;
+        memoization, closed forms and tiering give the same state.
+        """
+        limits = self.limits
+        options = {
+            "optimize": self.optimize,
+            "question_first": self.question_first,
+            "detect_loops": self.detect_loops,
+            "limits": [limits.max_glyphs, limits.max_iterations, limits.max_bits,
+                       limits.max_cells, limits.max_seconds],
+        }
+        return ResultCache.key(program, VERSION, options)
+
+
+    def load(self, program, parser=None, watched=False):
+        """Parse a program and build its blocks, or reuse those built for the same text
+
+        Returns the program's digest, list line numbers, glyphs, tree of blocks,
+        optimizer report, bounds report, block effects for memoization, the
+        lists list questions ask about, the prefix of glyphs run as the
+        program is loaded and a dict of the compiled blocks and closed forms
+        its runs have built, for later runs to reuse. Optimized tokens no longer match the source, so
+        aren't used when glyphs are being watched (verbose or traced) or their
+        writes hooked.
+
+        Nothing else returned is changed once built, and what is built is only
+        ever added, so runs in any number of threads can share it. Programs not yet loaded are parsed outside the
+        lock, so threads loading different programs don't wait for each other.
+        """
+        optimize = self.optimize and not watched and not self.hooks.write
+        key = (program, optimize)
+        with self.__loading:
+            loaded = self.__loaded.get(key)
+            if loaded is not None:
+                self.__loaded.move_to_end(key)
+                return loaded
+
+        glyphs = (parser or Parser()).parse_program(program)
+        digest = program_hash(glyphs)
+        keys = self.__list_keys(glyphs)
 
+        for idx, g in enumerate(glyphs):
+            g["id"] = idx
 
-    def __interpret(self, glyphs):
-        state = dict([(1,[])])
+        report = []
+        if optimize:
+            optimizer = PeepholeOptimizer()
+            glyphs = optimizer.optimized(glyphs)
+            report = optimizer.report
+
+        self.__assign_slots(glyphs, {key: slot for slot, key in enumerate(keys)})
+        for g in glyphs:
+            guard = guard_question(g)
+            if guard is not None:
+                g["guard"] = guard
+
+        tree = build_blocks(glyphs)
+        bounds = BoundsAnalysis(keys).analyze(tree)
+        effects = analyze_blocks(tree)
+        self.__narrow_snapshots(tree, effects, {key: slot for slot, key in enumerate(keys)})
+
+        questioned = self.__questioned_lists(glyphs) & set(keys)
+
+        prefix = None
+        if optimize:
+            prefix = self.__evaluate_prefix(tree, keys)
+            if prefix is not None:
+                report.append(f"glyphs 0 to {prefix[0] - 1} run as the program was loaded")
+
+        loaded = (digest, keys, glyphs, tree, report, bounds, effects, questioned, prefix, {})
+        with self.__loading:
+            self.__loaded[key] = loaded
+            if len(self.__loaded) > LOADED_SIZE:
+                self.__loaded.popitem(last=False)
+        return loaded
+
+
+    def __evaluate_prefix(self, tree, keys):
+        """Run the glyphs the program starts with that can't branch, every run
+        doing the same, returning how many ran and the State they leave, or None
+
+        Stops at the first sub-block or glyph with a question, and before a
+        glyph that raises, to raise when it is run, or raises a number to a
+        power, which can take any time and is checked against Limits.
+        """
+        state = State(keys)
+        ran = 0
+        for g in tree:
+            if type(g) is Block or any(t["type"] == "question_marker" or
+                                       (t.get("action") or {}).get("command") == "exponent_assignment"
+                                       for t in g["tokens"]):
+                break
+            before = state.copy()
+            try:
+                self.__interpret_glyph(g, state, 0, RunContext(limits=Limits()))
+            except Exception: # pylint: disable=broad-except
+                state = before
+                break
+            ran += 1
+        return (ran, state) if ran else None
+
+
+    def __list_keys(self, glyphs):
+        "The line numbers (primes) of every list the program can use"
+        keys = [1]
 
         prime_size = 0
         prime_size = max(glyphs, key=lambda x: x["list_size"])["list_size"]
 
-        # initialize state with lists required
         for num in range(2, prime_size ** 2):
             if all(num % i != 0 for i in range(2, int(math.sqrt(num)) + 1)):
-                state[num] = []
-                if len(state) >= prime_size:
+                keys.append(num)
+                if len(keys) >= prime_size:
                     break
-        if self.verbose:
-            self.debug = PythonTranspiler()
-
-        for idx, g in enumerate(glyphs):
-            g["id"] = idx
+        return keys
+
+
+    def check_program(self, program, verbose=False, trace=None):
+        """Statically check a Rivulet program passed by text, returning a line
+        for each cell reference that is out of range whenever it is reached"""
+        return self.load(program, watched=verbose or bool(trace))[5]
+
+
+    def start(self, program, verbose=False, parser=None):
+        """Parse a Rivulet program passed by text and return its Execution without running it
+
+        The execution is advanced with its step, steps and run methods. A
+        Parser can be passed in, though every Parser shares one lexicon.
+        """
+        loaded = self.load(program, parser, watched=verbose)
+        return self.prepare(loaded, stepped=True, context=RunContext(verbose))
+
+
+    def advance(self, execution, glyphs=None, until_repeat=False):
+        """Run an execution from start until it finishes, at least the given
+        number of glyphs have run, or (if until_repeat) a loop repeats
+
+        A block skipped by memoization or run in closed form counts all its
+        glyphs at once, so may take the count past the number asked for.
+        Returns the number of glyphs run.
+        """
+        before = execution.glyphs_run
+        stop_at = None if glyphs is None else before + glyphs
+        self.__run(execution, stop_at, until_repeat)
+        return execution.glyphs_run - before
+
+
+    def record_profile(self, program):
+        """Run a program, returning its final State and a RunProfile of the run
+
+        The run is watched through hooks of its own, which also call the
+        interpreter's, so every glyph is interpreted.
+        """
+        loaded = self.load(program)
+        hooks = self.hooks.copy()
+        recorder = ProfileRecorder(hooks, loaded)
+        execution = self.prepare(loaded, context=RunContext(hooks=hooks))
+        self.__run(execution)
+        return execution.state, recorder.finish(execution.state)
+
+
+    def __interpret(self, loaded, context, resume=False):
+        execution = self.prepare(loaded, resume, context=context)
+        self.__run(execution)
+        return execution.state
+
+
+    def prepare(self, loaded, resume=False, initial_state=None, stepped=False, context=None):
+        """Build the optimizations and Execution for a program returned by load
+
+        The lists start empty, or with the values given for them in
+        initial_state, a dict of line number to list of values. Unless the
+        execution is to be stepped through, it starts after the glyphs run
+        as the program was loaded. context is the RunContext of how the run
+        is watched, saved and limited; by default it is neither watched nor
+        saved, and has the interpreter's limits. The optimizations
+        built are kept in it, and also left on the interpreter as those of
+        its most recent run; blocks compiled and closed forms planned by
+        earlier runs of the program are reused rather than built again.
+        """
+        digest, keys, _, parse_tree, report, _, effects, questioned, prefix, built = loaded
+        context = context or RunContext()
+        limits = context.limits = context.limits or self.limits
+        context.telemetry = context.telemetry or self.telemetry
+        hooks = context.hooks = context.hooks or self.hooks
+        watched = context.verbose or context.trace or hooks.active
+        context.opt_report = report
 
-        parse_tree = self.treeify_glyphs(json.loads(json.dumps(glyphs)), 1, [])
-
-        self.__decorate_blocks(parse_tree, 0, None)
-
-        self.__interpret_block(parse_tree, state)
+        # initialize state with lists required
+        storage = None
+        if self.map_lists_above is not None:
+            storage = MappedStorage(self.map_lists_above, self.map_directory)
+        state = State(keys, storage=storage)
+        for line, values in (initial_state or {}).items():
+            if line not in state.slots:
+                raise ValueError(f"the program has no list on line {line}")
+            state[line] = values
+        # list questions read counts of non-positive cells, kept as the lists change
+        for lst in questioned:
+            state[lst].track()
+
+        if context.verbose:
+            context.debug = PythonTranspiler()
+
+        # a cached block skips its glyphs, so isn't used when they are being watched
+        if self.memoize and not watched:
+            context.memo = BlockMemo(effects, self.memo_size)
+
+        # closed-form loops run to completion in one step, so can't be checkpointed part way,
+        # nor stopped part way for taking too long or growing too large
+        if self.closed_form and not watched and not context.checkpoint_every \
+            and limits.max_seconds is None and limits.max_bits is None \
+            and limits.max_cells is None:
+            context.affine = AffineLoops(parse_tree, built.setdefault("affine", {}))
+
+        # compiled blocks run whole iterations, and exponents and repeated states in them aren't checked
+        if self.tier and not watched and not context.checkpoint_every \
+            and limits.max_bits is None and not self.detect_loops:
+            streamed = storage is not None
+            context.tiers = TieredBlocks(parse_tree, self.tier_threshold, self.question_first, streamed,
+                                         built.setdefault(("tiers", self.question_first, streamed), {}))
+
+        if resume:
+            execution = Execution.load(context.checkpoint_file, parse_tree, digest)
+        else:
+            execution = Execution(parse_tree, state, digest)
+            if context.trace:
+                context.trace.enter(parse_tree.first)
+            # the glyphs run as the program was loaded are skipped unless watched or counted
+            if prefix and not initial_state and not stepped and not watched \
+                and (limits.max_glyphs is None or prefix[0] <= limits.max_glyphs):
+                # the program's block keeps its snapshot of the empty lists, to roll back to
+                state.lists[:] = [cells.copy() for cells in prefix[1].lists]
+                for cells in state.lists:
+                    cells.storage = storage
+                for lst in questioned:
+                    state[lst].track()
+                execution.frames[0].pos = execution.glyphs_run = prefix[0]
+            # a profile is of whole runs, and runs stepped through are looked at part way
+            if self.profile is not None and not watched and not stepped and not context.checkpoint_every:
+                self.__apply_profile(execution, context)
+
+        execution.interpreter = self
+        execution.context = context
+        if context.telemetry:
+            context.telemetry.start()
+        self.opt_report, self.memo, self.affine, self.tiers = \
+            context.opt_report, context.memo, context.affine, context.tiers
+        return execution
+
+
+    def __apply_profile(self, execution, context):
+        """Use the profile of an earlier run: compile the blocks that were hot from
+        the start, start lists in the containers they ended in, and don't
+        snapshot blocks that never rolled back
+
+        Should one of those blocks roll back after all, the program is run
+        again from the start, snapshotting every block.
+        """
+        profile = self.profile
+        if profile.digest != execution.digest:
+            context.opt_report = context.opt_report + ["the profile is of another program, so wasn't used"]
+            return
+        report = []
+        tiers = context.tiers
+        if tiers:
+            for path in profile.hot(tiers.threshold):
+                if path in tiers.blocks and path not in tiers.compiled:
+                    tiers.compile(path, f"from the profile, where it repeated {profile.iterations[path]} times")
+
+        state = execution.state
+        for line, (_, kind) in sorted(profile.lists.items()):
+            if line in state.slots and state[line].store_as(kind):
+                report.append(f"list {line} started as a {kind}, as the profile ended it")
+
+        # compiled blocks take their own snapshots
+        unsaved = frozenset(block.path for block in profile.never_rolled_back(execution.tree)
+                            if block.rolls_back and not (tiers and block.path in tiers.blocks))
+        if unsaved:
+            context.unsaved = unsaved
+            context.restart = (state.copy(), execution.frames[0].pos, execution.glyphs_run)
+            report.append(f"snapshots skipped in {len(unsaved)} blocks the profile never saw roll back")
+        context.opt_report = context.opt_report + report
+
+
+    def __run_again(self, execution, glyph_id):
+        "Start an execution again from where it was prepared, snapshotting every block"
+        context = execution.context
+        state, pos, glyphs_run = context.restart
+        execution.state.restore(state)
+        execution.frames[:] = [Frame(execution.tree, (), snapshot(execution.state, execution.tree), pos)]
+        execution.glyphs_run = glyphs_run
+        context.unsaved = frozenset()
+        context.restart = None
+        self.opt_report = context.opt_report = context.opt_report + [
+            f"glyph {glyph_id} rolled back a block the profile never saw roll back; run again from the start"]
+
+
+    @staticmethod
+    def __questioned_lists(glyphs):
+        "The lists list questions ask about"
+        return {t["ref_list"] for g in glyphs for t in g["tokens"]
+                if t["type"] == "question_marker" and t["applies_to"] == "list"}
+
+
+    @staticmethod
+    def __narrow_snapshots(block, effects, slots):
+        "Snapshot only the lists each block can write, and not at all those that can't roll back"
+        block_effects = effects[block.path]
+        block.rolls_back = block_effects.rolls_back
+        block.saved = tuple(slots[lst] for lst in block_effects.lists_written if lst in slots)
+        for g in block:
+            if type(g) is Block:
+                Interpreter.__narrow_snapshots(g, effects, slots)
+
+
+    @staticmethod
+    def __assign_slots(glyphs, slots):
+        "Translate the line numbers tokens refer to into positions in State.lists"
+        for g in glyphs:
+            for token in g["tokens"]:
+                # a list the program has no line for is left to fail when it is used
+                if token.get("list") in slots:
+                    token["slot"] = slots[token["list"]]
+                if token.get("ref_cell") and token["ref_cell"][0] in slots:
+                    token["ref_slot"] = slots[token["ref_cell"][0]]
+                if token.get("ref_list") in slots:
+                    token["ref_list_slot"] = slots[token["ref_list"]]
 
 
     def treeify_glyphs(self, glyphs, curr_level, tree):
-        "Reorganize a flat list of glyphs into a tree by level"
-        if glyphs[0]["level"] == curr_level:
-            tree.append(glyphs.pop(0))
-        elif glyphs[0]["level"] > curr_level:
-            level = []
-            tree.append(level)
-            self.treeify_glyphs(glyphs, curr_level + 1, level)
-        else:
-            # go back up one level
-            return tree
-
-        if len(glyphs) > 0:
-            self.treeify_glyphs(glyphs, curr_level, tree)
+        """Reorganize a flat list of glyphs into a tree of nested lists by level
 
+        Kept for callers wanting plain lists; the interpreter runs the Blocks
+        from build_blocks.
+        """
+        tree.extend(build_blocks(glyphs, curr_level).to_lists())
         return tree
 
 
-    def __decorate_blocks(self, block, level, following = None):
-        "for each glyph in a block, link to glyphs that start the block or first fall after it"
-        first = None
-        for idx, g in enumerate(block):
+    def __run(self, execution, stop_at=None, until_repeat=False):
+        """Run glyphs until the execution finishes, or glyphs_run reaches stop_at
+
+        Blocks are kept on an explicit stack, rather than the Python stack, so
+        the execution's position can be saved and restored between glyphs.
+        """
+        started = time.perf_counter()
+        telemetry = execution.context.telemetry
+        try:
+            self.__run_frames(execution, stop_at, until_repeat)
+        except BaseException:
+            if telemetry:
+                telemetry.publish(execution, riv_telemetry.FAILED)
+            raise
+        finally:
+            execution.seconds += time.perf_counter() - started
+        if telemetry:
+            telemetry.publish(execution, riv_telemetry.FINISHED if execution.done else riv_telemetry.RUNNING)
+
+
+    def __run_frames(self, execution, stop_at, until_repeat):
+        frames = execution.frames
+        state = execution.state
+        context = execution.context
+        memo = context.memo
+        affine = context.affine
+
+        # limits other than iterations are only checked when glyphs_run reaches check_at
+        limits = context.limits if context.limits.active else None
+        check_at = limits.next_check(execution.glyphs_run) if limits else math.inf
+        max_iterations = limits.max_iterations if limits else None
+        deadline = None
+        if limits and limits.max_seconds is not None:
+            deadline = time.perf_counter() + limits.max_seconds - execution.seconds
+
+        tiers = context.tiers if context.tiers and context.tiers.blocks and not until_repeat else None
+
+        # with nothing watching, each event costs one test of a local None
+        trace = context.trace
+        hooks = context.hooks
+        on_glyph = hooks.glyph or None
+        on_rollback = hooks.rollback or None
+        on_iteration = hooks.iteration or None
+        context.collect_writes = bool(trace or hooks.write)
+
+        detect_loops = self.detect_loops
+        unsaved = context.unsaved
+
+        # published counters are written after each glyph, and the rest every PUBLISH_EVERY glyphs
+        telemetry = context.telemetry
+        counters = telemetry.counters if telemetry else None
+        publish_at = execution.glyphs_run + PUBLISH_EVERY if telemetry else math.inf
+
+        # asking questions before their glyphs run skips strands, so isn't done while they are watched
+        question_first = self.question_first and not context.verbose and not trace and not hooks.active
+
+        while frames:
+            if stop_at is not None and execution.glyphs_run >= stop_at:
+                return
+
+            frame = frames[-1]
+
+            if frame.pos == 0 and frame.closed_form and affine and frame.path in affine.blocks:
+                iterations = affine.run(frame.path, state, self.__affine_limit(execution, frame))
+                # a loop found to run past a limit is interpreted up to it, without trying again
+                frame.closed_form = not affine.exceeded
+                if iterations is not None:
+                    # the loop's final iteration has been rolled back, exiting the block
+                    execution.glyphs_run += iterations * len(frame.block)
+                    frames.pop()
+                    if counters is not None:
+                        counters[ROLLBACKS] += 1
+                    if frame.memo_key is not None:
+                        memo.store(frame.path, frame.memo_key, state,
+                                        execution.glyphs_run - frame.entry_glyphs, True)
+                    continue
 
-            # find first glyph for block, even if it is in a sub-block
-            if idx == 0:
-                first = g
-                while isinstance(first, list):
-                    first = first[0]
+            if frame.pos == 0 and tiers and frame.path in tiers.compiled:
+                glyph_budget = min(math.inf if stop_at is None else stop_at, check_at, publish_at) \
+                    - execution.glyphs_run
+                repeat_budget = math.inf if max_iterations is None else max_iterations - 1 - frame.iteration
+                # the interpreter runs the iterations that might reach a limit or stop_at
+                if glyph_budget > len(frame.block) and repeat_budget > 0:
+                    outcome, glyphs, repeats, snap = tiers.run(frame.path, state, frame.snapshot,
+                                                               glyph_budget, repeat_budget)
+                    execution.glyphs_run += glyphs
+                    frame.iteration += repeats
+                    if outcome == REPEATED:
+                        frame.snapshot = snap
+                    else:
+                        frames.pop()
+                        if counters is not None and outcome == ROLLED_BACK:
+                            counters[ROLLBACKS] += 1
+                        if frame.memo_key is not None:
+                            memo.store(frame.path, frame.memo_key, state,
+                                            execution.glyphs_run - frame.entry_glyphs, outcome == ROLLED_BACK)
+                    continue
 
-            if not isinstance(g, list):
-                g["first"] = first["id"]
-                g["level"] = level
-                if following:
-                    g["following"] = following["id"]
+            if frame.pos == len(frame.block):
+                frames.pop()
+                if frame.memo_key is not None:
+                    memo.store(frame.path, frame.memo_key, state,
+                                    execution.glyphs_run - frame.entry_glyphs, False)
+                if trace:
+                    trace.exit()
+                continue
+
+            g = frame.block[frame.pos]
+
+            if type(g) is Block:
+                path = g.path
+                frame.pos += 1
+
+                memo_key = None
+                if memo:
+                    glyphs, memo_key = memo.lookup(path, state)
+                    if glyphs is not None:
+                        execution.glyphs_run += glyphs
+                        if execution.glyphs_run >= check_at:
+                            limits.check(execution.glyphs_run, state, deadline, g.first)
+                            check_at = limits.next_check(execution.glyphs_run)
+                        continue
+
+                # a block whose first glyph will roll it back needs nothing to roll back to
+                if question_first and self.__fails_first(g[0], state.lists):
+                    sub = Frame(g, path, None)
+                elif unsaved and path in unsaved:
+                    sub = Frame(g, path, UNSAVED)
                 else:
-                    g["following"] = None
+                    sub = Frame(g, path, snapshot(state, g))
+                sub.memo_key = memo_key
+                sub.entry_glyphs = execution.glyphs_run
+                frames.append(sub)
+                if trace:
+                    trace.enter(g.first)
+                continue
+
+            if question_first and self.__fails_first(g, state.lists):
+                action = self.Action.rollback
             else:
-                # set following to the next glyph in the block or its first descendent
-                # if there are no more, allow it to remain the existing following
-                if idx < len(block) - 1:
-                    f = block[idx + 1]
-                    while isinstance(f, list):
-                        f = f[0]
-                    if not isinstance(f, list):
-                        following = f
-                self.__decorate_blocks(g, level + 1, following)
+                try:
+                    action = self.__interpret_glyph(g, state, frame.iteration, context)
+                except LimitExceededError as e:
+                    e.glyph = g["id"]
+                    raise
+            execution.glyphs_run += 1
+
+            if execution.glyphs_run >= check_at:
+                limits.check(execution.glyphs_run, state, deadline, g["id"])
+                check_at = limits.next_check(execution.glyphs_run)
+
+            if counters is not None:
+                counters[GLYPHS] = execution.glyphs_run
+                counters[GLYPH_ID] = g["id"]
+                counters[DEPTH] = len(frames)
+                if execution.glyphs_run >= publish_at:
+                    telemetry.publish(execution)
+                    publish_at = execution.glyphs_run + PUBLISH_EVERY
+
+            if on_glyph:
+                for callback in on_glyph:
+                    callback(g["id"], frame.iteration, action)
+
+            if action == self.Action.rollback:
+                if frame.snapshot is UNSAVED:
+                    self.__run_again(execution, g["id"])
+                    unsaved = context.unsaved
+                    check_at = limits.next_check(execution.glyphs_run) if limits else math.inf
+                    publish_at = execution.glyphs_run + PUBLISH_EVERY if telemetry else math.inf
+                    continue
+                # restore in place: the execution holds the same state
+                if frame.snapshot is not None:
+                    state.restore(frame.snapshot)
+                frames.pop() # a rollback also exits the block
+                if counters is not None:
+                    counters[ROLLBACKS] += 1
+                if frame.memo_key is not None:
+                    memo.store(frame.path, frame.memo_key, state,
+                                    execution.glyphs_run - frame.entry_glyphs, True)
+                if trace:
+                    trace.rollback(g["id"])
+                if on_rollback:
+                    for callback in on_rollback:
+                        callback(g["id"])
+            elif action == self.Action.repeat:
+                frame.pos = 0
+                frame.iteration += 1
+                if max_iterations is not None and frame.iteration >= max_iterations:
+                    raise LimitExceededError("max_iterations", max_iterations, g["id"])
+                if detect_loops:
+                    if frame.loop_watch is None:
+                        frame.loop_watch = LoopWatch()
+                    period = frame.loop_watch.repeats(frame.iteration, state)
+                    if period is not None:
+                        raise InfiniteLoopError(g["id"], frame.iteration, period)
+                if question_first and self.__fails_first(frame.block[0], state.lists):
+                    frame.snapshot = None
+                elif unsaved and frame.path in unsaved:
+                    frame.snapshot = UNSAVED
+                else:
+                    frame.snapshot = snapshot(state, frame.block)
+                if tiers and frame.path in tiers.blocks:
+                    tiers.count(frame.path)
+                if trace:
+                    trace.repeat(frame.iteration)
+                if on_iteration:
+                    for callback in on_iteration:
+                        callback(g["id"], frame.iteration)
+                if until_repeat:
+                    return
+            else:
+                frame.pos += 1
 
+            if context.checkpoint_every and execution.glyphs_run % context.checkpoint_every == 0:
+                execution.save(context.checkpoint_file)
 
-    def __interpret_block(self, parse_tree, state):
 
-        rollback_state = json.loads(json.dumps(state))
+    def __fails_first(self, g, lists):
+        "Whether a glyph is known to roll back before its strands run: its guard question fails"
+        return type(g) is not Block and "guard" in g and \
+            self.__resolve_question(g["guard"], lists) is self.Action.rollback
 
-        for g in parse_tree:
-            if isinstance(g, list):
-                self.__interpret_block(g, state)
-            else:
-                action = self.__interpret_glyph(g, state)
-                if action == self.Action.rollback:
-                    state = json.loads(json.dumps(rollback_state))
-                    return # a rollback also exits the block
-                if action == self.Action.cont:
-                    continue
-                if action == self.Action.repeat:
-                    self.__interpret_block(parse_tree, state)
 
+    def __affine_limit(self, execution, frame):
+        "The most iterations a closed-form loop may run before a limit is reached"
+        limits = execution.context.limits
+        limit = None
+        if limits.max_iterations is not None:
+            # the loop is in its iteration frame.iteration, and the last it may reach is max_iterations - 1
+            limit = limits.max_iterations - frame.iteration
+        if limits.max_glyphs is not None:
+            remaining = (limits.max_glyphs - execution.glyphs_run) // len(frame.block)
+            limit = remaining if limit is None else min(limit, remaining)
+        return limit
 
-    def __interpret_glyph(self, glyph, state) -> Action:
+
+    def __interpret_glyph(self, glyph, state, iteration, context) -> Action:
 
         retval = self.Action.cont
 
+        # writes are only collected when traced or hooked
+        writes = [] if context.collect_writes else None
+
+        # tokens hold the positions of their lists in state.lists, set by __assign_slots
+        lists = state.lists
+
         for token in glyph["tokens"]:
             if token["type"] == "question_marker":
-                retval = self.__resolve_question(token, state)
+                retval = self.__resolve_question(token, lists)
+            elif token["type"] == "touch":
+                # only creates cells, as a strand that writes nothing would
+                cells = lists[token["slot"]]
+                if len(cells) < token["assign_to_cell"]:
+                    raise IndexError("list index out of range")
+                if len(cells) < token["length"]:
+                    cells.extend([0] * (token["length"] - len(cells)))
             else: # is a value or a ref marker
+                cells = lists[token["slot"]]
 
                 # if the cell is not in the list, initialize it to zero
-                if 'assign_to_cell' in token and len(state[token['list']]) == token['assign_to_cell'] and \
+                if 'assign_to_cell' in token and len(cells) == token['assign_to_cell'] and \
                     (not token["action"] or not "command" in token["action"] or not token["action"]["command"] in ["pop_and_append","append"]):
-                    state[token['list']].append(0)
-                # elif 'assign_to_cell' in token and len(state[token['list']]) < token['assign_to_cell']:
+                    cells.append(0)
+                    if writes is not None:
+                        writes.append((riv_trace.APPEND, token['list'], 0, 0))
+                # elif 'assign_to_cell' in token and len(cells) < token['assign_to_cell']:
                 #     # shouldn't be possible
                 #     pass
 
@@ -163,42 +758,72 @@ class Interpreter:
 
                 # find source item
                 if list2list:
-                    source = state[token["ref_list"]]
+                    source = lists[token["ref_list_slot"]]
                 if token["subtype"] == "value":
                     source = token["value"]
                 elif token["subtype"] == "ref":
-                    if token["ref_cell"][0] >= len(token):
-                        raise RivuletSyntaxError("List reference out of bounds")
-                    if token["ref_cell"][1] >= len(state[token["ref_cell"][0]]):
-                        raise RivuletSyntaxError("Cell reference out of bounds")
-                    source = state[token["ref_cell"][0]][token["ref_cell"][1]]
+                    # references BoundsAnalysis proved in range aren't checked
+                    if not token.get("in_bounds"):
+                        if "ref_slot" not in token:
+                            raise RivuletSyntaxError("List reference out of bounds")
+                        if token["ref_cell"][1] >= len(lists[token["ref_slot"]]):
+                            raise RivuletSyntaxError("Cell reference out of bounds")
+                    source = lists[token["ref_slot"]][token["ref_cell"][1]]
 
                 # find item to apply to
                 if list2list:
-                    for i in range(len(state[token["list"]])):
-                        state[token["list"]][i] = self.__resolve_cmd(token, state[token["list"]][i], source[i])
+                    # a generator, so a list out of memory is streamed into its new cells
+                    cells.replace(self.__resolve_cmd(token, cells[i], source[i], context.limits) for i in range(len(cells)))
+                    if writes is not None:
+                        writes.append((riv_trace.REPLACE, token["list"], len(cells), cells.copy()))
                 elif token["action"] is None or "command" not in token["action"]:
                     # defaults to add_assign
-                    state[token["list"]][token["assign_to_cell"]] += source
+                    cells[token["assign_to_cell"]] += source
+                    if writes is not None:
+                        writes.append((riv_trace.SET, token["list"], token["assign_to_cell"], cells[token["assign_to_cell"]]))
                 elif token["action"]["command"] == "insert":
-                    state[token["list"]].insert(token["assign_to_cell"], source)
+                    cells.insert(token["assign_to_cell"], source)
+                    if writes is not None:
+                        writes.append((riv_trace.INSERT, token["list"], token["assign_to_cell"], source))
                 elif token["action"]["command"] == "append":
-                    state[token["list"]].append(source)
+                    cells.append(source)
+                    if writes is not None:
+                        writes.append((riv_trace.APPEND, token["list"], 0, source))
                 elif token["action"]["command"] == "pop":
-                    state[token["list"]][token["assign_to_cell"]] += source
+                    cells[token["assign_to_cell"]] += source
+                    if writes is not None:
+                        writes.append((riv_trace.SET, token["list"], token["assign_to_cell"], cells[token["assign_to_cell"]]))
                     if token["subtype"] == "ref":
-                        state[token["ref_cell"][0]].pop(token["ref_cell"][1])
+                        lists[token["ref_slot"]].pop(token["ref_cell"][1])
+                        if writes is not None:
+                            writes.append((riv_trace.POP, token["ref_cell"][0], token["ref_cell"][1], None))
                 elif token["action"]["command"] == "pop_and_append":
-                    state[token["list"]].append(state[token["ref_cell"][0]].pop(token["ref_cell"][1]))
+                    cells.append(lists[token["ref_slot"]].pop(token["ref_cell"][1]))
+                    if writes is not None:
+                        writes.append((riv_trace.POP, token["ref_cell"][0], token["ref_cell"][1], None))
+                        writes.append((riv_trace.APPEND, token["list"], 0, cells[-1]))
                 elif token["action"]["subtype"] == "list":
-                    for i in range(len(state[token["list"]])):
-                        state[token["list"]][i] = self.__resolve_cmd(token, state[token["list"]][i], source)
+                    cells.replace(self.__resolve_cmd(token, cell, source, context.limits) for cell in cells)
+                    if writes is not None:
+                        writes.append((riv_trace.REPLACE, token["list"], len(cells), cells.copy()))
                 else:
-                    state[token["list"]][token["assign_to_cell"]] = self.__resolve_cmd(token, state[token["list"]][token["assign_to_cell"]], source)
-
-        if self.verbose:
-            print(self.debug.glyph_drawn(glyph["glyph"]))
-            print(self.debug.glyph_pseudo(glyph))
+                    cells[token["assign_to_cell"]] = self.__resolve_cmd(token, cells[token["assign_to_cell"]], source, context.limits)
+                    if writes is not None:
+                        writes.append((riv_trace.SET, token["list"], token["assign_to_cell"], cells[token["assign_to_cell"]]))
+
+        if writes is not None:
+            if context.trace:
+                context.trace.glyph(glyph["id"], iteration, writes)
+            for callback in context.hooks.write:
+                for write in writes:
+                    callback(glyph["id"], *write)
+
+        if context.verbose:
+            # the glyph's source and pseudo-code don't change between runs of it
+            if glyph["id"] not in context.described:
+                context.described[glyph["id"]] = context.debug.glyph_drawn(glyph["glyph"]) + "\n" + \
+                    context.debug.glyph_pseudo(glyph)
+            print(context.described[glyph["id"]])
             print(state)
             print("\n")
 
@@ -212,8 +837,7 @@ class Interpreter:
         parser = Parser()
         glyphs = parser.parse_program(program)
 
-        self.debug = PythonTranspiler()        
-        print(self.debug.print_program(glyphs, False))
+        print(PythonTranspiler().print_program(glyphs, False))
 
 
     def draw_svg(self, progfile, theme):
@@ -226,7 +850,7 @@ class Interpreter:
         svg.generate(glyphs)
 
 
-    def __resolve_cmd(self, token, initial_value, assign_value):
+    def __resolve_cmd(self, token, initial_value, assign_value, limits):
         if not token["action"] or not "command" in token["action"]:
             raise RivuletSyntaxError("No command found in token")
 
@@ -244,20 +868,22 @@ class Interpreter:
             case "mod_assignment":
                 return initial_value % assign_value
             case "exponent_assignment":
+                if limits.max_bits is not None:
+                    limits.check_power(initial_value, assign_value)
                 return initial_value ** assign_value
             case "root_assignment":
                 return initial_value ** (1 / assign_value)
 
 
-    def __resolve_question(self, token, state) -> Action:
+    def __resolve_question(self, token, lists) -> Action:
         retval = self.Action.cont
 
         succeeds = False
 
         if token["applies_to"] == "cell":
-            succeeds = state[token["ref_cell"][0]][token["ref_cell"][1]] > 0
+            succeeds = lists[token["ref_slot"]][token["ref_cell"][1]] > 0
         elif token["applies_to"] == "list":
-            succeeds = all(i > 0 for i in state[token["ref_list"]])
+            succeeds = lists[token["ref_list_slot"]].all_positive()
         else:
             raise RivuletSyntaxError("Could not determine what question marker applies to")
 
@@ -272,6 +898,16 @@ class Interpreter:
 
 def main():
 
+    if sys.argv[1:2] == ["trace"]:
+        riv_trace.main(sys.argv[2:])
+        exit(0)
+    if sys.argv[1:2] == ["top"]:
+        exit(riv_telemetry.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["batch"]:
+        # riv_batch runs programs with Interpreter, so is imported once this module is loaded
+        from rivulet import riv_batch
+        exit(riv_batch.main(sys.argv[2:]))
+
     arg_parser = ArgumentParser(description=f'Rivulet Interpreter {VERSION}',
                             epilog='More at https://danieltemkin.com/Esolangs/Rivulet')
 
@@ -284,9 +920,82 @@ def main():
     arg_parser.add_argument('--svg', dest='svg', action='store_true', default=False,
                         help='generate svg of program, then exit')
     arg_parser.add_argument('--theme', dest='color_set', default="default", help="color scheme for svg")
+    arg_parser.add_argument('--trace', dest='trace', default=None,
+                        help='write a binary execution trace to this file (read it with `riv trace show`)')
+    arg_parser.add_argument('--checkpoint-every', dest='checkpoint_every', type=int, default=0,
+                        help='save a checkpoint after every N glyphs executed')
+    arg_parser.add_argument('--checkpoint-file', dest='checkpoint_file', default=None,
+                        help='file to save checkpoints to and resume from')
+    arg_parser.add_argument('--no-opt', dest='optimize', action='store_false', default=True,
+                        help='run glyphs exactly as parsed, without optimization')
+    arg_parser.add_argument('--opt-report', dest='opt_report', action='store_true', default=False,
+                        help='print what the optimizer changed, and which blocks were compiled')
+    arg_parser.add_argument('--max-glyphs', dest='max_glyphs', type=int, default=None,
+                        help='stop with an error after this many glyphs')
+    arg_parser.add_argument('--max-iterations', dest='max_iterations', type=int, default=None,
+                        help='stop with an error if a while block repeats this many times')
+    arg_parser.add_argument('--max-bits', dest='max_bits', type=int, default=None,
+                        help='stop with an error if a cell holds an int of more bits than this')
+    arg_parser.add_argument('--max-cells', dest='max_cells', type=int, default=None,
+                        help='stop with an error if the lists hold more cells than this in total')
+    arg_parser.add_argument('--max-seconds', dest='max_seconds', type=float, default=None,
+                        help='stop with an error after running this long')
+    arg_parser.add_argument('--question-first', dest='question_first', action='store_true', default=False,
+                        help='ask a question before its glyph runs when the glyph can\'t change its answer, '
+                             'skipping glyphs that roll back (and any errors they would raise)')
+    arg_parser.add_argument('--detect-loops', dest='detect_loops', action='store_true', default=False,
+                        help='stop with an error if a while block returns to a state it was in before')
+    arg_parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                        help='continue from the checkpoint in --checkpoint-file')
+    arg_parser.add_argument('--cache', dest='cache', action='store_true', default=False,
+                        help='answer from the final state of an earlier run of the same program and options, '
+                             'and save the final state of new runs')
+    arg_parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                        help='directory of the result cache (implies --cache; default ~/.cache/rivulet/results)')
+    arg_parser.add_argument('--cache-size', dest='cache_size', type=int, default=DEFAULT_CACHE_BYTES >> 20,
+                        help=f'megabytes of results to keep, evicting the least recently used '
+                             f'(default {DEFAULT_CACHE_BYTES >> 20})')
+
+    arg_parser.add_argument('--map-lists-above', dest='map_lists_above', type=int, default=None,
+                        help='keep a list of ints or floats holding more than this many cells in memory-mapped '
+                             'files rather than in memory')
+    arg_parser.add_argument('--map-dir', dest='map_dir', default=None,
+                        help='directory of the files of --map-lists-above (default the temporary directory)')
+
+    arg_parser.add_argument('--record-profile', dest='record_profile', default=None,
+                        help='run the program glyph by glyph, saving a profile of the run to this file')
+    arg_parser.add_argument('--use-profile', dest='use_profile', default=None,
+                        help='compile, store and snapshot as a profile saved by --record-profile found best, '
+                             'running again from the start if the program does what the profile never saw')
+
+    arg_parser.add_argument('--telemetry', dest='telemetry', action='store_true', default=False,
+                        help='publish counters of the run in shared memory, for `riv top <pid>` to show')
+
     args = arg_parser.parse_args()
 
+    if (args.checkpoint_every or args.resume) and not args.checkpoint_file:
+        arg_parser.error("--checkpoint-every and --resume require --checkpoint-file")
+    if args.resume and args.trace:
+        arg_parser.error("a trace must start from the beginning of the program; it cannot be combined with --resume")
+    if args.record_profile and (args.trace or args.checkpoint_file or args.use_profile):
+        arg_parser.error("--record-profile runs the program itself; "
+                         "it cannot be combined with --trace, --checkpoint-file or --use-profile")
+
     intr = Interpreter()
+    intr.optimize = intr.memoize = intr.closed_form = intr.tier = args.optimize
+    intr.question_first = args.question_first
+    intr.detect_loops = args.detect_loops
+    intr.map_lists_above = args.map_lists_above
+    intr.map_directory = args.map_dir
+    if args.use_profile:
+        intr.profile = RunProfile.load(args.use_profile)
+    if args.telemetry:
+        intr.telemetry = Telemetry()
+    intr.limits = Limits(args.max_glyphs, args.max_iterations, args.max_bits,
+                         args.max_cells, args.max_seconds)
+
+    if args.cache or args.cache_dir:
+        intr.results = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024)
 
     if (args.print):
         intr.print_and_exit(args.progfile)
@@ -295,7 +1004,31 @@ def main():
         intr.draw_svg(args.progfile, args.color_set)
         exit(0)
 
-    intr.interpret_file(args.progfile, args.verbose, args.color_set)
+    with open(args.progfile, "r", encoding="utf-8") as file:
+        program = file.read()
+    # a cached result was reached without problems, so isn't checked again
+    watched = args.verbose or args.trace or args.checkpoint_file
+    if intr.results is None or watched or intr.results.get(intr.result_key(program)) is None:
+        for warning in intr.check_program(program, args.verbose, args.trace):
+            print(f"WARNING: {warning}", file=sys.stderr)
+
+    try:
+        if args.record_profile:
+            _, profile = intr.record_profile(program)
+            profile.save(args.record_profile)
+        else:
+            intr.interpret_file(args.progfile, args.verbose, args.color_set, args.trace,
+                                checkpoint_file=args.checkpoint_file,
+                                checkpoint_every=args.checkpoint_every,
+                                resume=args.resume)
+    finally:
+        if intr.telemetry:
+            intr.telemetry.close()
+
+    if args.opt_report:
+        print("\n".join(intr.opt_report) or "optimizer made no changes")
+        if intr.tiers:
+            print("\n".join(intr.tiers.report) or "no blocks were hot enough to compile")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,63 @@
+"Limits on the resources a Rivulet program can use"
+import math
+import time
+from rivulet.riv_exceptions import LimitExceededError
+
+# glyphs run between checks of the clock, list sizes and cell sizes
+CHECK_EVERY = 1024
+
+
+class Limits:
+    """The most a program may run and store; None for no limit
+
+    Glyph counts and while iterations are checked exactly. Wall time, total
+    cells and bit lengths are checked every CHECK_EVERY glyphs, so a program
+    can go a little over them before being stopped; exponents are checked
+    before they are computed, as one can take a very long time.
+    """
+
+    def __init__(self, max_glyphs=None, max_iterations=None, max_bits=None,
+                 max_cells=None, max_seconds=None):
+        self.max_glyphs = max_glyphs            # glyphs run, in total
+        self.max_iterations = max_iterations    # iterations of any one while block
+        self.max_bits = max_bits                # bit length of any int cell
+        self.max_cells = max_cells              # cells across all lists
+        self.max_seconds = max_seconds          # wall time spent running
+
+
+    @property
+    def active(self):
+        "Whether any limit is set"
+        return any(v is not None for v in (self.max_glyphs, self.max_iterations, self.max_bits,
+                                           self.max_cells, self.max_seconds))
+
+
+    def next_check(self, glyphs_run):
+        "The glyph count at which check should next be called"
+        if self.max_bits is None and self.max_cells is None and self.max_seconds is None:
+            return math.inf if self.max_glyphs is None else self.max_glyphs + 1
+        check = glyphs_run + CHECK_EVERY
+        return check if self.max_glyphs is None else min(check, self.max_glyphs + 1)
+
+
+    def check(self, glyphs_run, state, deadline, glyph):
+        "Raise LimitExceededError if the execution is over a limit"
+        if self.max_glyphs is not None and glyphs_run > self.max_glyphs:
+            raise LimitExceededError("max_glyphs", self.max_glyphs, glyph)
+        if deadline is not None and time.perf_counter() > deadline:
+            raise LimitExceededError("max_seconds", self.max_seconds, glyph)
+        if self.max_cells is not None and sum(len(v) for v in state.values()) > self.max_cells:
+            raise LimitExceededError("max_cells", self.max_cells, glyph)
+        if self.max_bits is not None:
+            for cells in state.values():
+                for v in cells:
+                    if type(v) is int and v.bit_length() > self.max_bits:
+                        raise LimitExceededError("max_bits", self.max_bits, glyph)
+
+
+    def check_power(self, base, exponent):
+        "Raise LimitExceededError if base ** exponent would have too many bits to compute"
+        if self.max_bits is None or type(base) is not int or type(exponent) is not int:
+            return
+        if exponent > 1 and abs(base) > 1 and (abs(base).bit_length() - 1) * exponent >= self.max_bits:
+            raise LimitExceededError("max_bits", self.max_bits)
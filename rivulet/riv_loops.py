@@ -0,0 +1,41 @@
+"Finding while blocks that loop forever, from the state at the start of each iteration"
+
+
+class LoopWatch:
+    """Brent's cycle detection over the state a while block starts each iteration in
+
+    The state's hash is compared with the one saved at the last power of
+    two iterations, so a cycle of any length is found within twice the
+    iterations it takes to start repeating. Hashes can collide, so on a
+    match the state is copied, and the loop only reported if the state is
+    the same again a period later.
+    """
+    __slots__ = ("saved", "saved_at", "next_save", "copy", "copy_at", "confirm_at")
+
+    def __init__(self):
+        self.saved = None       # hash saved at iteration saved_at
+        self.saved_at = 0
+        self.next_save = 1      # iteration to save the hash at next
+        self.copy = None        # state at a suspected repeat, at iteration copy_at
+        self.copy_at = 0
+        self.confirm_at = None  # iteration to compare the state with copy at
+
+
+    def repeats(self, iteration, state):
+        "The period the state has repeated with at the start of iteration, or None"
+        if self.confirm_at is not None and iteration >= self.confirm_at:
+            if state.same(self.copy):
+                return self.confirm_at - self.copy_at
+            self.copy = self.confirm_at = None
+
+        zobrist = state.digest()
+        if zobrist == self.saved and self.confirm_at is None:
+            self.copy = state.copy()
+            self.copy_at = iteration
+            self.confirm_at = 2 * iteration - self.saved_at
+
+        if iteration >= self.next_save:
+            self.saved = zobrist
+            self.saved_at = iteration
+            self.next_save *= 2
+        return None
@@ -0,0 +1,112 @@
+"Memoization of block effects, keyed on the values a block reads"
+from collections import OrderedDict
+
+DEFAULT_SIZE = 1024
+# cells of whole lists a key or entry holds at most; a block reading or writing more isn't memoized
+MAX_WHOLE_CELLS = 64
+# misses in a row after which a block is no longer looked up
+MAX_MISSES = 64
+
+
+class BlockMemo:
+    """A bounded LRU cache of block results
+
+    A block's result depends only on the locations in its read-set, so when it
+    is entered with the same values there it will write the same values to
+    its write-set. Values are keyed with their types, as 2 and 2.0 compare
+    equal but do not behave the same.
+
+    Building a key copies the lists the block uses whole, so a block is
+    only looked up while those hold MAX_WHOLE_CELLS cells between them,
+    and not at all once it has missed MAX_MISSES times in a row: the key
+    of a block entered with new values each time costs without paying.
+    """
+
+    def __init__(self, effects, size=DEFAULT_SIZE):
+        self.effects = effects
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rollbacks = 0
+        self.streaks = {}           # path -> misses in a row
+        self.given_up = set()       # paths of blocks no longer looked up
+
+
+    @staticmethod
+    def __small(lists, state):
+        "Whether lists used whole hold few enough cells to copy into a key or entry"
+        return sum(len(state[lst]) for lst in lists) <= MAX_WHOLE_CELLS
+
+
+    def key(self, path, state):
+        "The values of the block's read-set in state"
+        effects = self.effects[path]
+        vals = [path]
+        for lst in effects.sized:
+            vals.append(len(state[lst]))
+        for lst, cell in effects.cells_read:
+            val = state[lst][cell] if cell < len(state[lst]) else None
+            vals.append(val)
+            vals.append(type(val))
+        for lst in effects.whole:
+            vals.append(tuple(state[lst]))
+            vals.append(tuple(map(type, state[lst])))
+        return tuple(vals)
+
+
+    def lookup(self, path, state):
+        """Apply a cached result for the block to state
+
+        Returns the number of glyphs the block ran when it was cached, or
+        None, and the key to store its result under, or None if the block
+        isn't memoized.
+        """
+        if path in self.given_up:
+            return None, None
+        if self.effects[path].whole and not self.__small(self.effects[path].whole, state):
+            key = entry = None
+        else:
+            key = self.key(path, state)
+            entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            streak = self.streaks.get(path, 0) + 1
+            self.streaks[path] = streak
+            if streak >= MAX_MISSES:
+                self.given_up.add(path)
+            return None, key
+
+        self.streaks[path] = 0
+        self.cache.move_to_end(key)
+        self.hits += 1
+        lengths, cells, wholes, glyphs, rolled_back = entry
+        effects = self.effects[path]
+
+        for lst, size in zip(effects.sized, lengths):
+            if len(state[lst]) < size:
+                state[lst].extend([0] * (size - len(state[lst])))
+        for (lst, cell), val in zip(effects.cells_written, cells):
+            if val is not None:
+                state[lst][cell] = val
+        for lst, contents in zip(effects.whole_written, wholes):
+            state[lst][:] = contents
+        if rolled_back:
+            self.rollbacks += 1
+
+        return glyphs, None
+
+
+    def store(self, path, key, state, glyphs, rolled_back):
+        "Cache the result of a block that was entered with the given key"
+        effects = self.effects[path]
+        if effects.whole_written and not self.__small(effects.whole_written, state):
+            return
+        lengths = tuple(len(state[lst]) for lst in effects.sized)
+        cells = tuple(state[lst][cell] if cell < len(state[lst]) else None
+                      for lst, cell in effects.cells_written)
+        wholes = tuple(tuple(state[lst]) for lst in effects.whole_written)
+
+        self.cache[key] = (lengths, cells, wholes, glyphs, rolled_back)
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
@@ -0,0 +1,300 @@
+"Lists too large to keep in memory, stored in pages of memory-mapped files"
+from array import array
+from itertools import islice
+import mmap
+import tempfile
+
+# a page holds 1 << PAGE_SHIFT cells of 8 bytes (64 KiB)
+PAGE_SHIFT = 13
+# pages in each file mapped (16 MiB)
+SEGMENT_PAGES = 256
+CELL_BYTES = 8
+
+
+class PageStore:
+    """Fixed-size pages of 8-byte cells, in memory-mapped temporary files
+
+    Pages are reference counted. A copy of a MappedArray shares its pages,
+    and whichever of them writes to a shared page first gets its own copy
+    of that page, so a snapshot of a large list costs a reference to each
+    page rather than a copy of every cell. Freed pages are reused. The
+    files are unlinked as soon as they are mapped, so the space they use
+    goes once the store does, and the operating system writes their pages
+    out to disk, rather than to swap, when memory runs short.
+    """
+
+    def __init__(self, directory=None, page_shift=PAGE_SHIFT):
+        self.directory = directory
+        self.shift = page_shift
+        self.cells = 1 << page_shift
+        self.mask = self.cells - 1
+        self.refs = []                      # page -> MappedArrays holding it
+        self.free = []                      # pages no MappedArray holds
+        self.views = {"q": [], "d": []}     # typecode -> page -> memoryview of its cells
+        self.__maps = []
+
+
+    def __grow(self):
+        size = SEGMENT_PAGES * self.cells * CELL_BYTES
+        with tempfile.TemporaryFile(dir=self.directory) as file:
+            file.truncate(size)
+            # the mapping keeps its own handle on the file
+            mapped = mmap.mmap(file.fileno(), size)
+        self.__maps.append(mapped)
+        first = len(self.refs)
+        for typecode, views in self.views.items():
+            whole = memoryview(mapped).cast(typecode)
+            views.extend(whole[page * self.cells:(page + 1) * self.cells] for page in range(SEGMENT_PAGES))
+        self.refs.extend([0] * SEGMENT_PAGES)
+        self.free.extend(range(first + SEGMENT_PAGES - 1, first - 1, -1))
+
+
+    def allocate(self):
+        "A page no MappedArray holds, held once; its cells hold anything"
+        if not self.free:
+            self.__grow()
+        page = self.free.pop()
+        self.refs[page] = 1
+        return page
+
+
+    def release(self, page):
+        self.refs[page] -= 1
+        if not self.refs[page]:
+            self.free.append(page)
+
+
+    @property
+    def pages_used(self):
+        "Pages held by any MappedArray"
+        return len(self.refs) - len(self.free)
+
+
+class MappedArray:
+    """An int64 ("q") or double ("d") array kept in a PageStore
+
+    Has the methods of array that Cells uses, so can take its place for a
+    list that has grown large. Inserts and pops move the cells after them
+    a page at a time. Pickles as an array, so checkpoints hold the values
+    rather than the pages.
+    """
+    __slots__ = ("store", "typecode", "pages", "length")
+
+    def __init__(self, store, typecode, values=()):
+        self.store = store
+        self.typecode = typecode
+        self.pages = []
+        self.length = 0
+        rest = self.fill(iter(values))
+        if rest is not None:
+            raise TypeError(f"cannot store {rest[0]!r} in a {typecode} array")
+
+
+    def __del__(self):
+        release = self.store.release
+        for page in self.pages:
+            release(page)
+
+
+    def __reduce__(self):
+        return (array, (self.typecode, self.tobytes()))
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __index(self, idx):
+        if idx < 0:
+            idx += self.length
+        if not 0 <= idx < self.length:
+            raise IndexError("array index out of range")
+        return idx
+
+
+    def __writable(self, p):
+        "The view of page p of this array, copied first if another array shares it"
+        store = self.store
+        page = self.pages[p]
+        if store.refs[page] > 1:
+            copied = store.allocate()
+            store.views["q"][copied][:] = store.views["q"][page]
+            store.release(page)
+            self.pages[p] = page = copied
+        return store.views[self.typecode][page]
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.length))]
+        idx = self.__index(idx)
+        store = self.store
+        return store.views[self.typecode][self.pages[idx >> store.shift]][idx & store.mask]
+
+
+    def __setitem__(self, idx, value):
+        idx = self.__index(idx)
+        self.__writable(idx >> self.store.shift)[idx & self.store.mask] = value
+
+
+    def __iter__(self):
+        views = self.store.views[self.typecode]
+        cells = self.store.cells
+        for p, page in enumerate(self.pages):
+            yield from views[page][:min(cells, self.length - p * cells)].tolist()
+
+
+    def append(self, value):
+        store = self.store
+        offset = self.length & store.mask
+        if offset:
+            view = self.__writable(len(self.pages) - 1)
+        else:
+            self.pages.append(store.allocate())
+            view = store.views[self.typecode][self.pages[-1]]
+        view[offset] = value
+        self.length += 1
+
+
+    def fill(self, values):
+        """Append values from an iterator a page at a time, stopping at a chunk
+        holding a value that can't be stored; returns that chunk, unwritten, or None"""
+        store = self.store
+        while True:
+            offset = self.length & store.mask
+            chunk = list(islice(values, store.cells - offset))
+            if not chunk:
+                return None
+            try:
+                cells = array(self.typecode, chunk)
+            except (TypeError, OverflowError):
+                return chunk
+            if offset:
+                view = self.__writable(len(self.pages) - 1)
+            else:
+                self.pages.append(store.allocate())
+                view = store.views[self.typecode][self.pages[-1]]
+            view[offset:offset + len(cells)] = memoryview(cells)
+            self.length += len(cells)
+
+
+    def extend(self, values):
+        rest = self.fill(iter(values))
+        if rest is not None:
+            raise TypeError(f"cannot store {rest[0]!r} in a {self.typecode} array")
+
+
+    def insert(self, idx, value):
+        n = self.length
+        if idx < 0:
+            idx = max(0, idx + n)
+        if idx >= n:
+            self.append(value)
+            return
+        self.append(self[n - 1])
+        # move idx..n-2 up one, from the last page down
+        store = self.store
+        shift, cells = store.shift, store.cells
+        views = store.views[self.typecode]
+        for p in range((n - 1) >> shift, (idx >> shift) - 1, -1):
+            start = p << shift
+            view = self.__writable(p)
+            lo, hi = max(idx, start), min(n - 1, start + cells - 1)
+            if hi > lo:
+                view[lo - start + 1:hi - start + 1] = view[lo - start:hi - start]
+            if start > idx:
+                view[0] = views[self.pages[p - 1]][cells - 1]
+        self[idx] = value
+
+
+    def pop(self, idx=-1):
+        if not self.length:
+            raise IndexError("pop from empty array")
+        idx = self.__index(idx)
+        value = self[idx]
+        n = self.length
+        # move idx+1..n-1 down one, from idx's page up
+        store = self.store
+        shift, cells = store.shift, store.cells
+        views = store.views[self.typecode]
+        for p in range(idx >> shift, ((n - 2) >> shift) + 1 if idx < n - 1 else 0):
+            start = p << shift
+            view = self.__writable(p)
+            lo, hi = max(idx, start), min(n - 2, start + cells - 1)
+            inner = min(hi, start + cells - 2)
+            if inner >= lo:
+                view[lo - start:inner - start + 1] = view[lo - start + 1:inner - start + 2]
+            if hi == start + cells - 1:
+                view[cells - 1] = views[self.pages[p + 1]][0]
+        self.length -= 1
+        if len(self.pages) > (self.length + cells - 1) >> shift:
+            store.release(self.pages.pop())
+        return value
+
+
+    def copy(self):
+        "A copy sharing every page, until one of them writes to it"
+        ret = MappedArray.__new__(MappedArray)
+        ret.store = self.store
+        ret.typecode = self.typecode
+        ret.pages = list(self.pages)
+        ret.length = self.length
+        refs = self.store.refs
+        for page in self.pages:
+            refs[page] += 1
+        return ret
+
+
+    def tobytes(self):
+        views = self.store.views[self.typecode]
+        cells = self.store.cells
+        return b"".join(views[page][:min(cells, self.length - p * cells)].tobytes()
+                        for p, page in enumerate(self.pages))
+
+
+    def tolist(self):
+        return list(self)
+
+
+class MappedStorage:
+    """Where a State's lists go once they hold more than cells cells
+
+    Only lists stored as int64 or double arrays move; a list of objects
+    (ints past 64 bits, or mixed types) stays in memory. The PageStore is
+    made when the first list moves, in directory (by default the system's
+    temporary directory).
+    """
+
+    def __init__(self, cells, directory=None):
+        self.cells = cells
+        self.directory = directory
+        self.__store = None
+
+
+    def __reduce__(self):
+        # a checkpoint keeps the setting; its lists are saved as arrays
+        return (MappedStorage, (self.cells, self.directory))
+
+
+    @property
+    def store(self):
+        if self.__store is None:
+            self.__store = PageStore(self.directory)
+        return self.__store
+
+
+    def mapped(self, data):
+        "A MappedArray holding the cells of an array"
+        return MappedArray(self.store, data.typecode, data)
+
+
+    def streamed(self, values, typecode):
+        """A MappedArray of values, written as they come rather than gathered
+        in memory first; or, if one doesn't fit typecode, None and the values
+        as a list"""
+        values = iter(values)
+        data = MappedArray(self.store, typecode)
+        rest = data.fill(values)
+        if rest is None:
+            return data, None
+        return None, [*data, *rest, *values]
@@ -0,0 +1,114 @@
+"Peephole optimization of parsed glyphs"
+
+def _command(token):
+    return token["action"].get("command") if token["action"] else None
+
+
+def _touch(token, length):
+    "A token that only creates cells, the side effect of a strand that writes nothing"
+    return {"type": "touch", "subtype": "touch", "list": token["list"],
+            "assign_to_cell": token["assign_to_cell"], "length": length,
+            "action": None, "order": token.get("order")}
+
+
+class PeepholeOptimizer:
+    """Rewrites each glyph's tokens into fewer, cheaper ones with the same effect
+
+    - strands that write nothing (zero strands) become touches, which only
+      create their cell if it is next in the list, as the strand would have
+    - touches of consecutive cells of a list merge into one
+
+    Adding zero leaves -0.0 as 0.0, so is only dropped from programs that
+    can't produce floats. The parser gives each strand of a list in a glyph
+    its own cell, so no two strands of a glyph act on the same cell and
+    there is nothing to fold between them.
+    """
+
+    def __init__(self):
+        self.removed = 0
+        self.report = []
+
+
+    @staticmethod
+    def ints_only(glyphs):
+        "Whether no command in the program can turn a cell into a float"
+        for g in glyphs:
+            for t in g["tokens"]:
+                command = _command(t)
+                if command in ("division_assignment", "root_assignment"):
+                    return False
+                if command == "exponent_assignment" and \
+                    (t["subtype"] != "value" or not isinstance(t["value"], int) or t["value"] < 0):
+                    return False
+        return True
+
+
+    def optimize(self, glyphs):
+        "Optimize glyphs in place, returning a line of report for each glyph changed"
+        for g, optimized in zip(glyphs, self.optimized(glyphs)):
+            g["tokens"] = optimized["tokens"]
+        return self.report
+
+
+    def optimized(self, glyphs):
+        """A list of the glyphs optimized, leaving those given unchanged
+
+        Glyphs the optimizer doesn't change are the same dicts in the list
+        returned; changed ones are new dicts with new token lists.
+        """
+        ints = self.ints_only(glyphs)
+        ret = []
+        for idx, g in enumerate(glyphs):
+            removed = self.removed
+
+            tokens = g["tokens"]
+            while True:
+                count = len(tokens)
+                tokens = self.__peephole(tokens, ints)
+                if len(tokens) == count:
+                    break
+
+            if self.removed > removed:
+                self.report.append(f"glyph {g.get('id', idx)}: "
+                                   f"{self.removed - removed} zero strands reduced to cell creation")
+                g = dict(g, tokens=tokens)
+            ret.append(g)
+        return ret
+
+
+    def __is_noop(self, token, ints):
+        if token["type"] != "data" or token["subtype"] != "value" or not isinstance(token["value"], int):
+            return False
+        command = _command(token)
+        if command == "subtraction_assignment" or (command in (None, "addition_assignment", "pop") and ints):
+            # -0.0 + 0 is 0.0, so adding zero only does nothing for ints
+            return token["value"] == 0
+        if command in ("multiplication_assignment", "exponent_assignment"):
+            return token["value"] == 1
+        return False
+
+
+    def __peephole(self, tokens, ints):
+        "One pass over a glyph's tokens, rewriting each with the one before it"
+        ret = []
+        for token in tokens:
+            if self.__is_noop(token, ints):
+                self.removed += 1
+                token = _touch(token, token["assign_to_cell"] + 1)
+
+            prev = ret[-1] if ret else None
+            merged = prev and self.__merge(prev, token)
+            if merged:
+                ret[-1] = merged
+            else:
+                ret.append(token)
+        return ret
+
+
+    @staticmethod
+    def __merge(prev, token):
+        "A single token with the effect of prev then token, or None"
+        if prev["type"] == "touch" and token["type"] == "touch" \
+            and prev["list"] == token["list"] and prev["length"] == token["assign_to_cell"]:
+            return _touch(prev, token["length"])
+        return None
@@ -1,8 +1,9 @@
-import copy
+import functools
 import json
 import math
-import rivulet
 from pathlib import Path
+from types import MappingProxyType
+import rivulet
 from rivulet.riv_exceptions import InternalError, RivuletSyntaxError
 # pylint: disable=locally-disabled, fixme, line-too-long
 
@@ -14,6 +15,53 @@ def _chars_in_list(list1, list2):
         retset += [i for i in range(len(list2)) if list2[i] == val]
     return retset
 
+def _frozen(value):
+    "A read-only copy of JSON data: dicts become mapping proxies and lists tuples"
+    if isinstance(value, dict):
+        return MappingProxyType({k: _frozen(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_frozen(v) for v in value)
+    return value
+
+
+def _thawed(value):
+    "A mutable copy of data made by _frozen, to hand out in tokens"
+    if isinstance(value, MappingProxyType):
+        return {k: _thawed(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thawed(v) for v in value]
+    return value
+
+
+@functools.cache
+def _tables():
+    "The lexicon and command map, read once and shared, read-only, by every Parser"
+    here = Path(rivulet.__path__[0])
+    with open(here / '_lexicon.json', encoding='utf-8') as lex:
+        lexicon = json.load(lex)
+    with open(here / '_commands.json', encoding='utf-8') as cmds:
+        command_map = json.load(cmds)
+
+    # convert all directions to lists (some are just strings)
+    for s in lexicon:
+        for r in s["readings"]:
+            if not isinstance(r["dir"], list):
+                r["dir"] = [r["dir"]]
+    return _frozen(lexicon), _frozen(command_map)
+
+
+@functools.lru_cache(maxsize=64)
+def _primes(count):
+    "1 and the primes after it, count numbers in all"
+    primes = [1]
+    for num in range(2, count ** 2):
+        if all(num % i != 0 for i in range(2, int(math.sqrt(num)) + 1)):
+            primes.append(num)
+            if len(primes) >= count:
+                break
+    return tuple(primes)
+
+
 OPPOSITE_DIR = {
     "up": "down",
     "down": "up",
@@ -22,22 +70,15 @@ OPPOSITE_DIR = {
 }
 
 class Parser:
-    "Parser for the Rivulet esolang"
+    """Parser for the Rivulet esolang
 
-    def __init__(self):
-        here = Path(rivulet.__path__[0])
-        with open(here / '_lexicon.json', encoding='utf-8') as lex:
-            self.lexicon = json.load(lex)
-        with open(here / '_commands.json', encoding='utf-8') as cmds:
-            self.command_map = json.load(cmds)
+    A Parser holds only the lexicon and command map, read-only and shared by
+    every Parser; what a parse works out as it goes is passed along with it.
+    So one Parser can parse any number of programs at once, in any threads.
+    """
 
-        # convert all directions to lists (some are just strings)
-        for s in self.lexicon:
-            for r in s["readings"]:
-                if not isinstance(r["dir"], list):
-                    r["dir"] = [r["dir"]]
-
-        self.primes = []
+    def __init__(self):
+        self.lexicon, self.command_map = _tables()
 
 
     def get_symbol_by_name(self, name:str):
@@ -128,13 +169,13 @@ class Parser:
         # the reading compatible with the direction of the strand
         reading_for_match = [r for r in readings \
             if r["pos"] == "start" \
-            and r["dir"] == [successful_matches[0]]]
+            and r["dir"] == (successful_matches[0],)]
 
         if len(reading_for_match) != 1:
             raise InternalError(f"{len(reading_for_match)} dirs in a start where 1 was expected")
 
         return {
-            "symbol": symbol[0]["symbol"],
+            "symbol": list(symbol[0]["symbol"]),
             "name": symbol[0]["name"],
             "x": x,
             "y": y,
@@ -158,13 +199,14 @@ class Parser:
         return starts
 
 
-    def _interpret_strand(self, glyph, prev, start):
+    def _interpret_strand(self, glyph, prev, start, primes):
         """Recursively follow the data strand to determine build out its value and determine its subtype (value vs ref if data strand etc). 
         
         Parameters:
             glyph: the glyph matrix
             prev: the current step's data (it will advance to the next step)
             start: the start of the strand
+            primes: the values of the lines, from _load_primes
         This will modify the start object in place.
         """
         # At the beginning of a strand, prev is the hook which begins it (and never has any other reading).
@@ -213,15 +255,15 @@ class Parser:
 
             # if it's straight and left or right, we add or subtract the prime
             if next_dir == 'right':
-                start['value'] += self.primes[curr["y"]]
+                start['value'] += primes[curr["y"]]
             elif next_dir == 'left':
-                start['value'] -= self.primes[curr["y"]]
+                start['value'] -= primes[curr["y"]]
 
             # if it's up or down, we add or subtract the prime relative to the start of this strand
             if next_dir == 'down':
-                start['vert_value'] += self.primes[abs(math.floor((start["x"] - curr["x"])/2))]
+                start['vert_value'] += primes[abs(math.floor((start["x"] - curr["x"])/2))]
             elif next_dir == 'up':
-                start['vert_value'] -= self.primes[abs(math.floor((start["x"] - curr["x"])/2))]
+                start['vert_value'] -= primes[abs(math.floor((start["x"] - curr["x"])/2))]
 
         # TEST FOR END
         # a loc_marker is also an end, but only if it's pointing in the opposite direction of the previous character
@@ -251,7 +293,7 @@ class Parser:
         # if it continues, load the next character
         if ("continue" in readings or "corner" in readings) and next_dir:
             curr["dir"] = next_dir
-            self._interpret_strand(glyph, curr, start)
+            self._interpret_strand(glyph, curr, start, primes)
             return
 
         raise RivuletSyntaxError(f"No valid reading found for char {curr['x']}, {curr['y']}")
@@ -285,7 +327,7 @@ class Parser:
             if start['type'] == "action":
                 start["subtype"] = "list2list"
                 start["applies_to"] = "list"
-                start["command"] = copy.deepcopy(self.command_map[str(start["vert_value"])])
+                start["command"] = _thawed(self.command_map[str(start["vert_value"])])
                 if "list" in start['command']:
                     start['command'] = start['command']['list']
         else:
@@ -299,7 +341,7 @@ class Parser:
                 start["value"] = None
                 if not str(start["vert_value"]) in self.command_map:
                     raise RivuletSyntaxError(f"Command not found for {start['vert_value']}")
-                start["command"] = copy.deepcopy(self.command_map[str(start["vert_value"])])
+                start["command"] = _thawed(self.command_map[str(start["vert_value"])])
                 if next_dir in ("right", "left"):
                     start['subtype'] = "list"
                     if "list" in start['command']:
@@ -313,16 +355,22 @@ class Parser:
             del start["command"]["list"]
 
 
-    def _lex_glyph(self, glyph):
-        "Returns collection of strands with their interpretations"
+    def _lex_glyph(self, glyph, primes=None):
+        """Returns collection of strands with their interpretations
+
+        primes are those of the program, or by default enough for the glyph
+        alone, which agree with them wherever the glyph reads them.
+        """
         #FIXME: should ensure that starts and ends are cleared OR TAKE PARAM
 
         # make glyph rectangular
         glyph = [ln + [' '] * (max([len(i) for i in glyph]) - len(ln)) for ln in glyph]
+        if primes is None:
+            primes = _primes(max(len(glyph), len(glyph[0])))
 
         starts = self._find_strand_starts(glyph)
         for s in starts:
-            self._interpret_strand(glyph, s, s)
+            self._interpret_strand(glyph, s, s, primes)
         return starts
 
 
@@ -413,17 +461,12 @@ class Parser:
 
 
     def _load_primes(self, glyphs):
-        "Load a list of primes up to the length of the longest dimension of any glyph"
-        self.primes = [1]
+        "A tuple of primes up to the length of the longest dimension of any glyph"
         primes_to_count = max( \
             *[len(i['glyph']) for i in glyphs], \
             *[len(i['glyph'][0]) for i in glyphs] \
         )
-        for num in range(2, primes_to_count ** 2):
-            if all(num % i != 0 for i in range(2, int(math.sqrt(num)) + 1)):
-                self.primes.append(num)
-                if len(self.primes) >= primes_to_count:
-                    break
+        return _primes(primes_to_count)
 
 
     def _remove_blank_lines(self, program):
@@ -453,7 +496,7 @@ class Parser:
         return block_tree
 
 
-    def _parse_glyphs(self, glyphs):
+    def _parse_glyphs(self, glyphs, primes):
         "Arrange Strands in order to be run and fill out with what they assign to, what is tested, etc"
 
         for g, glyph in enumerate(glyphs):
@@ -461,7 +504,7 @@ class Parser:
             count_per_list = {}
 
             # primes list count = max number of lines in a glyph
-            for idx in range(len(self.primes)):
+            for idx in range(len(primes)):
                 count_per_list[idx] = 0
 
             # build out new array in sort order
@@ -475,7 +518,7 @@ class Parser:
                     if t["type"] != "question_marker"
                     and t["type"] != "action"]:
 
-                token["list"] = self.primes[token["y"]]
+                token["list"] = primes[token["y"]]
                 token["order"] = order
                 order += 1
 
@@ -526,10 +569,10 @@ class Parser:
 
                 if not ref:
                     # no data cells have been declared for this list before where the ref points
-                    token["ref_cell"] = [self.primes[token["y"]], 0]
+                    token["ref_cell"] = [primes[token["y"]], 0]
                 else:
                     # the ref points to somewhere else in the list
-                    token["ref_cell"] = [self.primes[token["y"]], max(t["assign_to_cell"] for t in ref if t["x"] < token["x"] and "assign_to_cell" in t) + 1]
+                    token["ref_cell"] = [primes[token["y"]], max(t["assign_to_cell"] for t in ref if t["x"] < token["x"] and "assign_to_cell" in t) + 1]
 
             # Ref markers determine their reference cells
             # Also do for question marker in case needed
@@ -537,10 +580,10 @@ class Parser:
                 ref = [t for t in sorted_tokens if t["y"] == token["end_y"] and t["x"] < token["end_x"]]
                 if not ref:
                     # no data cells have been declared for this list before where the ref points
-                    token["ref_cell"] = [self.primes[token["end_y"]], 0]
+                    token["ref_cell"] = [primes[token["end_y"]], 0]
                 else:
                     # the ref points to somewhere else in the list
-                    token["ref_cell"] = [self.primes[token["end_y"]], max(t["assign_to_cell"] for t in ref if t["x"] < token["end_x"] and "assign_to_cell" in t) + 1]
+                    token["ref_cell"] = [primes[token["end_y"]], max(t["assign_to_cell"] for t in ref if t["x"] < token["end_x"] and "assign_to_cell" in t) + 1]
 
             # Action strands are added to their respective data strands
             # The top action strand for an x value goes to the top data strand for that x value
@@ -584,13 +627,13 @@ class Parser:
 
         # now that we know the size of the largest glyph, we calculate
         # the primes for the whole program
-        self._load_primes(glyphs)
+        primes = self._load_primes(glyphs)
 
         for glyph in glyphs:
-            glyph["tokens"] = self._lex_glyph(glyph["glyph"])
+            glyph["tokens"] = self._lex_glyph(glyph["glyph"], primes)
 
         # re-arranges and decorates the tokens for each glyph in place
-        self._parse_glyphs(glyphs)
+        self._parse_glyphs(glyphs, primes)
 
         for g in glyphs:
             g["list_size"] = len(g["glyph"])
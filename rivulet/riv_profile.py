@@ -0,0 +1,131 @@
+"Profiles of what a run of a program did, recorded to guide later runs of it"
+from array import array
+from collections import deque
+import json
+from rivulet.riv_blocks import Block
+from rivulet.riv_exceptions import ProfileError
+from rivulet.riv_mmap import MappedArray
+
+PROFILE_VERSION = 1
+
+
+def _holders(block, holders):
+    "Map the id of each glyph in block and its sub-blocks to the block holding it"
+    for g in block:
+        if type(g) is Block:
+            _holders(g, holders)
+        else:
+            holders[g["id"]] = block
+    return holders
+
+
+def _storage_kind(data):
+    "How a list's cells are stored: an array's typecode, or list or deque"
+    if type(data) is array or type(data) is MappedArray:
+        return data.typecode
+    return "deque" if type(data) is deque else "list"
+
+
+class RunProfile:
+    """What a run of a program did that can't be told from its text
+
+    For each glyph, the times it ran; for each block (by path), the times
+    it repeated and was rolled back; for each list (by line number), the
+    cells it ended with and how they were stored: an array's typecode ("q"
+    or "d"), "list" once a value didn't fit an array, or "deque" once
+    inserts and pops near its front moved it to one. Only the program it
+    was recorded from, by digest, uses it.
+    """
+
+    def __init__(self, digest):
+        self.digest = digest        # program_hash of the program run
+        self.glyphs = {}            # glyph id -> times run
+        self.iterations = {}        # block path -> times repeated
+        self.rollbacks = {}         # block path -> times rolled back
+        self.lists = {}             # line number -> (cells, storage kind)
+
+
+    def hot(self, threshold):
+        "Paths of the blocks that repeated at least threshold times"
+        return [path for path, iterations in self.iterations.items() if iterations >= threshold]
+
+
+    def never_rolled_back(self, tree):
+        "The blocks in tree that ran and were never rolled back"
+        ran = {block.path: block for glyph_id, block in _holders(tree, {}).items() if self.glyphs.get(glyph_id)}
+        return [block for path, block in ran.items() if not self.rollbacks.get(path)]
+
+
+    def save(self, path):
+        profile = {
+            "version": PROFILE_VERSION,
+            "program": self.digest.hex(),
+            "glyphs": self.glyphs,
+            "blocks": [{"path": list(path), "iterations": self.iterations.get(path, 0),
+                        "rollbacks": self.rollbacks.get(path, 0)}
+                       for path in sorted(set(self.iterations) | set(self.rollbacks))],
+            "lists": {line: {"cells": cells, "storage": kind} for line, (cells, kind) in self.lists.items()},
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(profile, file)
+
+
+    @classmethod
+    def load(cls, path):
+        "Read a profile written by save"
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                profile = json.load(file)
+            if profile.get("version") != PROFILE_VERSION:
+                raise ProfileError(f"{path} is a profile of version {profile.get('version')}, "
+                                   f"not {PROFILE_VERSION}")
+            ret = cls(bytes.fromhex(profile["program"]))
+            ret.glyphs = {int(glyph_id): count for glyph_id, count in profile["glyphs"].items()}
+            for block in profile["blocks"]:
+                path = tuple(block["path"])
+                ret.iterations[path] = block["iterations"]
+                ret.rollbacks[path] = block["rollbacks"]
+            ret.lists = {int(line): (facts["cells"], facts["storage"]) for line, facts in profile["lists"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ProfileError(f"cannot read the profile in {path}: {e}") from e
+        return ret
+
+
+class ProfileRecorder:
+    """Records a RunProfile of a program's run through the Hooks it calls
+
+    With hooks registered the run is watched, so nothing skips glyphs and
+    every glyph, iteration and rollback is seen. The hooks should be the
+    run's own, in its RunContext, so other runs aren't recorded too.
+    """
+
+    def __init__(self, hooks, loaded):
+        self.profile = RunProfile(loaded[0])
+        self.__holders = _holders(loaded[3], {})
+        hooks.add("glyph", self.__glyph)
+        hooks.add("iteration", self.__iteration)
+        hooks.add("rollback", self.__rollback)
+
+
+    def __glyph(self, glyph_id, iteration, action):
+        glyphs = self.profile.glyphs
+        glyphs[glyph_id] = glyphs.get(glyph_id, 0) + 1
+
+
+    def __iteration(self, glyph_id, iteration):
+        iterations = self.profile.iterations
+        path = self.__holders[glyph_id].path
+        iterations[path] = iterations.get(path, 0) + 1
+
+
+    def __rollback(self, glyph_id):
+        rollbacks = self.profile.rollbacks
+        path = self.__holders[glyph_id].path
+        rollbacks[path] = rollbacks.get(path, 0) + 1
+
+
+    def finish(self, state):
+        "Add the lists of the run's final state to the profile, and return it"
+        self.profile.lists = {line: (len(cells), _storage_kind(cells.data))
+                              for line, cells in zip(state.line_numbers, state.lists)}
+        return self.profile
@@ -0,0 +1,72 @@
+"A Rivulet program parsed once, to run many times from different starting states"
+from rivulet.riv_execution import RunContext
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+
+
+class Result:
+    "The outcome of one run of a Program"
+
+    def __init__(self, state, glyphs_run):
+        self.state = state              # the run's State, line number to list of values
+        self.glyphs_run = glyphs_run
+
+
+    @property
+    def output(self):
+        "List 1, used as the program's output stream"
+        return self.state.get(1, [])
+
+
+    def __repr__(self):
+        return f"Result(state={self.state!r}, glyphs_run={self.glyphs_run})"
+
+
+class Program:
+    """A parsed, optimized Rivulet program and its tree of blocks, built once
+
+    Each run starts from a fresh state, so runs don't affect each other, and
+    none of them parses the program again, nor compiles a block or plans a
+    closed form an earlier run already has. Runs share nothing else they
+    change, and those are only added to, so a Program can be run from many
+    threads at once. The optimizer drops additions of zero assuming a
+    program without floats never makes one, so a run starting from non-int
+    values uses an unoptimized build of the program instead, made the first
+    time one is needed.
+    """
+
+    def __init__(self, source, interpreter=None):
+        self.source = source
+        self.interpreter = interpreter or Interpreter()
+        self.__loaded = self.interpreter.load(source)
+        self.__unoptimized = None
+
+
+    @property
+    def lists(self):
+        "The line numbers of the program's lists"
+        return self.__loaded[1]
+
+
+    def run(self, initial_state=None, limits=None):
+        """Run the program to the end, returning a Result
+
+        initial_state is a dict of line number to the list of values that
+        list starts with; lists not given start empty. limits is a Limits
+        the run is stopped by, raising LimitExceededError.
+        """
+        loaded = self.__loaded
+        if initial_state and any(type(v) is not int for values in initial_state.values() for v in values):
+            if self.__unoptimized is None:
+                self.__unoptimized = self.interpreter.load(self.source, watched=True)
+            loaded = self.__unoptimized
+
+        intr = self.interpreter
+        execution = intr.prepare(loaded, initial_state=initial_state, context=RunContext(limits=limits or Limits()))
+        intr.advance(execution)
+        return Result(execution.state, execution.glyphs_run)
+
+
+def compile(source): # pylint: disable=redefined-builtin
+    "Parse a Rivulet program passed by text once, returning a Program to run it"
+    return Program(source)
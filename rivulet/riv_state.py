@@ -0,0 +1,377 @@
+"Compact storage for the lists of a running Rivulet program"
+from array import array
+from collections import deque
+from collections.abc import Mapping
+from rivulet.riv_mmap import MappedArray
+
+# a list of at least FRONT_MIN cells moves to a deque after FRONT_OPS inserts
+# or pops in its first quarter, each of which moves every cell after it
+FRONT_MIN = 32
+FRONT_OPS = 16
+
+# kinds of value, so cells holding 2 and 2.0 hash differently
+_KINDS = {int: 0, float: 1, complex: 2}
+
+
+def _term(idx, value):
+    "The Zobrist term for a cell holding value"
+    return hash((idx, value, _KINDS.get(type(value), 3)))
+
+
+def _storage(values):
+    "The most compact container for values: an int64 or double array, or a list of objects"
+    if not isinstance(values, (list, array)):
+        values = list(values)
+    if all(type(v) is int for v in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return list(values)
+    if values and all(type(v) is float for v in values):
+        return array("d", values)
+    return list(values)
+
+
+def _fits(data, value):
+    "Whether value can be stored in data without changing it"
+    if type(data) is not array and type(data) is not MappedArray:
+        return True
+    if data.typecode == "d":
+        return type(value) is float
+    return type(value) is int and -(1 << 63) <= value < (1 << 63)
+
+
+class Cells:
+    """The cells of one list, stored in an int64 or double array while every value fits
+
+    Behaves as a list. Once an int overflows 64 bits, or a value of another
+    type is written, the cells move to a list of objects. Replacing every
+    cell at once (as list-wide commands do) picks the most compact storage
+    again.
+
+    A list used as a queue, inserted into or popped from near its front,
+    moves to a deque, where those are O(1) rather than moving every cell.
+
+    A list a list question asks about is tracked: it keeps a count of its
+    cells that aren't > 0, updated on every write, so the question doesn't
+    have to look at every cell. Cells that can't be compared with 0
+    (complex numbers) are counted separately, and make it look again.
+
+    When loops are being watched, every list keeps a Zobrist hash of its
+    cells: the XOR of a term for each index and value, updated by each
+    write to a cell or the end of the list. Inserts and pops elsewhere move
+    every cell after them, so leave the hash to be worked out again.
+
+    Given a MappedStorage, an array that grows past its size moves into a
+    MappedArray, out of memory. It stays there, though its values are
+    gathered into a list of objects if one that doesn't fit is written.
+    Replacing its cells streams them into a new MappedArray.
+    """
+    __slots__ = ("data", "nonpositive", "unordered", "front_ops", "zobrist", "stale", "storage")
+
+    def __init__(self, values=(), storage=None):
+        self.data = _storage(values.data if isinstance(values, Cells) else values)
+        self.nonpositive = None     # cells not > 0, or None if untracked
+        self.unordered = 0          # cells that can't be compared with 0, if tracked
+        self.front_ops = 0          # inserts and pops near the front, while not a deque
+        self.zobrist = None         # hash of the cells, or None if unhashed
+        self.stale = False          # whether zobrist must be worked out again
+        self.storage = storage      # MappedStorage large arrays move to, if any
+        if storage is not None:
+            self.__spill()
+
+
+    def __spill(self):
+        "Move an array grown past the storage's size into it"
+        if type(self.data) is array and len(self.data) > self.storage.cells:
+            self.data = self.storage.mapped(self.data)
+
+
+    def __near_front(self, idx):
+        "Count an insert or pop at idx, moving to a deque if they keep coming near the front"
+        data = self.data
+        if type(data) is deque or type(data) is MappedArray or len(data) < FRONT_MIN \
+            or not 0 <= idx < len(data) >> 2:
+            return
+        self.front_ops += 1
+        if self.front_ops >= FRONT_OPS:
+            self.data = deque(data)
+
+
+    def track(self):
+        "Start keeping count of the cells that aren't > 0"
+        self.nonpositive = self.unordered = 0
+        self.__count(self.data, 1)
+
+
+    def __count(self, values, sign):
+        for v in values:
+            try:
+                if not v > 0:
+                    self.nonpositive += sign
+            except TypeError:
+                self.unordered += sign
+
+
+    def digest(self):
+        "The Zobrist hash of the cells, kept up to date from now on"
+        if self.zobrist is None or self.stale:
+            zobrist = 0
+            for idx, value in enumerate(self.data):
+                zobrist ^= _term(idx, value)
+            self.zobrist = zobrist
+            self.stale = False
+        return self.zobrist
+
+
+    def all_positive(self):
+        "Whether every cell is > 0, as a list question asks"
+        if self.nonpositive is None or self.unordered:
+            return all(v > 0 for v in self.data)
+        return self.nonpositive == 0
+
+
+    def __len__(self):
+        return len(self.data)
+
+
+    def __iter__(self):
+        return iter(self.data)
+
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return list(self.data)[idx] if type(self.data) is deque else list(self.data[idx])
+        return self.data[idx]
+
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            values = list(self.data)
+            values[idx] = value
+            self.replace(values)
+            return
+        if self.nonpositive is not None:
+            self.__count((self.data[idx],), -1)
+            self.__count((value,), 1)
+        if self.zobrist is not None:
+            if idx < 0:
+                idx += len(self.data)
+            self.zobrist ^= _term(idx, self.data[idx]) ^ _term(idx, value)
+        if _fits(self.data, value):
+            self.data[idx] = value
+        else:
+            self.data = list(self.data)
+            self.data[idx] = value
+
+
+    def insert(self, idx, value):
+        if self.nonpositive is not None:
+            self.__count((value,), 1)
+        if self.zobrist is not None:
+            if idx >= len(self.data):
+                self.zobrist ^= _term(len(self.data), value)
+            else:
+                self.stale = True
+        if not _fits(self.data, value):
+            self.data = list(self.data)
+        self.__near_front(idx)
+        self.data.insert(idx, value)
+        if self.storage is not None:
+            self.__spill()
+
+
+    def append(self, value):
+        if self.nonpositive is not None:
+            self.__count((value,), 1)
+        if self.zobrist is not None:
+            self.zobrist ^= _term(len(self.data), value)
+        if not _fits(self.data, value):
+            self.data = list(self.data)
+        self.data.append(value)
+        if self.storage is not None:
+            self.__spill()
+
+
+    def extend(self, values):
+        values = list(values)
+        if self.nonpositive is not None:
+            self.__count(values, 1)
+        if self.zobrist is not None:
+            for idx, value in enumerate(values, len(self.data)):
+                self.zobrist ^= _term(idx, value)
+        if not all(_fits(self.data, v) for v in values):
+            self.data = list(self.data)
+        self.data.extend(values)
+        if self.storage is not None:
+            self.__spill()
+
+
+    def pop(self, idx=-1):
+        self.__near_front(idx)
+        if type(self.data) is deque:
+            value = self.data[idx]
+            del self.data[idx]
+        else:
+            value = self.data.pop(idx)
+        if self.nonpositive is not None:
+            self.__count((value,), -1)
+        if self.zobrist is not None:
+            if idx == -1 or idx == len(self.data):
+                self.zobrist ^= _term(len(self.data), value)
+            else:
+                self.stale = True
+        return value
+
+
+    def store_as(self, kind):
+        """Move the cells to a deque or list of objects ("deque" or "list"), the
+        container a profile found them ending in, returning whether they moved"""
+        if kind == "deque" and type(self.data) is not deque:
+            self.data = deque(self.data)
+        elif kind == "list" and type(self.data) is not list and type(self.data) is not deque:
+            self.data = list(self.data)
+        else:
+            return False
+        self.front_ops = 0
+        return True
+
+
+    def replace(self, values):
+        "Set every cell at once, from any iterable"
+        if type(self.data) is MappedArray:
+            data, gathered = self.storage.streamed(values, self.data.typecode)
+            self.data = data if data is not None else _storage(gathered)
+        else:
+            self.data = _storage(values)
+        if self.storage is not None:
+            self.__spill()
+        self.front_ops = 0
+        self.stale = True
+        if self.nonpositive is not None:
+            self.track()
+
+
+    def copy(self):
+        ret = Cells.__new__(Cells)
+        # a MappedArray copies by sharing its pages until they are written
+        ret.data = self.data.copy() if type(self.data) is deque or type(self.data) is MappedArray else self.data[:]
+        ret.front_ops = self.front_ops
+        ret.nonpositive = self.nonpositive
+        ret.unordered = self.unordered
+        ret.zobrist = self.zobrist
+        ret.stale = self.stale
+        ret.storage = self.storage
+        return ret
+
+
+    def __eq__(self, other):
+        if isinstance(other, Cells):
+            other = other.data
+        elif not isinstance(other, list):
+            return NotImplemented
+        return list(self.data) == other
+
+    __hash__ = None
+
+
+    def __repr__(self):
+        return repr(list(self.data))
+
+
+class State(Mapping):
+    """The lists of a program, stored densely in the order of their line numbers
+
+    Indexed by prime line number like a dict of lists. The interpreter
+    translates line numbers to positions in lists once, when a program is
+    loaded, so running glyphs doesn't hash them. Given a MappedStorage, its
+    lists move out of memory into it once they grow large.
+    """
+
+    def __init__(self, line_numbers, lists=None, storage=None):
+        self.line_numbers = tuple(line_numbers)
+        self.slots = {key: slot for slot, key in enumerate(self.line_numbers)}
+        self.storage = storage
+        self.lists = lists if lists is not None else [Cells(storage=storage) for _ in self.line_numbers]
+
+
+    def __getitem__(self, key):
+        return self.lists[self.slots[key]]
+
+
+    def __setitem__(self, key, values):
+        self.lists[self.slots[key]] = values if isinstance(values, Cells) else Cells(values, self.storage)
+
+
+    def __iter__(self):
+        return iter(self.line_numbers)
+
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+
+    def copy(self, slots=None):
+        """A copy of every list to roll back to, or a Snapshot of those at the given
+        positions in lists"""
+        if slots is not None:
+            return Snapshot(slots, [self.lists[slot].copy() for slot in slots])
+        ret = State.__new__(State)
+        ret.line_numbers = self.line_numbers
+        ret.slots = self.slots
+        ret.storage = self.storage
+        ret.lists = [cells.copy() for cells in self.lists]
+        return ret
+
+
+    def restore(self, other):
+        "Roll back to a copy or Snapshot, which must not be used again"
+        if type(other) is Snapshot:
+            for slot, cells in zip(other.slots, other.lists):
+                self.lists[slot] = cells
+        else:
+            self.lists[:] = other.lists
+
+
+    def digest(self):
+        "A hash of every list, kept up to date by the lists as they are written"
+        zobrist = 0
+        for slot, cells in enumerate(self.lists):
+            zobrist ^= hash((slot, cells.digest()))
+        return zobrist
+
+
+    def same(self, other):
+        "Whether other holds the same values, of the same types, in every list"
+        return all(len(a) == len(b) and all(x == y and type(x) is type(y) for x, y in zip(a, b))
+                   for a, b in zip(self.lists, other.lists))
+
+
+    def to_dict(self):
+        "The state as a dict of lists"
+        return {key: list(cells) for key, cells in zip(self.line_numbers, self.lists)}
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return self.to_dict() == {k: list(v) for k, v in other.items()}
+
+    __hash__ = None
+
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class Snapshot:
+    """Copies of some of a State's lists, those a block can write, to roll back to
+
+    The lists a block can't write are the same when it rolls back as when
+    it started, so needn't be copied.
+    """
+    __slots__ = ("slots", "lists")
+
+    def __init__(self, slots, lists):
+        self.slots = slots          # positions in State.lists of the lists copied
+        self.lists = lists
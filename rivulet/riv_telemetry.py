@@ -0,0 +1,277 @@
+"Counters of a running program, published in shared memory for `riv top` to read"
+from argparse import ArgumentParser
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+TELEMETRY_MAGIC = b"RIVM"
+TELEMETRY_VERSION = 1
+SIZE = 4096
+
+# glyphs run between publishing everything; the glyph counters are written after every glyph
+PUBLISH_EVERY = 1024
+# reads finding a publish under way before checking its writer is still running
+READ_TRIES = 1000
+# active loops and lists published, the outermost and first ones
+MAX_LOOPS = 16
+MAX_LISTS = 32
+
+# positions of the int64 counters, after the magic and version
+SEQ = 1             # odd while a publish is being written
+PID = 2
+STARTED_NS = 3      # wall clock time the run started
+UPDATED_NS = 4      # and was last published
+STATUS = 5
+GLYPHS = 6          # glyphs run
+GLYPH_ID = 7        # the glyph last run
+DEPTH = 8           # blocks being run, the program's own included
+ROLLBACKS = 9
+LOOPS = 10          # loops published, then (first glyph, iteration) for each
+LISTS = LOOPS + 1 + 2 * MAX_LOOPS   # lists published, then (line, cells) for each
+
+RUNNING, FINISHED, FAILED = 0, 1, 2
+STATUSES = {RUNNING: "running", FINISHED: "finished", FAILED: "failed"}
+
+# the files of this process's open Telemetry, which no other may take over
+_open_paths = set()
+_opening = threading.Lock()
+
+
+def default_directory():
+    "Where the counters go: /dev/shm, which is memory, where there is one"
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def telemetry_path(pid, directory=None):
+    "The file the counters of process pid are mapped from"
+    return os.path.join(directory or default_directory(), f"rivulet-{pid}.telemetry")
+
+
+def _create(path):
+    """A new file at path, readable and writable only by this user, never one a link there points to
+
+    Raises FileExistsError if a Telemetry of this process has it open.
+    """
+    flags = os.O_CREAT | os.O_EXCL | os.O_RDWR | getattr(os, "O_NOFOLLOW", 0)
+    with _opening:
+        if os.path.abspath(path) in _open_paths:
+            raise FileExistsError(f"{path} is already published to by this process")
+        try:
+            fd = os.open(path, flags, 0o600)
+        except FileExistsError:
+            # left by an earlier process of the same id, which has exited; in a
+            # directory like /tmp, only its owner can remove it
+            os.unlink(path)
+            fd = os.open(path, flags, 0o600)
+        _open_paths.add(os.path.abspath(path))
+        return fd
+
+
+class Telemetry:
+    """The counters of one run at a time, in a file mapped into memory
+
+    The interpreter writes the glyph counters after every glyph, and the
+    rest (loops, lists and times) every PUBLISH_EVERY glyphs, each a single
+    store into the mapping; nothing is read back or flushed. A reader sees
+    them as soon as they are written. Publishing everything is bracketed
+    by a sequence counter, odd while it is under way, so a reader can tell
+    to read again. The file is created afresh, readable only by the user,
+    and removed when the telemetry is closed. `riv top` finds it by process
+    id, so a process has one Telemetry open at a time, which its
+    interpreters can share.
+    """
+
+    def __init__(self, directory=None):
+        self.path = telemetry_path(os.getpid(), directory)
+        fd = _create(self.path)
+        try:
+            os.ftruncate(fd, SIZE)
+            self.__map = mmap.mmap(fd, SIZE)
+        except BaseException:
+            self.__release()
+            raise
+        finally:
+            os.close(fd)
+        self.__map[:8] = TELEMETRY_MAGIC + struct.pack("<I", TELEMETRY_VERSION)
+        self.counters = memoryview(self.__map).cast("q")
+        self.counters[PID] = os.getpid()
+
+
+    def start(self):
+        "Reset the counters for a new run"
+        counters = self.counters
+        counters[SEQ] += 1
+        counters[STARTED_NS] = counters[UPDATED_NS] = time.time_ns()
+        counters[STATUS] = RUNNING
+        for field in (GLYPHS, GLYPH_ID, DEPTH, ROLLBACKS, LOOPS, LISTS):
+            counters[field] = 0
+        counters[SEQ] += 1
+
+
+    def publish(self, execution, status=RUNNING):
+        "Write every counter for an execution"
+        state = execution.state
+        self.__write(status, execution.glyphs_run, execution.frames, zip(state.line_numbers, state.lists))
+
+
+    def publish_cached(self, state):
+        "Write the counters of a run answered from the cache, finished without running a glyph"
+        self.__write(FINISHED, 0, [], state.items())
+
+
+    def __write(self, status, glyphs, frames, lists):
+        counters = self.counters
+        counters[SEQ] += 1
+        counters[UPDATED_NS] = time.time_ns()
+        counters[STATUS] = status
+        counters[GLYPHS] = glyphs
+        counters[DEPTH] = len(frames)
+        loops = [frame for frame in frames if frame.iteration][:MAX_LOOPS]
+        counters[LOOPS] = len(loops)
+        for i, frame in enumerate(loops):
+            counters[LOOPS + 1 + 2 * i] = frame.block.first
+            counters[LOOPS + 2 + 2 * i] = frame.iteration
+        lists = list(lists)[:MAX_LISTS]
+        counters[LISTS] = len(lists)
+        for i, (line, cells) in enumerate(lists):
+            counters[LISTS + 1 + 2 * i] = line
+            counters[LISTS + 2 + 2 * i] = len(cells)
+        counters[SEQ] += 1
+
+
+    def close(self):
+        "Remove the file; readers already attached keep the last counters"
+        self.counters.release()
+        self.__map.close()
+        self.__release()
+
+
+    def __release(self):
+        "Remove the file and let another Telemetry of this process have its path"
+        with _opening:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            _open_paths.discard(os.path.abspath(self.path))
+
+
+def read(counters):
+    """A consistent reading of the counters, as a dict
+
+    A writer that exits part way through publishing leaves the sequence
+    counter odd for good; once READ_TRIES reads find it so, and the writer
+    has exited, the last of them is returned, marked stale.
+    """
+    tries = 0
+    while True:
+        seq = counters[SEQ]
+        reading = {
+            "pid": counters[PID],
+            "started_ns": counters[STARTED_NS],
+            "updated_ns": counters[UPDATED_NS],
+            "status": STATUSES.get(counters[STATUS], "unknown"),
+            "glyphs": counters[GLYPHS],
+            "glyph": counters[GLYPH_ID],
+            "depth": counters[DEPTH],
+            "rollbacks": counters[ROLLBACKS],
+            "loops": [(counters[LOOPS + 1 + 2 * i], counters[LOOPS + 2 + 2 * i])
+                      for i in range(min(counters[LOOPS], MAX_LOOPS))],
+            "lists": [(counters[LISTS + 1 + 2 * i], counters[LISTS + 2 + 2 * i])
+                      for i in range(min(counters[LISTS], MAX_LISTS))],
+            "stale": False,
+        }
+        if seq % 2 == 0 and counters[SEQ] == seq:
+            return reading
+        tries += 1
+        if tries >= READ_TRIES:
+            if not _alive(reading["pid"]):
+                reading["stale"] = True
+                return reading
+            tries = 0
+        time.sleep(0)
+
+
+def attach(pid, directory=None):
+    "The counters of process pid, mapped read-only"
+    with open(telemetry_path(pid, directory), "rb") as file:
+        mapped = mmap.mmap(file.fileno(), SIZE, access=mmap.ACCESS_READ)
+    if mapped[:8] != TELEMETRY_MAGIC + struct.pack("<I", TELEMETRY_VERSION):
+        mapped.close()
+        raise ValueError(f"process {pid} publishes no Rivulet telemetry of version {TELEMETRY_VERSION}")
+    return memoryview(mapped).cast("q")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def render(reading, before=None, seconds=None):
+    """The lines riv top shows for a reading, with rates since the reading
+    before, taken seconds earlier"""
+    ended_ns = time.time_ns() if reading["status"] == "running" else reading["updated_ns"]
+    elapsed = (ended_ns - reading["started_ns"]) / 1e9
+    glyph_rate = rollback_rate = ""
+    if before is not None and seconds:
+        glyph_rate = f" ({(reading['glyphs'] - before['glyphs']) / seconds:,.0f}/s)"
+        rollback_rate = f" ({(reading['rollbacks'] - before['rollbacks']) / seconds:,.0f}/s)"
+    # a writer that exited while publishing left counters that may not agree
+    status = reading["status"] + (" (stale)" if reading["stale"] else "")
+    lines = [
+        f"rivulet pid {reading['pid']}  {status}  {elapsed:.1f}s elapsed",
+        f"glyphs {reading['glyphs']:,}{glyph_rate}  rollbacks {reading['rollbacks']:,}{rollback_rate}",
+        f"at glyph {reading['glyph']}, {reading['depth']} blocks deep",
+    ]
+    for first, iteration in reading["loops"]:
+        lines.append(f"  loop at glyph {first}: iteration {iteration:,}")
+    sizes = "  ".join(f"{line}:{cells:,}" for line, cells in reading["lists"] if cells)
+    lines.append(f"list cells  {sizes or 'all empty'}")
+    return lines
+
+
+def main(argv):
+    "Entry point for `riv top`"
+    arg_parser = ArgumentParser(prog="riv top",
+                                description="Watch a Rivulet program run with --telemetry")
+    arg_parser.add_argument("pid", type=int, help="id of the process running the program")
+    arg_parser.add_argument("-n", dest="interval", type=float, default=1.0,
+                            help="seconds between updates (default 1)")
+    arg_parser.add_argument("--once", dest="once", action="store_true", default=False,
+                            help="print one update, with rates over one interval, and exit")
+    arg_parser.add_argument("--dir", dest="directory", default=None,
+                            help="directory of the telemetry (default /dev/shm, or the temporary directory)")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        counters = attach(args.pid, args.directory)
+    except (OSError, ValueError) as e:
+        print(f"riv top: cannot attach to process {args.pid}: {e}", file=sys.stderr)
+        return 1
+
+    before, taken = read(counters), time.monotonic()
+    try:
+        while True:
+            time.sleep(args.interval)
+            reading, now = read(counters), time.monotonic()
+            lines = render(reading, before, now - taken)
+            if not args.once and sys.stdout.isatty():
+                print("\x1b[H\x1b[2J", end="")
+            print("\n".join(lines), flush=True)
+            if args.once or reading["status"] != "running":
+                return 0
+            if not _alive(args.pid):
+                print(f"process {args.pid} has exited")
+                return 0
+            before, taken = reading, now
+    except KeyboardInterrupt:
+        return 0
@@ -0,0 +1,274 @@
+"Tiered execution: while blocks found to be hot are compiled to Python functions"
+from rivulet.riv_exceptions import RivuletSyntaxError
+
+# iterations a block is interpreted for before it is compiled
+DEFAULT_THRESHOLD = 100
+
+# how a compiled block stopped running
+FINISHED = 0    # ran past its last glyph
+REPEATED = 1    # paused at the start of an iteration, to let the interpreter run it
+ROLLED_BACK = 2 # rolled back and exited
+
+# the expression each command computes from the cell (a) and its source (b)
+COMMANDS = {
+    "addition_assignment": "{a} + {b}",
+    "subtraction_assignment": "{a} - {b}",
+    "overwrite": "{b}",
+    "multiplication_assignment": "{a} * {b}",
+    "division_assignment": "{a} / {b}",
+    "mod_assignment": "{a} % {b}",
+    "exponent_assignment": "{a} ** {b}",
+    "root_assignment": "{a} ** (1 / {b})",
+}
+# commands run by the interpreter other than by computing a new value
+MOVES = ("insert", "append", "pop", "pop_and_append")
+
+
+class _Writer:
+    "Lines of Python source, indented"
+
+    def __init__(self):
+        self.lines = []
+        self.depth = 0
+
+
+    def __call__(self, line):
+        self.lines.append("    " * self.depth + line)
+
+
+class TieredBlocks:
+    """Counts the iterations of while blocks, compiling each that passes threshold
+
+    Candidates are blocks of glyphs (no sub-blocks) with a while question.
+    A compiled block is a Python function with its lists bound to locals and
+    each token's constants, cells and command written into its code, so
+    nothing is looked up in the token dicts as it runs. It is called at the
+    start of an iteration, with the snapshot the interpreter took for it,
+    and takes its own snapshots as it repeats, so it can be handed back to
+    the interpreter at any iteration boundary. With question_first, glyphs
+    with a guard question ask it before running their strands, as the
+    interpreter does. With streamed, strands setting every cell of a list
+    pass its new values to Cells.replace as a generator, so a list kept in a
+    MappedStorage isn't gathered in memory.
+
+    Functions are compiled into cache, a dict of path to function that runs
+    of the same program with the same question_first and streamed can share,
+    so a block hot in each of them is only compiled once.
+    """
+
+    def __init__(self, tree, threshold=DEFAULT_THRESHOLD, question_first=False, streamed=False, cache=None):
+        self.threshold = threshold
+        self.question_first = question_first
+        self.streamed = streamed
+        self.cache = {} if cache is None else cache
+        self.blocks = {}        # path -> block, for blocks that can be compiled
+        self.counts = {}        # path -> iterations interpreted
+        self.compiled = {}      # path -> compiled function, for blocks hot in this run
+        self.iterations_run = 0 # iterations run compiled
+        self.report = []        # a line for each block compiled
+        self.__find(tree)
+
+
+    def __find(self, block):
+        if all(isinstance(g, dict) for g in block) and self.__is_candidate(block):
+            self.blocks[block.path] = block
+        for g in block:
+            if not isinstance(g, dict):
+                self.__find(g)
+
+
+    @staticmethod
+    def __is_candidate(block):
+        repeats = False
+        for g in block:
+            for t in g["tokens"]:
+                if t["type"] == "question_marker":
+                    repeats = repeats or t["block_type"] == "while"
+                    if t["applies_to"] == "cell" and "ref_slot" in t:
+                        continue
+                    if t["applies_to"] == "list" and "ref_list_slot" in t:
+                        continue
+                    return False
+                # tokens the interpreter would fail on are left for it to report
+                if "slot" not in t:
+                    return False
+                if t["type"] == "touch":
+                    continue
+                action = t["action"]
+                command = action.get("command") if action else None
+                if action and action.get("subtype") == "list2list":
+                    if "ref_list_slot" not in t or command not in COMMANDS:
+                        return False
+                elif action and command not in COMMANDS and command not in MOVES:
+                    return False
+                if t["subtype"] == "ref" and "ref_slot" not in t:
+                    return False
+        return repeats
+
+
+    def count(self, path, iterations=1):
+        "Count iterations interpreted of the block at path, compiling it once it is hot"
+        counted = self.counts.get(path, 0) + iterations
+        self.counts[path] = counted
+        if counted >= self.threshold and path not in self.compiled:
+            self.compile(path, f"after {counted} iterations")
+
+
+    def compile(self, path, why):
+        "Compile the block at path, noting why in the report"
+        block = self.blocks[path]
+        function = self.cache.get(path)
+        if function is None:
+            function = self.cache[path] = compile_block(block, self.question_first, self.streamed)
+        self.compiled[path] = function
+        self.report.append(f"block at glyph {block.first} compiled {why}")
+
+
+    def run(self, path, state, snap, glyph_budget, repeat_budget):
+        """Run the compiled block at path from the start of an iteration
+
+        Stops at the start of an iteration that could take it to glyph_budget
+        glyphs, or once it has repeated repeat_budget times. Returns how it
+        stopped, the glyphs run, the times it repeated and, if paused, the
+        snapshot for the iteration it paused at.
+        """
+        result = self.compiled[path](state, snap, glyph_budget, repeat_budget)
+        self.iterations_run += result[2]
+        return result
+
+
+def compile_block(block, question_first=False, streamed=False):
+    "A Python function running a block of glyphs as the interpreter would"
+    constants = []
+    slots = sorted({s for g in block for t in g["tokens"]
+                    for s in (t.get("slot"), t.get("ref_slot"), t.get("ref_list_slot")) if s is not None})
+
+    def const(value):
+        if type(value) in (int, float) and repr(value) not in ("inf", "-inf", "nan"):
+            return repr(value)
+        constants.append(value)
+        return f"C[{len(constants) - 1}]"
+
+    w = _Writer()
+    w("def run(state, snap, glyph_budget, repeat_budget):")
+    w.depth += 1
+    w("lists = state.lists")
+    for slot in slots:
+        w(f"L{slot} = lists[{slot}]")
+    w("glyphs = repeats = 0")
+    w("while True:")
+    w.depth += 1
+    for g in block:
+        _glyph(w, g, const, block, question_first, streamed)
+    w(f"return {FINISHED}, glyphs, repeats, None")
+
+    namespace = {"C": constants, "RivuletSyntaxError": RivuletSyntaxError}
+    source = "\n".join(w.lines) + "\n"
+    exec(compile(source, f"<rivulet block at glyph {block.first}>", "exec"), namespace) # pylint: disable=exec-used
+    run = namespace["run"]
+    run.source = source
+    return run
+
+
+def _glyph(w, glyph, const, block, question_first, streamed):
+    w(f"# glyph {glyph['id']}")
+    if question_first and "guard" in glyph:
+        # the interpreter leaves no snapshot for an iteration its first glyph rolls back
+        w(f"if not {_test(glyph['guard'])}:")
+        w("    glyphs += 1")
+        w("    if snap is not None:")
+        w("        state.restore(snap)")
+        w(f"    return {ROLLED_BACK}, glyphs, repeats, None")
+    questions = [t for t in glyph["tokens"] if t["type"] == "question_marker"]
+    if questions:
+        w("act = 0")
+    for token in glyph["tokens"]:
+        if token["type"] == "question_marker":
+            _question(w, token)
+        elif token["type"] == "touch":
+            cells = f"L{token['slot']}"
+            w(f"if len({cells}) < {token['assign_to_cell']}:")
+            w("    raise IndexError('list index out of range')")
+            w(f"if len({cells}) < {token['length']}:")
+            w(f"    {cells}.extend([0] * ({token['length']} - len({cells})))")
+        else:
+            _data(w, token, const, streamed)
+    w("glyphs += 1")
+    if not questions:
+        return
+    w(f"if act == {ROLLED_BACK}:")
+    w("    state.restore(snap)")
+    w(f"    return {ROLLED_BACK}, glyphs, repeats, None")
+    if any(t["block_type"] == "while" for t in questions):
+        w(f"if act == {REPEATED}:")
+        w("    repeats += 1")
+        w(f"    snap = state.copy({block.saved!r})")
+        w(f"    if glyphs + {len(block)} >= glyph_budget or repeats >= repeat_budget:")
+        w(f"        return {REPEATED}, glyphs, repeats, snap")
+        w("    continue")
+
+
+def _test(token):
+    "The expression a question asks"
+    if token["applies_to"] == "cell":
+        return f"L{token['ref_slot']}[{token['ref_cell'][1]}] > 0"
+    return f"L{token['ref_list_slot']}.all_positive()"
+
+
+def _question(w, token):
+    succeeded = REPEATED if token["block_type"] == "while" else 0
+    w(f"act = {succeeded} if {_test(token)} else {ROLLED_BACK}")
+
+
+def _data(w, token, const, streamed):
+    "A value or ref strand, as Interpreter.__interpret_glyph runs it"
+    cells = f"L{token['slot']}"
+    action = token["action"]
+    command = action.get("command") if action else None
+    cell = token.get("assign_to_cell")
+    gathered = "({} for {})" if streamed else "[{} for {}]"
+
+    if "assign_to_cell" in token and command not in ("pop_and_append", "append"):
+        w(f"if len({cells}) == {cell}:")
+        w(f"    {cells}.append(0)")
+
+    # the source is kept in b, unless it is a constant written into the code
+    list2list = action is not None and action.get("subtype") == "list2list"
+    b = "None"
+    if list2list:
+        w(f"b = L{token['ref_list_slot']}")
+        b = "b"
+    if token["subtype"] == "value":
+        b = const(token["value"])
+        if list2list:
+            w(f"b = {b}")
+            b = "b"
+    elif token["subtype"] == "ref":
+        source = f"L{token['ref_slot']}"
+        ref = token["ref_cell"][1]
+        if not token.get("in_bounds"):
+            w(f"if {ref} >= len({source}):")
+            w("    raise RivuletSyntaxError('Cell reference out of bounds')")
+        w(f"b = {source}[{ref}]")
+        b = "b"
+
+    expr = COMMANDS.get(command, "")
+    if list2list:
+        expr = expr.format(a=f"{cells}[i]", b="b[i]")
+        w(f"{cells}.replace({gathered.format(expr, f'i in range(len({cells}))')})")
+    elif action is None:
+        w(f"{cells}[{cell}] += {b}")
+    elif command == "insert":
+        w(f"{cells}.insert({cell}, {b})")
+    elif command == "append":
+        w(f"{cells}.append({b})")
+    elif command == "pop":
+        w(f"{cells}[{cell}] += {b}")
+        if token["subtype"] == "ref":
+            w(f"L{token['ref_slot']}.pop({token['ref_cell'][1]})")
+    elif command == "pop_and_append":
+        w(f"{cells}.append(L{token['ref_slot']}.pop({token['ref_cell'][1]}))")
+    elif action["subtype"] == "list":
+        w(f"{cells}.replace({gathered.format(expr.format(a='a', b=b), f'a in {cells}')})")
+    else:
+        w(f"{cells}[{cell}] = {expr.format(a=f'{cells}[{cell}]', b=b)}")
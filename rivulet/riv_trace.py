@@ -0,0 +1,256 @@
+"Compact binary execution traces, recorded while running and formatted offline"
+from argparse import ArgumentParser
+import struct
+from rivulet.riv_exceptions import InternalError
+from rivulet.riv_parser import Parser
+from rivulet.riv_python_transpiler import PythonTranspiler
+
+MAGIC = b"RIVT"
+FORMAT_VERSION = 2
+
+# record kinds
+GLYPH = 1       # a glyph ran: id, iteration, then its writes
+ENTER = 2       # a block was entered (its state is snapshot)
+REPEAT = 3      # a while block starts another iteration (snapshot is replaced)
+EXIT = 4        # a block finished without rolling back
+ROLLBACK = 5    # a block was rolled back to its snapshot and exited
+
+# write operations within a GLYPH record
+SET = 1         # list[idx] = value
+INSERT = 2      # list.insert(idx, value)
+APPEND = 3      # list.append(value)
+POP = 4         # list.pop(idx)
+REPLACE = 5     # list[:] = values (list-wide commands)
+
+_HEADER = struct.Struct("<4sBI")
+_KIND = struct.Struct("<B")
+# iterations, write counts and cell indices have no bound a run must stay within
+_GLYPH = struct.Struct("<IQQ")
+_OP = struct.Struct("<BIQ")
+_UINT = struct.Struct("<I")
+_UINT64 = struct.Struct("<Q")
+_INT64 = struct.Struct("<q")
+_DOUBLE = struct.Struct("<d")
+_COMPLEX = struct.Struct("<dd")
+
+
+def _pack_value(value):
+    if isinstance(value, float):
+        return b"d" + _DOUBLE.pack(value)
+    if isinstance(value, complex):
+        return b"j" + _COMPLEX.pack(value.real, value.imag)
+    if -(1 << 63) <= value < (1 << 63):
+        return b"q" + _INT64.pack(value)
+    raw = value.to_bytes((value.bit_length() + 8) // 8, "little", signed=True)
+    return b"b" + _UINT.pack(len(raw)) + raw
+
+
+def _unpack_value(buf, pos):
+    tag = buf[pos:pos + 1]
+    pos += 1
+    if tag == b"q":
+        return _INT64.unpack_from(buf, pos)[0], pos + _INT64.size
+    if tag == b"d":
+        return _DOUBLE.unpack_from(buf, pos)[0], pos + _DOUBLE.size
+    if tag == b"j":
+        real, imag = _COMPLEX.unpack_from(buf, pos)
+        return complex(real, imag), pos + _COMPLEX.size
+    if tag == b"b":
+        size = _UINT.unpack_from(buf, pos)[0]
+        pos += _UINT.size
+        return int.from_bytes(buf[pos:pos + size], "little", signed=True), pos + size
+    raise InternalError(f"Unknown value tag {tag!r} in trace")
+
+
+class TraceRecorder:
+    """Writes trace records to a binary stream
+
+    The program source is stored in the header so the trace can be formatted
+    without the original file. Glyph records hold only the writes a glyph made;
+    block records let a reader replay rollbacks without storing full state.
+    """
+
+    def __init__(self, stream, program, lists):
+        self.stream = stream
+        source = program.encode("utf-8")
+        stream.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(source)))
+        stream.write(source)
+        stream.write(_UINT.pack(len(lists)))
+        for key in lists:
+            stream.write(_UINT.pack(key))
+
+
+    def glyph(self, glyph_id, iteration, writes):
+        "Record a glyph execution and the writes it made, as (op, list, idx, value) tuples"
+        parts = [_KIND.pack(GLYPH), _GLYPH.pack(glyph_id, iteration, len(writes))]
+        for op, lst, idx, value in writes:
+            parts.append(_OP.pack(op, lst, idx))
+            if op == REPLACE:
+                parts.extend(_pack_value(v) for v in value)
+            elif op != POP:
+                parts.append(_pack_value(value))
+        self.stream.write(b"".join(parts))
+
+
+    def enter(self, glyph_id):
+        "Record entry to the block starting at glyph_id"
+        self.stream.write(_KIND.pack(ENTER) + _UINT.pack(glyph_id))
+
+
+    def repeat(self, iteration):
+        "Record the start of another iteration of the innermost block"
+        self.stream.write(_KIND.pack(REPEAT) + _UINT64.pack(iteration))
+
+
+    def exit(self):
+        "Record the innermost block completing"
+        self.stream.write(_KIND.pack(EXIT))
+
+
+    def rollback(self, glyph_id):
+        "Record the innermost block rolling back, triggered by glyph_id"
+        self.stream.write(_KIND.pack(ROLLBACK) + _UINT.pack(glyph_id))
+
+
+class TraceReader:
+    "Reads a binary trace, replaying its writes to reconstruct state"
+
+    def __init__(self, data):
+        self.data = data
+        magic, version, size = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise InternalError("Not a Rivulet trace file")
+        if version != FORMAT_VERSION:
+            raise InternalError(f"Unsupported trace version {version}")
+        pos = _HEADER.size
+        self.program = data[pos:pos + size].decode("utf-8")
+        pos += size
+        count = _UINT.unpack_from(data, pos)[0]
+        pos += _UINT.size
+        self.lists = [_UINT.unpack_from(data, pos + i * _UINT.size)[0] for i in range(count)]
+        self.start = pos + count * _UINT.size
+
+
+    def records(self):
+        """Yield each record as a (kind, info, state) tuple, where state is
+        the reconstructed state after the record was applied"""
+        data = self.data
+        state = {key: [] for key in self.lists}
+        snapshots = []
+        pos = self.start
+        while pos < len(data):
+            kind = data[pos]
+            pos += 1
+            if kind == GLYPH:
+                glyph_id, iteration, count = _GLYPH.unpack_from(data, pos)
+                pos += _GLYPH.size
+                writes = []
+                for _ in range(count):
+                    op, lst, idx = _OP.unpack_from(data, pos)
+                    pos += _OP.size
+                    value = None
+                    if op == REPLACE:
+                        value = []
+                        for _ in range(idx):
+                            v, pos = _unpack_value(data, pos)
+                            value.append(v)
+                    elif op != POP:
+                        value, pos = _unpack_value(data, pos)
+                    self._apply(state, op, lst, idx, value)
+                    writes.append((op, lst, idx, value))
+                yield GLYPH, (glyph_id, iteration, writes), state
+            elif kind in (ENTER, REPEAT, ROLLBACK):
+                size = _UINT64 if kind == REPEAT else _UINT
+                arg = size.unpack_from(data, pos)[0]
+                pos += size.size
+                if kind == ENTER:
+                    snapshots.append({k: list(v) for k, v in state.items()})
+                elif kind == REPEAT:
+                    snapshots[-1] = {k: list(v) for k, v in state.items()}
+                else:
+                    for k, v in snapshots.pop().items():
+                        state[k][:] = v
+                yield kind, arg, state
+            elif kind == EXIT:
+                snapshots.pop()
+                yield kind, None, state
+            else:
+                raise InternalError(f"Unknown record kind {kind} in trace")
+
+
+    @staticmethod
+    def _apply(state, op, lst, idx, value):
+        if op == SET:
+            state[lst][idx] = value
+        elif op == INSERT:
+            state[lst].insert(idx, value)
+        elif op == APPEND:
+            state[lst].append(value)
+        elif op == POP:
+            state[lst].pop(idx)
+        elif op == REPLACE:
+            state[lst][:] = value
+        else:
+            raise InternalError(f"Unknown write op {op} in trace")
+
+
+def describe_writes(writes):
+    "Summarize a glyph record's writes in pseudo-code"
+    parts = []
+    for op, lst, idx, value in writes:
+        if op == SET:
+            parts.append(f"list{lst}[{idx}] = {value}")
+        elif op == INSERT:
+            parts.append(f"list{lst} insert {value} at {idx}")
+        elif op == APPEND:
+            parts.append(f"list{lst} append {value}")
+        elif op == POP:
+            parts.append(f"list{lst} pop {idx}")
+        else:
+            parts.append(f"list{lst} = {value}")
+    return "; ".join(parts)
+
+
+def show(data, with_state=False):
+    "Format a trace, printing each glyph's source and pseudo-code once"
+    reader = TraceReader(data)
+    glyphs = Parser().parse_program(reader.program)
+    debug = PythonTranspiler()
+    shown = set()
+    depth = 0
+
+    for kind, info, state in reader.records():
+        if kind == GLYPH:
+            glyph_id, iteration, writes = info
+            if glyph_id not in shown:
+                shown.add(glyph_id)
+                print(f"glyph {glyph_id}")
+                print(debug.glyph_drawn(glyphs[glyph_id]["glyph"]), end="")
+                print(debug.glyph_pseudo(glyphs[glyph_id]))
+            print(f"{'  ' * depth}glyph {glyph_id} iter {iteration}: {describe_writes(writes)}")
+            if with_state:
+                print(f"{'  ' * depth}{state}")
+        elif kind == ENTER:
+            depth += 1
+        elif kind == REPEAT:
+            print(f"{'  ' * depth}repeat (iteration {info})")
+        elif kind == EXIT:
+            depth -= 1
+        elif kind == ROLLBACK:
+            print(f"{'  ' * depth}rollback at glyph {info}")
+            depth -= 1
+
+
+def main(argv):
+    "Entry point for `riv trace`"
+    arg_parser = ArgumentParser(prog="riv trace", description="Inspect Rivulet execution traces")
+    sub = arg_parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show", help="print a trace recorded with --trace")
+    show_parser.add_argument("tracefile", type=str, help="trace file")
+    show_parser.add_argument("--state", dest="state", action="store_true", default=False,
+                             help="print the full reconstructed state after each glyph")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.tracefile, "rb") as file:
+        data = file.read()
+    show(data, args.state)
@@ -0,0 +1,28 @@
+# pylint: skip-file
+"""
+Tokens and glyphs as the parser makes them, to build programs in tests
+"""
+from rivulet.riv_parser import Parser
+
+def value(lst, cell, val, command=None, subtype="element"):
+    action = {"command": command, "subtype": subtype} if command else None
+    return {"type": "data", "subtype": "value", "list": lst, "assign_to_cell": cell,
+            "value": val, "action": action}
+
+def ref(lst, cell, ref_cell, command=None, subtype="element"):
+    action = {"command": command, "subtype": subtype} if command else None
+    return {"type": "data", "subtype": "ref", "list": lst, "assign_to_cell": cell,
+            "ref_cell": list(ref_cell), "value": None, "action": action}
+
+def question(ref_cell, block_type):
+    return {"type": "question_marker", "subtype": "first", "applies_to": "cell",
+            "ref_cell": list(ref_cell), "block_type": block_type, "action": None}
+
+# a program of glyphs of list_size 4 has lists 1, 2, 3 and 5; of 5, list 7 too
+def glyph(level, *tokens, list_size=4):
+    return {"level": level, "tokens": list(tokens), "glyph": [[" "]], "list_size": list_size}
+
+def parse_as(monkeypatch, glyphs):
+    "Parse every program as glyphs, or as a new list of them from glyphs() if it is callable"
+    parsed = glyphs if callable(glyphs) else lambda: glyphs
+    monkeypatch.setattr(Parser, "parse_program", lambda self, program: parsed())
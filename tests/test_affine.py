@@ -0,0 +1,60 @@
+# pylint: skip-file
+"""
+Test closed-form execution of affine while loops
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from helpers import glyph, parse_as, question, ref, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def fibonacci_counter(n):
+    "list3 holds a Fibonacci pair, stepped n - 1 times by a loop counting list2[0] down from n"
+    return [
+        glyph(1, value(2, 0, n), value(3, 0, 0), value(3, 1, 1), value(5, 0, 0)),
+        glyph(2, ref(5, 0, (3, 0), "overwrite"), ref(3, 0, (3, 1), "overwrite"), ref(3, 1, (5, 0)),
+              value(2, 0, -1), question((2, 0), "while")),
+    ]
+
+def run(glyphs, monkeypatch, closed_form=True):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.closed_form = closed_form
+    return intr, intr.interpret_program("", False, "default")
+
+def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+@pytest.mark.parametrize("n", [1, 2, 3, 30])
+def test_closed_form_matches_interpreted(n, monkeypatch):
+    _, expected = run(fibonacci_counter(n), monkeypatch, closed_form=False)
+    intr, state = run(fibonacci_counter(n), monkeypatch)
+
+    assert state == expected
+    assert intr.affine.loops_run == 1
+
+def test_counted_loop_uses_matrix_power(monkeypatch):
+    n = 100_000
+    intr, state = run(fibonacci_counter(n), monkeypatch)
+
+    assert state[3][0] == fib(n - 1)
+    assert state[2] == [1]
+    assert intr.affine.iterations_run == n
+    assert all(plan.step is not None for plan in intr.affine.plans.values() if plan)
+
+def test_nonlinear_loop_is_interpreted(monkeypatch):
+    glyphs = fibonacci_counter(5)
+    glyphs[1]["tokens"][2] = ref(3, 1, (5, 0), "multiplication_assignment")
+    intr, _ = run(glyphs, monkeypatch)
+    assert intr.affine.loops_run == 0
+
+@pytest.mark.parametrize("progfile", sorted(PROGRAMS.glob("*.riv")))
+def test_closed_form_does_not_change_programs(progfile):
+    plain = Interpreter()
+    plain.closed_form = False
+    expected = plain.interpret_file(progfile, False, "default")
+    assert Interpreter().interpret_file(progfile, False, "default") == expected
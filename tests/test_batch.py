@@ -0,0 +1,55 @@
+# pylint: skip-file
+"""
+Test running programs in batches over worker processes
+"""
+import io
+import json
+from pathlib import Path
+from rivulet.riv_batch import find_programs, run_batch, run_one
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_parser import Parser
+from helpers import glyph, parse_as, question, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# a while loop on a cell that never changes
+endless = [glyph(1, value(2, 0, 1)), glyph(2, value(3, 0, 1), question((2, 0), "while"))]
+
+def manifest_of(programs, **kwargs):
+    out = io.StringIO()
+    counts = run_batch(programs, out, **kwargs)
+    return counts, [json.loads(line) for line in out.getvalue().splitlines()]
+
+def test_batch_matches_single_runs():
+    programs = find_programs([PROGRAMS])
+    counts, records = manifest_of(programs, jobs=2)
+
+    assert counts == {"ok": len(programs)}
+    assert sorted(r["program"] for r in records) == sorted(str(p) for p in programs)
+    for record in records:
+        expected = Interpreter().interpret_file(record["program"], False, "default")
+        assert record["list1"] == expected[1]
+        assert record["state"]["lengths"] == {str(k): len(v) for k, v in expected.items()}
+        assert record["glyphs_run"] > 0
+
+def test_missing_program_is_an_error():
+    counts, records = manifest_of([PROGRAMS / "missing.riv"], jobs=1)
+    assert counts == {"error": 1}
+    assert "missing.riv" in records[0]["error"]
+
+def test_step_limit(monkeypatch):
+    parse_as(monkeypatch, endless)
+    record = run_one(PROGRAMS / "zero.riv", Parser(), max_glyphs=100)
+    assert record["status"] == "step_limit"
+    assert record["glyphs_run"] >= 100
+
+def test_hung_worker_is_replaced(monkeypatch):
+    hang = PROGRAMS / "zero.riv"
+    parse = Parser.parse_program
+    monkeypatch.setattr(Parser, "parse_program",
+                        lambda self, program: endless if program == hang.read_text() else parse(self, program))
+
+    counts, records = manifest_of([hang, PROGRAMS / "fibonacci1.riv", PROGRAMS / "fibonacci2.riv"],
+                                  jobs=1, timeout=0.5)
+    assert counts == {"timeout": 1, "ok": 2}
+    assert records[0]["program"] == str(hang)
@@ -0,0 +1,48 @@
+# pylint: skip-file
+"""
+Test building the block tree of a program
+"""
+from pathlib import Path
+from rivulet.riv_blocks import Block, build_blocks
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_parser import Parser
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def glyphs_at(*levels):
+    return [{"id": idx, "level": level} for idx, level in enumerate(levels)]
+
+def test_blocks_hold_the_glyphs_themselves():
+    glyphs = glyphs_at(1, 3, 2, 2, 3, 3, 1)
+    tree = build_blocks(glyphs)
+
+    assert tree.to_lists() == Interpreter().treeify_glyphs(list(glyphs), 1, [])
+    assert tree[0] is glyphs[0]
+    assert tree[1][1] is glyphs[2]
+    assert isinstance(tree[1], Block) and isinstance(tree[1][0], Block)
+
+def test_entry_and_exit_links():
+    tree = build_blocks(glyphs_at(1, 3, 2, 2, 3, 3, 1))
+
+    outer, first_inner, second_inner = tree[1], tree[1][0], tree[1][3]
+    assert (tree.path, outer.path, first_inner.path, second_inner.path) == ((), (1,), (1, 0), (1, 3))
+    assert (outer.level, first_inner.level) == (1, 2)
+    assert (outer.first, first_inner.first, second_inner.first) == (1, 1, 4)
+    assert (first_inner.following, second_inner.following, outer.following) == (2, 6, 6)
+    assert tree.first == 0 and tree.following is None
+
+def test_long_programs_build_without_recursion():
+    levels = [1 + (i % 7) for i in range(20000)]
+    tree = build_blocks(glyphs_at(*levels))
+    assert len(tree) == 20000 // 7 * 2 + 1
+
+def test_same_program_is_parsed_once(monkeypatch):
+    parse = Parser.parse_program
+    calls = []
+    monkeypatch.setattr(Parser, "parse_program", lambda self, program: calls.append(program) or parse(self, program))
+
+    program = (PROGRAMS / "fibonacci1.riv").read_text(encoding="utf-8")
+    intr = Interpreter()
+    first = intr.interpret_program(program, False, "default")
+    assert intr.interpret_program(program, False, "default") == first
+    assert len(calls) == 1
@@ -0,0 +1,80 @@
+# pylint: skip-file
+"""
+Test static analysis of list lengths and cell references
+"""
+import pytest
+from rivulet.riv_blocks import build_blocks
+from rivulet.riv_bounds import BoundsAnalysis
+from rivulet.riv_exceptions import RivuletSyntaxError
+from rivulet.riv_interpreter import Interpreter
+from helpers import glyph, parse_as, question, ref, value
+
+LISTS = [1, 2, 3, 5]
+
+def analyze(glyphs):
+    for idx, g in enumerate(glyphs):
+        g["id"] = idx
+    return BoundsAnalysis(LISTS).analyze(build_blocks(glyphs))
+
+def test_reference_after_cell_is_created():
+    read = ref(3, 0, (2, 1))
+    assert analyze([glyph(1, value(2, 1, 4)), glyph(1, read)]) == []
+    assert read["in_bounds"]
+
+def test_loop_invariant_length():
+    # list3 gets two cells before the loop, which only changes their values
+    read = ref(2, 0, (3, 1))
+    analyze([glyph(1, value(3, 1, 1), value(5, 0, 3)),
+             glyph(2, read, value(5, 0, -1), question((5, 0), "while"))])
+    assert read["in_bounds"]
+
+def test_loop_that_pops_loses_the_bound():
+    read = ref(2, 0, (3, 0))
+    popping = ref(5, 0, (3, 0), "pop")
+    analyze([glyph(1, value(3, 2, 1), value(5, 0, 3)),
+             glyph(2, read, popping, question((5, 0), "while"))])
+    assert not read["in_bounds"]
+    assert not popping["in_bounds"]
+
+def test_appends_in_a_loop_keep_the_lower_bound():
+    read = ref(2, 0, (3, 1))
+    analyze([glyph(1, value(3, 1, 1), value(5, 0, 3)),
+             glyph(2, value(3, 0, 1, "append"), read, value(5, 0, -1), question((5, 0), "while"))])
+    assert read["in_bounds"]
+
+def test_insert_past_the_end_adds_one_cell(monkeypatch):
+    # list3 is empty, so the insert at cell 5 goes to the end: list3 has one cell, not six
+    first, past = ref(2, 0, (3, 0)), ref(2, 0, (3, 1))
+    glyphs = [glyph(1, value(3, 5, 7, "insert")), glyph(1, first), glyph(1, past)]
+    assert analyze(glyphs) == []
+    assert first["in_bounds"] and not past["in_bounds"]
+
+    parse_as(monkeypatch, glyphs)
+    with pytest.raises(RivuletSyntaxError, match="Cell reference out of bounds"):
+        Interpreter().interpret_program("", False, "default")
+
+def test_rolled_back_block_restores_its_lengths():
+    # the block appends, then always rolls back, so list3 is empty after it
+    read = ref(2, 0, (3, 0))
+    report = analyze([glyph(1, value(5, 0, 0)),
+                      glyph(2, value(3, 0, 1, "append"), question((5, 0), "if")),
+                      glyph(1, read)])
+    assert not read["in_bounds"]
+    assert report == []
+
+def test_references_never_in_range_are_reported(monkeypatch):
+    glyphs = [glyph(1, value(3, 0, 1)), glyph(1, ref(2, 0, (3, 4))), glyph(1, ref(2, 0, (7, 0)))]
+    report = analyze(glyphs)
+    assert report == ["glyph 1: reference to cell 4 of list 3, which has at most 1 cells there",
+                      "glyph 2: reference to list 7, which the program has no line for"]
+
+    parse_as(monkeypatch, glyphs)
+    assert Interpreter().check_program("") == report
+    with pytest.raises(RivuletSyntaxError, match="Cell reference out of bounds"):
+        Interpreter().interpret_program("", False, "default")
+
+def test_missing_list_reference_raises(monkeypatch):
+    glyphs = [glyph(1, ref(2, 0, (7, 0)))]
+    parse_as(monkeypatch, glyphs)
+    with pytest.raises(RivuletSyntaxError, match="List reference out of bounds"):
+        Interpreter().interpret_program("", False, "default")
@@ -0,0 +1,93 @@
+# pylint: skip-file
+"""
+Test the on-disk cache of the final states of program runs
+"""
+import os
+from pathlib import Path
+import pytest
+from rivulet.riv_cache import ResultCache
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from rivulet.riv_parser import Parser
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def source(name="fibonacci1.riv"):
+    return (PROGRAMS / name).read_text(encoding="utf-8")
+
+def cached_interpreter(directory, max_bytes=1 << 20):
+    intr = Interpreter()
+    intr.results = ResultCache(directory, max_bytes)
+    return intr
+
+def count_parses(monkeypatch):
+    parses = []
+    parse_program = Parser.parse_program
+    def counting(self, program):
+        parses.append(program)
+        return parse_program(self, program)
+    monkeypatch.setattr(Parser, "parse_program", counting)
+    return parses
+
+def test_hit_answers_without_running(tmp_path, monkeypatch):
+    expected = Interpreter().interpret_program(source(), False, None)
+    assert cached_interpreter(tmp_path).interpret_program(source(), False, None) == expected
+
+    parses = count_parses(monkeypatch)
+    intr = cached_interpreter(tmp_path)
+    assert intr.interpret_program(source(), False, None) == expected
+    assert parses == []
+    assert intr.opt_report == ["result read from the cache; the program was not run"]
+
+def test_entry_holds_state_and_output(tmp_path):
+    intr = cached_interpreter(tmp_path)
+    state = intr.interpret_program(source(), False, None)
+    entry = intr.results.get(intr.result_key(source()))
+    assert entry == {"state": state, "output": [0, 1, 1, 2, 3, 5, 8, 13]}
+
+def test_options_that_change_a_run_are_in_the_key(tmp_path):
+    intr = Interpreter()
+    key = intr.result_key(source())
+    intr.memoize = intr.closed_form = intr.tier = False
+    assert intr.result_key(source()) == key
+    intr.limits = Limits(max_glyphs=5)
+    assert intr.result_key(source()) != key
+    intr.limits = Limits()
+    intr.question_first = True
+    assert intr.result_key(source()) != key
+    assert intr.result_key(source("fibonacci2.riv")) != intr.result_key(source())
+    assert ResultCache.key("program", "0.4", {}) != ResultCache.key("program", "0.5", {})
+
+def test_watched_runs_bypass_the_cache(tmp_path):
+    intr = cached_interpreter(tmp_path)
+    intr.interpret_program(source(), True, None)
+    intr.on_glyph(lambda *args: None)
+    intr.interpret_program(source(), False, None)
+    assert list(tmp_path.iterdir()) == []
+
+def test_complex_values_round_trip(tmp_path):
+    cache = ResultCache(tmp_path)
+    state = {1: [1, 2.5, float("inf")], 2: [(-1) ** 0.5]}
+    cache.put("k", state)
+    assert cache.get("k") == {"state": state, "output": [1, 2.5, float("inf")]}
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = ResultCache(tmp_path)
+    assert cache.get("missing") is None
+    (tmp_path / "broken.json").write_text("{not json", encoding="utf-8")
+    assert cache.get("broken") is None
+
+def test_least_recently_used_is_evicted(tmp_path):
+    state = {1: list(range(100))}
+    size = len('{"state": {"1": %s}, "output": %s}' % (state[1], state[1]))
+    cache = ResultCache(tmp_path, max_bytes=size * 2)
+    cache.put("a", state)
+    cache.put("b", state)
+    os.utime(tmp_path / "a.json", (1000, 1000))
+    os.utime(tmp_path / "b.json", (2000, 2000))
+    assert cache.get("a") is not None   # a is now more recently used than b
+    cache.put("c", state)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    cache.clear()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,91 @@
+# pylint: skip-file
+"""
+Test saving and resuming interpretations from checkpoints
+"""
+import os
+from pathlib import Path
+import pickle
+import zlib
+import pytest
+from rivulet.riv_exceptions import CheckpointError
+from rivulet import riv_execution
+from rivulet.riv_execution import Execution
+from rivulet.riv_interpreter import Interpreter
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+class Interrupted(Exception):
+    pass
+
+def interrupt_after_saves(monkeypatch, count):
+    save = Execution.save
+    saves = 0
+
+    def save_then_stop(self, path):
+        nonlocal saves
+        save(self, path)
+        saves += 1
+        if saves == count:
+            raise Interrupted()
+
+    monkeypatch.setattr(Execution, "save", save_then_stop)
+
+@pytest.mark.parametrize("saves", [1, 3, 5])
+def test_resume_matches_uninterrupted_run(saves, tmp_path, monkeypatch):
+    progfile = PROGRAMS / "fibonacci1.riv"
+    checkpoint = tmp_path / "fib.ckpt"
+    expected = Interpreter().interpret_file(progfile, False, "default")
+
+    with monkeypatch.context() as m:
+        interrupt_after_saves(m, saves)
+        with pytest.raises(Interrupted):
+            Interpreter().interpret_file(progfile, False, "default",
+                                         checkpoint_file=checkpoint, checkpoint_every=5)
+
+    resumed = Interpreter().interpret_file(progfile, False, "default",
+                                           checkpoint_file=checkpoint, resume=True)
+    assert resumed == expected
+
+def test_checkpoint_rejected_for_other_program(tmp_path, monkeypatch):
+    checkpoint = tmp_path / "fib.ckpt"
+
+    with monkeypatch.context() as m:
+        interrupt_after_saves(m, 1)
+        with pytest.raises(Interrupted):
+            Interpreter().interpret_file(PROGRAMS / "fibonacci1.riv", False, "default",
+                                         checkpoint_file=checkpoint, checkpoint_every=5)
+
+    with pytest.raises(CheckpointError) as err:
+        Interpreter().interpret_file(PROGRAMS / "zero.riv", False, "default",
+                                     checkpoint_file=checkpoint, resume=True)
+    assert "different program" in str(err.value)
+
+def test_checkpoint_rejects_other_files(tmp_path):
+    checkpoint = tmp_path / "not.ckpt"
+    checkpoint.write_bytes(b"not a checkpoint at all, but long enough to have a header")
+
+    with pytest.raises(CheckpointError):
+        Interpreter().interpret_file(PROGRAMS / "zero.riv", False, "default",
+                                     checkpoint_file=checkpoint, resume=True)
+
+class Runs:
+    def __reduce__(self):
+        return (os.system, ("exit 0",))
+
+def test_checkpoint_holding_other_objects_is_refused(tmp_path, monkeypatch):
+    checkpoint = tmp_path / "fib.ckpt"
+    with monkeypatch.context() as m:
+        interrupt_after_saves(m, 1)
+        with pytest.raises(Interrupted):
+            Interpreter().interpret_file(PROGRAMS / "fibonacci1.riv", False, "default",
+                                         checkpoint_file=checkpoint, checkpoint_every=5)
+    header = checkpoint.read_bytes()[:riv_execution._HEADER.size]
+    checkpoint.write_bytes(header + zlib.compress(pickle.dumps({"state": Runs()})))
+
+    systems = []
+    monkeypatch.setattr(os, "system", systems.append)
+    with pytest.raises(CheckpointError) as err:
+        Interpreter().interpret_file(PROGRAMS / "fibonacci1.riv", False, "default",
+                                     checkpoint_file=checkpoint, resume=True)
+    assert "system" in str(err.value)
+    assert systems == []
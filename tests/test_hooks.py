@@ -0,0 +1,67 @@
+# pylint: skip-file
+"""
+Test the hooks embedders register to observe a running program
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from rivulet import riv_trace
+from rivulet.riv_trace import TraceReader
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def trace_records(progfile, tmp_path):
+    tracefile = tmp_path / "trace.bin"
+    Interpreter().interpret_file(PROGRAMS / progfile, False, "default", tracefile)
+    return [(kind, info) for kind, info, _ in TraceReader(tracefile.read_bytes()).records()]
+
+@pytest.mark.parametrize("progfile", ["fibonacci1.riv", "fibonacci3.riv"])
+def test_hooks_see_what_a_trace_records(progfile, tmp_path):
+    records = trace_records(progfile, tmp_path)
+    intr = Interpreter()
+    glyphs, writes, rollbacks, iterations = [], [], [], []
+    intr.on_glyph(lambda glyph, iteration, action: glyphs.append((glyph, iteration)))
+    intr.on_write(lambda glyph, *write: writes.append(write))
+    intr.on_rollback(rollbacks.append)
+    intr.on_iteration(lambda glyph, iteration: iterations.append(iteration))
+    state = intr.interpret_file(PROGRAMS / progfile, False, "default")
+
+    assert state == Interpreter().interpret_file(PROGRAMS / progfile, False, "default")
+    assert glyphs == [info[:2] for kind, info in records if kind == riv_trace.GLYPH]
+    assert writes == [tuple(w) for kind, info in records if kind == riv_trace.GLYPH for w in info[2]]
+    assert rollbacks == [info for kind, info in records if kind == riv_trace.ROLLBACK]
+    assert iterations == [info for kind, info in records if kind == riv_trace.REPEAT]
+    assert rollbacks and iterations
+
+def test_glyph_hook_gets_action():
+    intr = Interpreter()
+    actions = []
+    intr.on_glyph(lambda glyph, iteration, action: actions.append(action))
+    intr.interpret_file(PROGRAMS / "fibonacci1.riv", False, "default")
+    assert set(actions) == set(Interpreter.Action)
+
+def test_only_hooked_events_are_collected():
+    intr = Interpreter()
+    rollbacks = []
+    intr.on_rollback(rollbacks.append)
+    intr.interpret_file(PROGRAMS / "fibonacci1.riv", False, "default")
+    assert rollbacks
+    # writes aren't hooked, so the program is still optimized
+    assert intr.opt_report
+
+    intr.on_write(lambda *write: None)
+    intr.interpret_file(PROGRAMS / "fibonacci1.riv", False, "default")
+    assert intr.opt_report == []
+
+def test_removed_hook_is_not_called():
+    intr = Interpreter()
+    calls = []
+    callback = intr.on_glyph(lambda *args: calls.append(args))
+    intr.hooks.remove(callback)
+    assert not intr.hooks.active
+    intr.interpret_file(PROGRAMS / "fibonacci1.riv", False, "default")
+    assert calls == []
+
+def test_unknown_event_is_an_error():
+    with pytest.raises(ValueError):
+        Interpreter().hooks.add("exit", print)
@@ -3,6 +3,7 @@
 Test glyph full parsing
 """
 import copy
+from pathlib import Path
 import pytest
 from rivulet.riv_interpreter import Interpreter
 
@@ -46,3 +47,10 @@ def test_treeify_1_3_2_2_3_3_1():
 
     assert len(tree[1][0]) == 1
     assert len(tree[1][3]) == 2
+
+def test_rollback_restores_last_iteration():
+    intr = Interpreter()
+    state = intr.interpret_file(Path(__file__).parent.parent / "programs" / "fibonacci1.riv", False, "default")
+    # the final iteration of the while block is undone, leaving its counter positive
+    assert state[1] == [0, 1, 1, 2, 3, 5, 8, 13]
+    assert state[3][2] > 0
@@ -0,0 +1,89 @@
+# pylint: skip-file
+"""
+Test limits on the glyphs, iterations, cell sizes, cells and time a program may use
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_exceptions import LimitExceededError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from helpers import glyph, parse_as, question, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# a while loop on a cell that never changes, appending to list3 each time
+endless = [
+    glyph(1, value(2, 0, 1)),
+    glyph(2, value(3, 0, 1, "append"), question((2, 0), "while")),
+]
+
+# squares list2[0] each iteration, doubling its bit length
+squaring = [
+    glyph(1, value(2, 0, 3)),
+    glyph(2, value(2, 0, 2, "exponent_assignment"), question((2, 0), "while")),
+]
+
+def run(glyphs, monkeypatch, **limits):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.limits = Limits(**limits)
+    return intr.interpret_program("", False, "default")
+
+@pytest.mark.parametrize("limit, allowed", [
+    ("max_glyphs", 5000),
+    ("max_iterations", 100),
+    ("max_cells", 2000),
+    ("max_seconds", 0.05),
+])
+def test_endless_loop_is_stopped(limit, allowed, monkeypatch):
+    with pytest.raises(LimitExceededError) as err:
+        run(endless, monkeypatch, **{limit: allowed})
+    assert err.value.limit == limit
+    assert err.value.allowed == allowed
+    assert err.value.glyph == 1
+    assert limit in str(err.value) and "glyph 1" in str(err.value)
+
+def test_glyph_limit_is_exact(monkeypatch):
+    with pytest.raises(LimitExceededError):
+        run(endless, monkeypatch, max_glyphs=101)
+    # the first glyph and 50 iterations of the loop
+    run(endless[:1] + [glyph(2, value(3, 0, 1, "append"), value(2, 0, -1), question((2, 0), "while"))],
+        monkeypatch, max_glyphs=51)
+
+def test_exponent_is_stopped_before_it_is_computed(monkeypatch):
+    with pytest.raises(LimitExceededError) as err:
+        run(squaring, monkeypatch, max_bits=1 << 20)
+    assert err.value.limit == "max_bits"
+    assert err.value.glyph == 1
+
+def test_limits_not_reached():
+    progfile = PROGRAMS / "fibonacci1.riv"
+    expected = Interpreter().interpret_file(progfile, False, "default")
+    intr = Interpreter()
+    intr.limits = Limits(max_glyphs=1000, max_iterations=100, max_bits=64, max_cells=100, max_seconds=10)
+    assert intr.interpret_file(progfile, False, "default") == expected
+
+def test_closed_form_loops_respect_limits(monkeypatch):
+    # counts list2[0] down from a million: run in closed form unless limited
+    countdown = [
+        glyph(1, value(2, 0, 1000000)),
+        glyph(2, value(3, 0, 1), value(2, 0, -1), question((2, 0), "while")),
+    ]
+    assert run(countdown, monkeypatch)[3] == [999999]
+    assert run(countdown, monkeypatch, max_iterations=2000000)[3] == [999999]
+    with pytest.raises(LimitExceededError) as err:
+        run(countdown, monkeypatch, max_iterations=1000)
+    assert err.value.limit == "max_iterations"
+
+@pytest.mark.parametrize("closed_form", [True, False])
+def test_iteration_limit_counts_iterations_run_before_closed_form(closed_form):
+    # the loop's first iteration is interpreted, the rest run in closed form; it repeats 7 times
+    progfile = PROGRAMS / "fibonacci1.riv"
+    intr = Interpreter()
+    intr.closed_form = closed_form
+    intr.tier = intr.memoize = False
+    intr.limits = Limits(max_iterations=7)
+    with pytest.raises(LimitExceededError, match="max_iterations"):
+        intr.interpret_file(progfile, False, "default")
+    intr.limits = Limits(max_iterations=8)
+    assert intr.interpret_file(progfile, False, "default")[1] == [0, 1, 1, 2, 3, 5, 8, 13]
@@ -0,0 +1,72 @@
+# pylint: skip-file
+"""
+Test finding while blocks that loop forever from repeated states
+"""
+from collections import deque
+import random
+import pytest
+from rivulet.riv_exceptions import InfiniteLoopError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_state import Cells, State
+from helpers import glyph, parse_as, question, value
+
+def run(glyphs, monkeypatch, detect_loops=True):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.detect_loops = detect_loops
+    return intr.interpret_program("", False, "default")
+
+# list3[0] flips sign each iteration, while list2[0] stays 1
+flipping = [
+    glyph(1, value(2, 0, 1), value(3, 0, 5)),
+    glyph(2, value(3, 0, -1, "multiplication_assignment"), question((2, 0), "while")),
+]
+
+def test_repeating_state_is_an_infinite_loop(monkeypatch):
+    with pytest.raises(InfiniteLoopError) as err:
+        run(flipping, monkeypatch)
+    assert err.value.glyph == 1
+    assert err.value.period == 2
+    assert err.value.iteration < 10
+    assert "glyph 1" in str(err.value)
+
+def test_unchanging_state_is_an_infinite_loop(monkeypatch):
+    glyphs = [glyph(1, value(2, 0, 1)), glyph(2, value(3, 0, 4, "overwrite"), question((2, 0), "while"))]
+    with pytest.raises(InfiniteLoopError) as err:
+        run(glyphs, monkeypatch)
+    assert err.value.period == 1
+
+def test_ending_loops_are_not_stopped(monkeypatch):
+    countdown = [glyph(1, value(2, 0, 500)), glyph(2, value(3, 0, 1), value(2, 0, -1), question((2, 0), "while"))]
+    assert run(countdown, monkeypatch) == run(countdown, monkeypatch, False)
+
+def test_hash_collisions_are_confirmed(monkeypatch):
+    monkeypatch.setattr(State, "digest", lambda self: 0)
+    countdown = [glyph(1, value(2, 0, 500)), glyph(2, value(3, 0, 1), value(2, 0, -1), question((2, 0), "while"))]
+    assert run(countdown, monkeypatch)[3] == [499]
+    with pytest.raises(InfiniteLoopError):
+        run(flipping, monkeypatch)
+
+def test_zobrist_hash_follows_every_write():
+    rng = random.Random(5)
+    cells = Cells(range(40))
+    cells.digest()
+    for _ in range(2000):
+        op = rng.randrange(6)
+        if op == 0 and len(cells):
+            cells[rng.randrange(len(cells))] = rng.choice([rng.randrange(-5, 5), 2.0, 1 << 70])
+        elif op == 1:
+            cells.append(rng.randrange(10))
+        elif op == 2:
+            cells.insert(rng.randrange(len(cells) + 2), rng.randrange(10))
+        elif op == 3 and len(cells):
+            cells.pop(rng.choice([-1, len(cells) - 1, 0, rng.randrange(len(cells))]))
+        elif op == 4:
+            cells.extend([1, 2])
+        elif op == 5 and rng.random() < 0.05:
+            cells.replace([v * 2 for v in cells])
+        assert cells.digest() == Cells(cells).digest()
+    assert type(cells.data) in (list, deque) or cells.data.typecode
+
+def test_ints_and_floats_hash_differently():
+    assert Cells([2]).digest() != Cells([2.0]).digest()
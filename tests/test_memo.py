@@ -0,0 +1,96 @@
+# pylint: skip-file
+"""
+Test read/write-set analysis and memoization of nested blocks
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_analysis import analyze_blocks
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_memo import MAX_MISSES, MAX_WHOLE_CELLS
+from helpers import glyph, parse_as, question, ref, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# a while loop counting list2[0] down from 5, holding a sub-block that only overwrites
+loop_with_constant_block = [
+    glyph(1, value(2, 0, 5)),
+    glyph(2, value(3, 0, 1)),
+    glyph(3, value(7, 0, 4, "overwrite"), list_size=5),
+    glyph(2, value(2, 0, -1), question((2, 0), "while")),
+]
+
+def run(glyphs, monkeypatch, memoize=True, memo_size=16):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.memoize = memoize
+    intr.memo_size = memo_size
+    return intr, intr.interpret_program("", False, "default")
+
+def test_block_read_write_sets():
+    tree = Interpreter().treeify_glyphs(list(loop_with_constant_block), 1, [])
+    effects = analyze_blocks(tree)
+
+    inner = effects[(1, 1)]
+    assert inner.cells_read == ()
+    assert inner.cells_written == ((7, 0),)
+    assert inner.sized == (7,)
+
+    # the loop's final iteration rolls back, leaving the cells it writes as they were on entry
+    loop = effects[(1,)]
+    assert loop.cells_read == ((2, 0), (3, 0), (7, 0))
+    assert loop.cells_written == ((2, 0), (3, 0), (7, 0))
+    assert loop.whole == ()
+
+def test_moving_cells_are_tracked_by_list():
+    glyphs = [glyph(1, value(2, 0, 1, "insert"), ref(3, 0, (2, 1)))]
+    effects = analyze_blocks(Interpreter().treeify_glyphs(glyphs, 1, []))[()]
+    assert effects.whole == (2,)
+    assert effects.cells_read == ((3, 0),)
+
+def test_memoized_block_matches_interpreted(monkeypatch):
+    _, expected = run(list(loop_with_constant_block), monkeypatch, memoize=False)
+    intr, state = run(list(loop_with_constant_block), monkeypatch)
+
+    assert state == expected
+    assert state[3] == [4]
+    assert intr.memo.hits == 3
+
+def test_rolled_back_block_is_keyed_on_cells_it_overwrites(monkeypatch):
+    # the inner block overwrites list2[0] and always rolls back, so leaves it as it was entered
+    glyphs = [
+        glyph(1, value(2, 0, 1), value(3, 0, -1), value(5, 0, 3)),
+        glyph(2, value(2, 0, 1)),
+        glyph(3, value(2, 0, 9, "overwrite"), question((3, 0), "if")),
+        glyph(2, value(5, 0, -1), question((5, 0), "while")),
+    ]
+    _, expected = run(list(glyphs), monkeypatch, memoize=False)
+    intr, state = run(list(glyphs), monkeypatch)
+    assert state == expected
+    assert state[2] == [3]
+    assert intr.memo.hits == 0
+
+def test_block_missing_every_time_stops_being_looked_up(monkeypatch):
+    # the inner block appends to a list that grows every iteration, so is never entered the same way twice
+    glyphs = [
+        glyph(1, value(2, 0, 300)),
+        glyph(2, value(2, 0, -1)),
+        glyph(3, value(3, 0, 7, "append")),
+        glyph(2, value(5, 0, 1), question((2, 0), "while")),
+    ]
+    _, expected = run(list(glyphs), monkeypatch, memoize=False)
+    intr, state = run(list(glyphs), monkeypatch)
+    assert state == expected
+    assert intr.memo.given_up == {(1, 1)}
+    assert intr.memo.streaks[(1, 1)] == MAX_MISSES
+    assert all(len(entry[2][0]) <= MAX_WHOLE_CELLS for entry in intr.memo.cache.values())
+
+def test_memo_is_bounded(monkeypatch):
+    intr, _ = run(list(loop_with_constant_block), monkeypatch, memo_size=1)
+    assert len(intr.memo.cache) == 1
+
+@pytest.mark.parametrize("progfile", sorted(PROGRAMS.glob("*.riv")))
+def test_memo_does_not_change_programs(progfile):
+    plain = Interpreter()
+    plain.memoize = False
+    expected = plain.interpret_file(progfile, False, "default")
+    assert Interpreter().interpret_file(progfile, False, "default") == expected
@@ -0,0 +1,116 @@
+# pylint: skip-file
+"""
+Test keeping large lists in memory-mapped pages
+"""
+from array import array
+import pickle
+import random
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_mmap import MappedArray, MappedStorage, PageStore
+from rivulet.riv_state import Cells, State
+from helpers import glyph, parse_as, question, value
+
+# appends 299 cells to list3, doubles each of them, then appends last
+def appending(last=7):
+    return lambda: [
+        glyph(1, value(2, 0, 300)),
+        glyph(2, value(3, 0, 7, "append"), value(2, 0, -1), question((2, 0), "while")),
+        glyph(1, value(3, 0, 2, "multiplication_assignment", "list")),
+        glyph(1, value(3, 0, last, "append")),
+    ]
+
+def run(monkeypatch, program, map_lists_above=None, optimize=True):
+    parse_as(monkeypatch, program)
+    intr = Interpreter()
+    intr.optimize = intr.memoize = intr.closed_form = intr.tier = optimize
+    intr.map_lists_above = map_lists_above
+    execution = intr.prepare(intr.load(""))
+    intr.advance(execution)
+    return execution.state
+
+def test_mapped_array_acts_as_a_list():
+    store = PageStore(page_shift=2)
+    rng = random.Random(1)
+    expected = list(range(10))
+    mapped = MappedArray(store, "q", expected)
+    for _ in range(500):
+        op = rng.randrange(4)
+        if op == 0:
+            v = rng.randrange(100)
+            mapped.append(v)
+            expected.append(v)
+        elif op == 1 and expected:
+            i = rng.randrange(len(expected))
+            assert mapped.pop(i) == expected.pop(i)
+        elif op == 2:
+            i = rng.randrange(len(expected) + 1)
+            mapped.insert(i, -i)
+            expected.insert(i, -i)
+        elif expected:
+            i = rng.randrange(len(expected))
+            mapped[i] = expected[i] = i * 3
+        assert len(mapped) == len(expected)
+    assert list(mapped) == expected
+    assert mapped[1:5] == expected[1:5]
+    with pytest.raises(IndexError):
+        mapped[len(expected)]
+    with pytest.raises(TypeError):
+        mapped.extend([1, 2.5])
+
+def test_copies_share_pages_until_written():
+    store = PageStore(page_shift=2)
+    mapped = MappedArray(store, "d", [float(i) for i in range(16)])
+    assert store.pages_used == 4
+    copied = mapped.copy()
+    assert store.pages_used == 4
+    copied[5] = -1.0
+    assert store.pages_used == 5
+    assert mapped[5] == 5.0 and copied[5] == -1.0
+    del mapped
+    assert store.pages_used == 4
+    del copied
+    assert store.pages_used == 0
+
+def test_pickles_as_an_array():
+    mapped = MappedArray(PageStore(page_shift=2), "q", range(9))
+    assert pickle.loads(pickle.dumps(mapped)) == array("q", range(9))
+
+def test_cells_move_out_of_memory_past_the_storage_size():
+    storage = MappedStorage(4)
+    cells = Cells([1, 2, 3], storage)
+    assert type(cells.data) is array
+    cells.extend([4, 5])
+    assert type(cells.data) is MappedArray
+    snapshot = cells.copy()
+    cells.replace(v * 2 for v in cells)
+    assert list(cells) == [2, 4, 6, 8, 10] and list(snapshot) == [1, 2, 3, 4, 5]
+    cells.replace(v / 4 if v > 8 else v for v in cells)
+    assert type(cells.data) is list and list(cells) == [2, 4, 6, 8, 2.5]
+    state = State([1, 2], storage=storage)
+    state[2] = range(6)
+    assert type(state[2].data) is MappedArray
+    assert state.copy().to_dict() == state.to_dict()
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_mapped_run_matches_one_in_memory(monkeypatch, optimize):
+    expected = run(monkeypatch, appending(), optimize=optimize)
+    state = run(monkeypatch, appending(), 16, optimize)
+    assert state.to_dict() == expected.to_dict()
+    assert state[3][:2] == [14, 14] and len(state[3]) == 300
+    assert type(state[3].data) is MappedArray
+    assert type(state[2].data) is array
+
+def test_value_that_does_not_fit_gathers_the_list(monkeypatch):
+    expected = run(monkeypatch, appending(0.5))
+    state = run(monkeypatch, appending(0.5), 16)
+    assert state.to_dict() == expected.to_dict()
+    assert type(state[3].data) is list
+
+def test_final_state_is_not_copied_out_of_its_pages(monkeypatch):
+    parse_as(monkeypatch, appending())
+    intr = Interpreter()
+    intr.map_lists_above = 16
+    state = intr.interpret_program("", False, None)
+    assert type(state) is State and type(state[3].data) is MappedArray
+    assert state == run(monkeypatch, appending())
@@ -0,0 +1,73 @@
+# pylint: skip-file
+"""
+Test the peephole optimizer
+"""
+import copy
+from pathlib import Path
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_optimizer import PeepholeOptimizer
+from rivulet.riv_parser import Parser
+from helpers import glyph, parse_as, question, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def run(glyphs, monkeypatch, optimize=True):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.optimize = optimize
+    return intr, intr.interpret_program("", False, "default")
+
+def test_zero_strands_become_cell_creation():
+    glyphs = Parser().parse_program((PROGRAMS / "zero.riv").read_text(encoding="utf-8"))
+    optimizer = PeepholeOptimizer()
+    optimizer.optimize(glyphs)
+
+    assert optimizer.removed == 7
+    assert all(t["type"] == "touch" for t in glyphs[0]["tokens"])
+
+def test_touches_of_consecutive_cells_merge():
+    g = glyph(1, value(2, 0, 0), value(2, 1, 0), value(2, 2, 0), value(3, 0, 0))
+    PeepholeOptimizer().optimize([g])
+
+    assert [(t["list"], t["assign_to_cell"], t["length"]) for t in g["tokens"]] == [(2, 0, 3), (3, 0, 1)]
+
+def test_zero_is_kept_in_programs_with_floats():
+    g = glyph(1, value(2, 0, 3), value(2, 1, 0), value(3, 0, 2, "division_assignment"))
+    optimizer = PeepholeOptimizer()
+    optimizer.optimize([g])
+
+    assert optimizer.removed == 0
+    assert all(t["type"] == "data" for t in g["tokens"])
+
+@pytest.mark.parametrize("glyphs", [
+    [glyph(1, value(2, 0, 0), value(2, 1, 0), value(2, 2, 4), value(2, 3, 0), value(3, 0, 9, "overwrite"),
+           value(3, 1, 1, "multiplication_assignment"))],
+    [glyph(1, value(2, 0, 7), value(2, 1, 0, "subtraction_assignment"), value(3, 0, 2, "insert"),
+           value(3, 1, 0)),
+     glyph(1, value(2, 0, 2, "exponent_assignment"), value(2, 1, 1, "exponent_assignment"), value(3, 0, 0))],
+])
+def test_optimized_matches_unoptimized(glyphs, monkeypatch):
+    _, expected = run(copy.deepcopy(glyphs), monkeypatch, optimize=False)
+    intr, state = run(copy.deepcopy(glyphs), monkeypatch)
+    assert state == expected
+    assert intr.opt_report
+
+def test_memoized_block_touching_a_live_cell_keeps_its_value(monkeypatch):
+    # the innermost glyph adds 0 to list2[0], a touch once optimized; memoized, it mustn't restore
+    # list2[0] to the value it held when the block was first run
+    glyphs = [glyph(1, value(3, 0, 3)), glyph(2, value(2, 0, 1)), glyph(3, value(2, 0, 0)),
+              glyph(2, value(3, 0, -1), question((3, 0), "while"))]
+    parse_as(monkeypatch, lambda: copy.deepcopy(glyphs))
+    plain = Interpreter()
+    plain.optimize = plain.memoize = plain.closed_form = plain.tier = False
+    expected = plain.interpret_program("", False, "default")
+    assert expected[2] == [2]
+    assert Interpreter().interpret_program("", False, "default") == expected
+
+@pytest.mark.parametrize("progfile", sorted(PROGRAMS.glob("*.riv")))
+def test_optimizer_does_not_change_programs(progfile):
+    plain = Interpreter()
+    plain.optimize = False
+    expected = plain.interpret_file(progfile, False, "default")
+    assert Interpreter().interpret_file(progfile, False, "default") == expected
@@ -0,0 +1,96 @@
+# pylint: skip-file
+"""
+Test running the glyphs a program starts with that can't branch as it is loaded
+"""
+import pytest
+import rivulet
+from rivulet.riv_exceptions import LimitExceededError, RivuletSyntaxError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from helpers import glyph, parse_as, question, ref, value
+
+# two glyphs setting up lists, then a loop counting list2 down into list5
+def counting():
+    return [
+        glyph(1, value(2, 0, 3)),
+        glyph(1, value(3, 0, 4)),
+        glyph(2, value(5, 0, 1), value(2, 0, -1), question((2, 0), "while")),
+        glyph(1, ref(7, 0, (3, 0)), list_size=5),
+    ]
+
+# the program's own while loop runs its first glyph again each iteration
+def repeating():
+    return [
+        glyph(1, value(3, 0, 1)),
+        glyph(1, value(5, 0, 4, "overwrite"), ref(5, 0, (3, 0), "subtraction_assignment"),
+              question((5, 0), "while")),
+    ]
+
+# the program's own question rolls back the glyph run as it was loaded
+def rolling_back():
+    return [
+        glyph(1, value(2, 0, -3)),
+        glyph(1, value(3, 0, 1), question((2, 0), "if")),
+    ]
+
+def run(optimize=True, limits=None):
+    intr = Interpreter()
+    intr.optimize = optimize
+    if limits:
+        intr.limits = limits
+    execution = intr.prepare(intr.load(""))
+    start = (execution.frames[0].pos, execution.glyphs_run)
+    intr.advance(execution)
+    return start, execution.state.to_dict(), execution.glyphs_run
+
+def test_prefix_is_run_as_the_program_loads(monkeypatch):
+    parse_as(monkeypatch, counting)
+    intr = Interpreter()
+    assert "glyphs 0 to 1 run as the program was loaded" in intr.load("")[4]
+    start, state, glyphs = run()
+    assert start == (2, 2)
+    assert (state, glyphs) == run(optimize=False)[1:]
+    assert state[7] == [4]
+
+@pytest.mark.parametrize("program", [repeating, rolling_back])
+def test_program_repeating_or_rolling_back_runs_its_prefix_again(monkeypatch, program):
+    parse_as(monkeypatch, program)
+    start, state, glyphs = run()
+    assert start == (1, 1)
+    assert (state, glyphs) == run(optimize=False)[1:]
+
+def test_repeated_prefix_is_rolled_back_to(monkeypatch):
+    parse_as(monkeypatch, repeating)
+    assert run()[1][3] == [3]
+    parse_as(monkeypatch, rolling_back)
+    assert run()[1][2] == []
+
+def test_prefix_stops_before_a_glyph_that_raises(monkeypatch):
+    parse_as(monkeypatch, lambda: [glyph(1, value(2, 0, 1)), glyph(1, ref(3, 0, (5, 2))),
+                              glyph(1, value(2, 0, 1), question((2, 0), "if"))])
+    assert "glyphs 0 to 0 run as the program was loaded" in Interpreter().load("")[4]
+    with pytest.raises(RivuletSyntaxError):
+        Interpreter().interpret_program("", False, None)
+
+def test_no_prefix_before_a_question_or_exponent(monkeypatch):
+    parse_as(monkeypatch, lambda: [glyph(1, value(2, 0, 3), question((2, 0), "if")), glyph(1, value(3, 0, 1))])
+    assert Interpreter().load("")[8] is None
+    parse_as(monkeypatch, lambda: [glyph(1, value(2, 0, 3, "exponent_assignment"))])
+    assert Interpreter().load("")[8] is None
+
+def test_prefix_counts_against_max_glyphs(monkeypatch):
+    parse_as(monkeypatch, counting)
+    with pytest.raises(LimitExceededError):
+        run(limits=Limits(max_glyphs=1))
+
+def test_watched_and_seeded_runs_run_every_glyph(monkeypatch):
+    parse_as(monkeypatch, counting)
+    intr = Interpreter()
+    ran = []
+    intr.on_glyph(lambda glyph_id, iteration, action: ran.append(glyph_id))
+    assert intr.interpret_program("", False, None) == run()[1]
+    assert ran[:2] == [0, 1]
+
+    program = rivulet.compile("")
+    assert program.run({2: [1]}).state[7] == [4]
+    assert program.run().glyphs_run == run(optimize=False)[2]
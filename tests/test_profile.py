@@ -0,0 +1,114 @@
+# pylint: skip-file
+"""
+Test recording profiles of runs and using them to guide later runs
+"""
+from collections import deque
+import pytest
+from rivulet.riv_exceptions import ProfileError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_profile import RunProfile
+from helpers import glyph, parse_as, question, value
+
+# inserts 200 cells at the front of list3
+def inserting():
+    return [
+        glyph(1, value(2, 0, 200)),
+        glyph(2, value(3, 0, 7, "insert"), value(2, 0, -1), question((2, 0), "while")),
+    ]
+
+# an if block that passes unless list2 starts below -1
+def passing():
+    return [
+        glyph(1, value(2, 0, 1), value(5, 0, 1)),
+        glyph(2, value(3, 0, 5), question((2, 0), "if")),
+        glyph(1, value(5, 0, 1)),
+    ]
+
+def run(intr, initial_state=None):
+    execution = intr.prepare(intr.load(""), initial_state=initial_state)
+    intr.advance(execution)
+    return execution
+
+def test_profile_records_glyphs_blocks_and_lists(monkeypatch, tmp_path):
+    parse_as(monkeypatch, inserting)
+    state, profile = Interpreter().record_profile("")
+    assert state == Interpreter().interpret_program("", False, None)
+    assert profile.glyphs == {0: 1, 1: 200}
+    assert profile.iterations == {(1,): 199} and profile.rollbacks == {(1,): 1}
+    assert profile.lists[3] == (200, "deque") and profile.lists[2] == (1, "q")
+
+    profile.save(tmp_path / "p.json")
+    loaded = RunProfile.load(tmp_path / "p.json")
+    assert vars(loaded) == vars(profile)
+
+def test_hot_blocks_compile_and_lists_start_as_they_ended(monkeypatch):
+    parse_as(monkeypatch, inserting)
+    intr = Interpreter()
+    expected = run(intr).state.to_dict()
+    intr.profile = intr.record_profile("")[1]
+    execution = intr.prepare(intr.load(""))
+    assert type(execution.state[3].data) is deque
+    assert "list 3 started as a deque, as the profile ended it" in intr.opt_report
+    assert intr.tiers.report == ["block at glyph 1 compiled from the profile, where it repeated 199 times"]
+    intr.advance(execution)
+    assert execution.state.to_dict() == expected
+
+def test_blocks_never_rolled_back_are_not_snapshot(monkeypatch):
+    parse_as(monkeypatch, passing)
+    intr = Interpreter()
+    intr.profile = intr.record_profile("")[1]
+    execution = intr.prepare(intr.load(""))
+    assert execution.context.unsaved == {(1,)}
+    intr.advance(execution)
+    assert execution.state.to_dict() == Interpreter().interpret_program("", False, None)
+    assert not any("run again" in line for line in intr.opt_report)
+
+def test_block_rolling_back_without_snapshot_runs_again(monkeypatch):
+    parse_as(monkeypatch, passing)
+    intr = Interpreter()
+    intr.profile = intr.record_profile("")[1]
+    state = run(intr, {2: [-5]}).state.to_dict()
+    assert state == run(Interpreter(), {2: [-5]}).state.to_dict()
+    assert state[3] == [] and state[5] == [2]
+    assert intr.opt_report[-1] == \
+        "glyph 1 rolled back a block the profile never saw roll back; run again from the start"
+
+def test_profile_of_another_program_is_not_used(monkeypatch):
+    parse_as(monkeypatch, passing)
+    profile = Interpreter().record_profile("")[1]
+    parse_as(monkeypatch, inserting)
+    intr = Interpreter()
+    intr.profile = profile
+    execution = intr.prepare(intr.load(""))
+    assert "the profile is of another program, so wasn't used" in intr.opt_report
+    assert not execution.context.unsaved
+
+def test_watched_runs_do_not_use_the_profile(monkeypatch):
+    parse_as(monkeypatch, passing)
+    intr = Interpreter()
+    intr.profile = intr.record_profile("")[1]
+    assert not intr.hooks.active
+    intr.on_rollback(lambda glyph_id: None)
+    assert not intr.prepare(intr.load("")).context.unsaved
+
+def test_recording_leaves_the_interpreters_hooks_alone(monkeypatch):
+    parse_as(monkeypatch, passing)
+    intr = Interpreter()
+    seen = []
+    def glyph_run(glyph_id, iteration, action):
+        seen.append(glyph_id)
+        if len(seen) == 1:
+            # another run of the interpreter, as from another thread, isn't recorded
+            intr.interpret_program("", False, None)
+    intr.on_glyph(glyph_run)
+    profile = intr.record_profile("")[1]
+    assert intr.hooks.glyph == [glyph_run]
+    assert profile.glyphs == Interpreter().record_profile("")[1].glyphs
+    assert len(seen) == 2 * sum(profile.glyphs.values())
+
+def test_unreadable_profile(tmp_path):
+    with pytest.raises(ProfileError):
+        RunProfile.load(tmp_path / "missing.json")
+    (tmp_path / "old.json").write_text('{"version": 0}', encoding="utf-8")
+    with pytest.raises(ProfileError, match="version 0"):
+        RunProfile.load(tmp_path / "old.json")
@@ -0,0 +1,94 @@
+# pylint: skip-file
+"""
+Test compiling a program once and running it from different initial states
+"""
+from pathlib import Path
+import pytest
+import rivulet
+from rivulet.riv_exceptions import LimitExceededError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from rivulet.riv_parser import Parser
+import rivulet.riv_affine
+import rivulet.riv_tiers
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+def source(name="fibonacci1.riv"):
+    return (PROGRAMS / name).read_text(encoding="utf-8")
+
+def plain_run(program, initial_state):
+    "Run with every optimization off, as the reference"
+    intr = Interpreter()
+    intr.optimize = intr.memoize = intr.closed_form = False
+    execution = intr.prepare(intr.load(program), initial_state=initial_state)
+    intr.advance(execution)
+    return execution.state.to_dict()
+
+def test_run_without_initial_state_matches_interpreter():
+    result = rivulet.compile(source()).run()
+    assert result.state == Interpreter().interpret_program(source(), False, None)
+    assert result.output == [0, 1, 1, 2, 3, 5, 8, 13]
+    assert result.glyphs_run > 0
+
+def test_parses_once_for_many_runs(monkeypatch):
+    parses = []
+    parse_program = Parser.parse_program
+    def counting(self, program):
+        parses.append(program)
+        return parse_program(self, program)
+    monkeypatch.setattr(Parser, "parse_program", counting)
+
+    program = rivulet.compile(source())
+    results = [program.run({2: [seed]}) for seed in range(50)]
+    assert len(parses) == 1
+    assert len({tuple(r.output) for r in results}) == 50
+
+@pytest.mark.parametrize("name", ["fibonacci1.riv", "fibonacci2.riv", "fibonacci3.riv"])
+@pytest.mark.parametrize("initial_state", [{2: [5]}, {1: [1, 2, 3]}, {2: [2.5]}, {3: [7, -1, 4], 2: [3]}])
+def test_initial_state_matches_unoptimized_run(name, initial_state):
+    result = rivulet.compile(source(name)).run(initial_state)
+    assert result.state == plain_run(source(name), initial_state)
+
+def test_runs_are_independent():
+    program = rivulet.compile(source())
+    seeded = {2: [5]}
+    first = program.run(seeded)
+    assert seeded == {2: [5]}
+    assert program.run().state == rivulet.compile(source()).run().state
+    assert program.run(seeded).state == first.state
+
+def test_limits_stop_a_run():
+    program = rivulet.compile(source())
+    with pytest.raises(LimitExceededError):
+        program.run(limits=Limits(max_glyphs=5))
+    assert program.run().output == [0, 1, 1, 2, 3, 5, 8, 13]
+
+def test_unknown_list_is_an_error():
+    program = rivulet.compile(source())
+    assert 4 not in program.lists
+    with pytest.raises(ValueError):
+        program.run({4: [1]})
+
+def test_runs_reuse_compiled_blocks_and_closed_forms(monkeypatch):
+    built = []
+    compile_block = rivulet.riv_tiers.compile_block
+    monkeypatch.setattr(rivulet.riv_tiers, "compile_block",
+                        lambda *args: built.append("block") or compile_block(*args))
+    class CountedPlan(rivulet.riv_affine.AffinePlan):
+        def __init__(self, *args):
+            built.append("plan")
+            super().__init__(*args)
+    monkeypatch.setattr(rivulet.riv_affine, "AffinePlan", CountedPlan)
+
+    tiered = Interpreter()
+    tiered.closed_form, tiered.tier_threshold = False, 1
+    for intr in (tiered, Interpreter()):
+        program = rivulet.Program(source(), intr)
+        first = program.run().state
+        count = len(built)
+        assert count > 0
+        for _ in range(3):
+            assert program.run().state == first
+        assert len(built) == count
+        built.clear()
@@ -0,0 +1,84 @@
+# pylint: skip-file
+"""
+Test asking a glyph's question before its strands run
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_analysis import guard_question
+from rivulet.riv_interpreter import Interpreter
+from helpers import glyph, parse_as, question, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# counts list2[0] down from 200; the guard glyph only passes while list2[0] > 190
+guarded = [
+    glyph(1, value(2, 0, 200), value(5, 0, -190)),
+    glyph(2, value(5, 0, 1), value(3, 0, 1)),
+    glyph(3, value(3, 1, 1), question((5, 0), "if")),
+    glyph(3, value(3, 2, 1)),
+    glyph(2, value(2, 0, -1), question((2, 0), "while")),
+]
+
+def run(glyphs, monkeypatch, question_first, **settings):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.question_first = question_first
+    for name, setting in settings.items():
+        setattr(intr, name, setting)
+    return intr.interpret_program("", False, "default")
+
+def test_guard_is_a_question_its_glyph_cant_change():
+    assert guard_question(glyph(2, value(3, 0, 1), question((5, 0), "if")))["ref_cell"] == [5, 0]
+    assert guard_question(glyph(2, value(5, 1, 1), question((5, 0), "if"))) is None
+    assert guard_question(glyph(2, value(3, 0, 1))) is None
+    # the last question decides what the glyph does
+    assert guard_question(glyph(2, question((5, 0), "if"), value(3, 0, 1), question((3, 0), "while"))) is None
+
+@pytest.mark.parametrize("settings", [{}, {"tier_threshold": 1}, {"memoize": False, "tier": False}])
+def test_same_state_asking_first(settings, monkeypatch):
+    expected = run(guarded, monkeypatch, False, **settings)
+    assert run(guarded, monkeypatch, True, **settings) == expected
+    assert expected[3] == [199, 9, 9]
+
+def test_failing_guard_skips_its_strands(monkeypatch):
+    interpreted = []
+    interpret_glyph = Interpreter._Interpreter__interpret_glyph
+    def counting(self, g, *args):
+        interpreted.append(g["id"])
+        return interpret_glyph(self, g, *args)
+    monkeypatch.setattr(Interpreter, "_Interpreter__interpret_glyph", counting)
+
+    run(guarded, monkeypatch, False, memoize=False, tier=False)
+    assert interpreted.count(2) == 200
+    interpreted.clear()
+    run(guarded, monkeypatch, True, memoize=False, tier=False)
+    assert interpreted.count(2) == 10
+
+def test_block_rolled_back_by_its_first_glyph_takes_no_snapshot(monkeypatch):
+    glyphs = [glyph(1, value(2, 0, 1), value(5, 0, 0)), glyph(2, value(3, 0, 5), question((5, 0), "if"))]
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.question_first = True
+    execution = intr.start("")
+    intr.advance(execution, 1)
+    assert execution.frames[-1].snapshot is None
+    intr.advance(execution)
+    assert execution.state[3] == []
+
+@pytest.mark.parametrize("progfile", sorted(p.name for p in PROGRAMS.glob("*.riv")))
+def test_programs_run_the_same_asking_first(progfile):
+    intr = Interpreter()
+    intr.question_first = True
+    assert intr.interpret_file(PROGRAMS / progfile, False, "default") == \
+        Interpreter().interpret_file(PROGRAMS / progfile, False, "default")
+
+@pytest.mark.parametrize("settings", [{"tier": False, "closed_form": False}, {"tier_threshold": 1}])
+def test_loop_ended_by_its_first_glyph(settings, monkeypatch):
+    glyphs = [
+        glyph(1, value(2, 0, 100), value(5, 0, 30)),
+        glyph(2, value(3, 0, 1), question((5, 0), "if")),
+        glyph(2, value(5, 0, -1), value(2, 0, -1), question((2, 0), "while")),
+    ]
+    expected = run(glyphs, monkeypatch, False, **settings)
+    assert run(glyphs, monkeypatch, True, **settings) == expected
+    assert expected[3] == [30] and expected[2] == [70]
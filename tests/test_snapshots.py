@@ -0,0 +1,65 @@
+# pylint: skip-file
+"""
+Test narrowing the snapshots blocks take to the lists they can write
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_analysis import analyze_blocks
+from rivulet.riv_blocks import build_blocks
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_state import Snapshot, State
+from helpers import glyph, parse_as, question, ref, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# a while loop counting list2[0] down, around a block with no question moving list5 into list7
+nested = [
+    glyph(1, value(2, 0, 2), value(5, 0, 1), value(5, 1, 2)),
+    glyph(2, value(3, 0, 1)),
+    glyph(3, ref(7, 0, (5, 0), "pop_and_append"), list_size=5),
+    glyph(2, value(2, 0, -1), question((2, 0), "while")),
+]
+
+def test_only_own_questions_roll_a_block_back():
+    for idx, g in enumerate(nested):
+        g["id"] = idx
+    effects = analyze_blocks(build_blocks(nested))
+    assert not effects[()].rolls_back
+    assert effects[(1,)].rolls_back
+    assert not effects[(1, 1)].rolls_back
+    assert effects[(1,)].lists_written == (2, 3, 5, 7)
+    assert effects[(1, 1)].lists_written == (5, 7)
+
+def test_blocks_snapshot_what_they_write(monkeypatch):
+    parse_as(monkeypatch, nested)
+    intr = Interpreter()
+    intr.memoize = intr.closed_form = intr.tier = False
+    tree = intr.load("")[3]
+    slots = {key: slot for slot, key in enumerate(intr.load("")[1])}
+    assert not tree.rolls_back and not tree[1][1].rolls_back
+    assert tree[1].rolls_back
+    assert tree[1].saved == tuple(slots[lst] for lst in (2, 3, 5, 7))
+
+    execution = intr.start("")
+    assert execution.frames[0].snapshot is None
+    intr.advance(execution, 2)
+    assert isinstance(execution.frames[-1].snapshot, Snapshot)
+    intr.advance(execution)
+    # the second iteration takes list2[0] to 0, and is rolled back
+    assert execution.state.to_dict() == {1: [], 2: [1], 3: [1], 5: [2], 7: [1]}
+
+def test_partial_snapshot_restores_only_its_lists():
+    state = State([1, 2, 3])
+    state[2] = [5]
+    snap = state.copy((1,))
+    kept = state[3]
+    state[2].append(6)
+    state.restore(snap)
+    assert state[2] == [5]
+    assert state[3] is kept
+
+@pytest.mark.parametrize("progfile", sorted(p.name for p in PROGRAMS.glob("*.riv")))
+def test_programs_run_the_same_with_narrow_snapshots(progfile, monkeypatch):
+    expected = Interpreter().interpret_file(PROGRAMS / progfile, False, "default")
+    monkeypatch.setattr(Interpreter, "_Interpreter__narrow_snapshots", staticmethod(lambda *args: None))
+    assert Interpreter().interpret_file(PROGRAMS / progfile, False, "default") == expected
@@ -0,0 +1,132 @@
+# pylint: skip-file
+"""
+Test compact, array-backed storage of program state
+"""
+from array import array
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_state import Cells, State
+from helpers import glyph, parse_as, value
+
+def test_ints_are_stored_in_an_int64_array():
+    cells = Cells([1, 2, 3])
+    assert isinstance(cells.data, array) and cells.data.typecode == "q"
+    cells.insert(0, 7)
+    cells.append(9)
+    assert cells.pop(1) == 1
+    assert cells == [7, 2, 3, 9]
+    assert cells.data.typecode == "q"
+
+@pytest.mark.parametrize("new", [1 << 63, -(1 << 63) - 1, 2.5, 1j])
+def test_values_that_dont_fit_move_cells_to_a_list(new):
+    cells = Cells([1, 2, 3])
+    cells[1] = new
+    assert type(cells.data) is list
+    assert cells == [1, new, 3]
+    assert type(cells[0]) is int
+
+def test_float_array_keeps_ints_as_ints():
+    cells = Cells([0.5, 1.5])
+    assert cells.data.typecode == "d"
+    cells.append(2)
+    assert type(cells.data) is list
+    assert type(cells[2]) is int
+
+def test_replacing_every_cell_picks_storage_again():
+    cells = Cells([1 << 70, 2])
+    assert type(cells.data) is list
+    cells.replace([1.0, 2.0])
+    assert cells.data.typecode == "d"
+    cells[:] = [3, 4]
+    assert cells.data.typecode == "q"
+
+def test_state_is_a_mapping_by_line_number():
+    state = State([1, 2, 3, 5])
+    state[3].append(4)
+    snap = state.copy()
+    state[3][0] = 1 << 80
+    state[5].append(1)
+    assert state == {1: [], 2: [], 3: [1 << 80], 5: [1]}
+    state.restore(snap)
+    assert state == {1: [], 2: [], 3: [4], 5: []}
+    assert list(state) == [1, 2, 3, 5]
+
+def test_large_values_survive_a_run(monkeypatch):
+    glyphs = [glyph(1, value(2, 0, 3), value(2, 0, 100, "exponent_assignment"),
+                    value(3, 0, 4), value(3, 0, 2, "division_assignment"),
+                    value(5, 0, 2), value(5, 1, 3), value(5, 0, 1 << 64, "multiplication_assignment", "list"))]
+    parse_as(monkeypatch, glyphs)
+    state = Interpreter().interpret_program("", False, "default")
+    assert state == {1: [], 2: [3 ** 100], 3: [2.0], 5: [2 << 64, 3 << 64]}
+    assert type(state.to_dict()) is dict and type(state.to_dict()[2]) is list
+
+def test_tracked_count_follows_every_change():
+    import random
+    rnd = random.Random(36)
+    cells = Cells([3, -1, 0, 2])
+    cells.track()
+    snap = cells.copy()
+    for _ in range(2000):
+        op = rnd.choice(["set", "insert", "append", "pop", "extend", "replace"])
+        val = rnd.choice([-2, 0, 1, 5, 0.5, -0.5, 1 << 70, float("nan")])
+        if op == "set" and len(cells):
+            cells[rnd.randrange(len(cells))] = val
+        elif op == "insert":
+            cells.insert(rnd.randrange(len(cells) + 1), val)
+        elif op == "append":
+            cells.append(val)
+        elif op == "pop" and len(cells):
+            cells.pop(rnd.randrange(len(cells)))
+        elif op == "extend":
+            cells.extend([val, 1])
+        elif op == "replace" and rnd.random() < 0.05:
+            cells[:] = [rnd.choice([-1, 1]) for _ in range(5)]
+        assert cells.nonpositive == sum(1 for v in cells if not v > 0)
+        assert cells.all_positive() == all(v > 0 for v in cells)
+    assert snap.nonpositive == 2 and snap.all_positive() is False
+
+def test_unordered_cells_fall_back_to_comparing():
+    cells = Cells([1, 2])
+    cells.track()
+    cells.append(1j)
+    with pytest.raises(TypeError):
+        cells.all_positive()
+    cells.pop()
+    assert cells.all_positive()
+
+def test_list_question_while_loop(monkeypatch):
+    list_question = {"type": "question_marker", "subtype": "first", "applies_to": "list",
+                     "ref_list": 3, "block_type": "while", "action": None}
+    glyphs = [glyph(1, value(3, 0, 3), value(3, 1, 3)),
+              glyph(2, value(2, 0, 1), value(3, 1, -1), list_question)]
+    parse_as(monkeypatch, glyphs)
+    state = Interpreter().interpret_program("", False, "default")
+    # the third iteration takes list3[1] to 0, and is rolled back
+    assert state[2] == [2] and state[3] == [3, 1]
+
+def test_queue_use_moves_cells_to_a_deque():
+    from collections import deque
+    cells = Cells(range(100))
+    expected = list(range(100))
+    for i in range(50):
+        cells.insert(0, -i)
+        expected.insert(0, -i)
+        assert cells.pop(3) == expected.pop(3)
+    assert type(cells.data) is deque
+    cells.append(1 << 80)
+    expected.append(1 << 80)
+    cells[5] += 1
+    expected[5] += 1
+    assert cells == expected
+    assert cells[2:5] == expected[2:5]
+    assert cells.pop() == expected.pop()
+    copy = cells.copy()
+    cells.pop(0)
+    assert copy == expected
+
+def test_back_of_list_use_stays_compact():
+    cells = Cells(range(100))
+    for _ in range(50):
+        cells.insert(90, 1)
+        cells.pop(10 + 70)
+    assert type(cells.data) is array
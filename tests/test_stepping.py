@@ -0,0 +1,75 @@
+# pylint: skip-file
+"""
+Test running programs a step at a time, as generators and as asyncio tasks
+"""
+import asyncio
+from pathlib import Path
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from helpers import glyph, parse_as, question, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+FIBONACCI = (PROGRAMS / "fibonacci1.riv").read_text(encoding="utf-8")
+
+def plain_interpreter():
+    intr = Interpreter()
+    intr.memoize = intr.closed_form = False
+    return intr
+
+def endless(monkeypatch):
+    "A while loop on a cell that never changes, incrementing list3[0] forever"
+    glyphs = [glyph(1, value(2, 0, 1)), glyph(2, value(3, 0, 1), question((2, 0), "while"))]
+    parse_as(monkeypatch, glyphs)
+    return Interpreter().start("")
+
+def test_step_runs_one_glyph_at_a_time():
+    expected = plain_interpreter().interpret_program(FIBONACCI, False, "default")
+    execution = plain_interpreter().start(FIBONACCI)
+
+    assert execution.current_glyph == 0
+    count = 0
+    while not execution.done:
+        # the last step may only exit blocks
+        ran = execution.step()
+        assert ran == 1 or (ran == 0 and execution.done)
+        count += ran
+    assert execution.glyphs_run == count
+    assert execution.current_glyph is None
+    assert execution.state == expected
+
+def test_steps_by_iteration():
+    execution = plain_interpreter().start(FIBONACCI)
+    iterations = [e.frames[-1].iteration for e in execution.steps(by="iteration") if not e.done]
+    assert iterations == list(range(1, len(iterations) + 1))
+    assert execution.done
+
+def test_steps_by_glyph_leaves_state_inspectable():
+    execution = plain_interpreter().start(FIBONACCI)
+    seen = [(e.glyphs_run, list(e.state[1])) for e in execution.steps()]
+    assert [n for n, _ in seen[:-1]] == list(range(1, len(seen)))
+    assert seen[-1][1] == execution.state[1]
+
+def test_async_runs_interleave():
+    expected = Interpreter().interpret_program(FIBONACCI, False, "default")
+
+    async def both():
+        return await asyncio.gather(Interpreter().start(FIBONACCI).run(slice_ms=0),
+                                    Interpreter().start(FIBONACCI).run(slice_ms=0))
+
+    assert asyncio.run(both()) == [expected, expected]
+
+def test_async_cancel_stops_between_glyphs(monkeypatch):
+    execution = endless(monkeypatch)
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(execution.run(slice_ms=1))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_soon())
+    assert execution.cancelled
+    assert not execution.done
+    assert execution.state[3][0] > 0
+    assert execution.step() == 0
@@ -0,0 +1,157 @@
+# pylint: skip-file
+"""
+Test publishing counters of a run in shared memory, and riv top reading them
+"""
+import os
+import subprocess
+import sys
+import pytest
+from rivulet import riv_telemetry, riv_trace
+from rivulet.riv_cache import ResultCache
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_telemetry import Telemetry, attach, read, render
+from helpers import glyph, parse_as, question, value
+
+# appends to list3 until list2 counts down from 3000
+def appending():
+    return [
+        glyph(1, value(2, 0, 3000)),
+        glyph(2, value(3, 0, 7, "append"), value(2, 0, -1), question((2, 0), "while")),
+    ]
+
+@pytest.fixture
+def telemetry(tmp_path):
+    telemetry = Telemetry(tmp_path)
+    yield telemetry
+    telemetry.close()
+
+def prepared(monkeypatch, telemetry, optimize=True):
+    parse_as(monkeypatch, appending)
+    intr = Interpreter()
+    intr.optimize = intr.memoize = intr.closed_form = intr.tier = optimize
+    intr.telemetry = telemetry
+    return intr, intr.prepare(intr.load(""))
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_finished_run_is_published(monkeypatch, tmp_path, telemetry, optimize):
+    intr, execution = prepared(monkeypatch, telemetry, optimize)
+    intr.advance(execution)
+    reading = read(attach(os.getpid(), tmp_path))
+    assert reading["pid"] == os.getpid() and reading["status"] == "finished"
+    assert reading["glyphs"] == execution.glyphs_run
+    assert reading["depth"] == 0 and reading["loops"] == []
+    assert dict(reading["lists"])[3] == 2999
+    assert reading["rollbacks"] == 1
+
+def test_run_part_way_shows_its_loop(monkeypatch, tmp_path, telemetry):
+    intr, execution = prepared(monkeypatch, telemetry, optimize=False)
+    intr.advance(execution, 2000)
+    reading = read(attach(os.getpid(), tmp_path))
+    assert reading["status"] == "running"
+    assert reading["glyphs"] == 2000 and reading["glyph"] == 1 and reading["depth"] == 2
+    assert reading["loops"] == [(1, 1999)]
+    assert dict(reading["lists"])[3] == 1999
+
+def test_counters_are_published_as_compiled_loops_run(monkeypatch, tmp_path, telemetry):
+    intr, execution = prepared(monkeypatch, telemetry)
+    execution.context.affine = None
+    counters = attach(os.getpid(), tmp_path)
+    seen = []
+    run_compiled = intr.tiers.run
+    def running(*args):
+        seen.append(read(counters)["glyphs"])
+        return run_compiled(*args)
+    intr.tiers.run = running
+    intr.advance(execution)
+    assert len(seen) > 1 and seen == sorted(seen)
+
+def test_run_answered_from_the_cache_is_published(monkeypatch, tmp_path, telemetry):
+    intr, _ = prepared(monkeypatch, telemetry)
+    intr.results = ResultCache(tmp_path / "cache")
+    intr.interpret_program("", False, None)
+    assert read(attach(os.getpid(), tmp_path))["glyphs"] > 0
+    intr.interpret_program("", False, None)
+    reading = read(attach(os.getpid(), tmp_path))
+    assert reading["status"] == "finished" and reading["glyphs"] == 0
+    assert dict(reading["lists"])[3] == 2999
+
+def test_attached_counters_are_read_only(tmp_path, telemetry):
+    counters = attach(os.getpid(), tmp_path)
+    with pytest.raises(TypeError):
+        counters[riv_telemetry.GLYPHS] = 1
+    with pytest.raises(OSError):
+        attach(os.getpid() + 1, tmp_path)
+
+def test_file_is_private_and_not_one_a_link_points_to(tmp_path):
+    target = tmp_path / "target"
+    target.write_bytes(b"kept")
+    os.symlink(target, riv_telemetry.telemetry_path(os.getpid(), tmp_path))
+    telemetry = Telemetry(tmp_path)
+    try:
+        assert target.read_bytes() == b"kept"
+        assert not os.path.islink(telemetry.path)
+        assert os.stat(telemetry.path).st_mode & 0o777 == 0o600
+    finally:
+        telemetry.close()
+
+def test_other_files_are_not_attached(tmp_path):
+    # a trace starts with a magic of its own, so isn't read as counters
+    with open(riv_telemetry.telemetry_path(7, tmp_path), "wb") as file:
+        riv_trace.TraceRecorder(file, "", [])
+        file.write(bytes(riv_telemetry.SIZE))
+    with pytest.raises(ValueError, match="no Rivulet telemetry"):
+        attach(7, tmp_path)
+
+def test_closed_telemetry_is_removed(tmp_path):
+    telemetry = Telemetry(tmp_path)
+    assert os.path.exists(telemetry.path)
+    telemetry.close()
+    assert list(tmp_path.iterdir()) == []
+
+def test_second_telemetry_of_a_process_leaves_the_first(tmp_path, telemetry):
+    with pytest.raises(FileExistsError):
+        Telemetry(tmp_path)
+    assert os.path.exists(telemetry.path)
+    assert attach(os.getpid(), tmp_path)[riv_telemetry.PID] == os.getpid()
+
+def test_closed_telemetry_frees_its_path(tmp_path):
+    Telemetry(tmp_path).close()
+    telemetry = Telemetry(tmp_path)
+    try:
+        assert os.path.exists(telemetry.path)
+    finally:
+        telemetry.close()
+
+def test_publish_left_under_way_by_an_exited_writer_reads_stale():
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    counters = memoryview(bytearray(riv_telemetry.SIZE)).cast("q")
+    counters[riv_telemetry.PID] = int(exited.stdout)
+    counters[riv_telemetry.GLYPHS] = 12
+    counters[riv_telemetry.SEQ] = 3
+    reading = read(counters)
+    assert reading["stale"] and reading["glyphs"] == 12
+    assert render(reading)[0].startswith(f"rivulet pid {exited.stdout.strip()}  running (stale)")
+
+    counters[riv_telemetry.SEQ] = 4
+    assert not read(counters)["stale"]
+
+def test_render_shows_rates():
+    reading = {"pid": 7, "started_ns": 0, "updated_ns": 2_000_000_000, "status": "finished",
+               "glyphs": 5000, "glyph": 3, "depth": 2, "rollbacks": 10,
+               "loops": [(1, 40)], "lists": [(1, 0), (2, 12)], "stale": False}
+    before = dict(reading, glyphs=1000, rollbacks=4)
+    assert render(reading, before, 2.0) == [
+        "rivulet pid 7  finished  2.0s elapsed",
+        "glyphs 5,000 (2,000/s)  rollbacks 10 (3/s)",
+        "at glyph 3, 2 blocks deep",
+        "  loop at glyph 1: iteration 40",
+        "list cells  2:12",
+    ]
+
+def test_top_prints_once(monkeypatch, tmp_path, telemetry, capsys):
+    intr, execution = prepared(monkeypatch, telemetry)
+    intr.advance(execution)
+    assert riv_telemetry.main([str(os.getpid()), "-n", "0", "--once", "--dir", str(tmp_path)]) == 0
+    assert capsys.readouterr().out.startswith(f"rivulet pid {os.getpid()}  finished")
+    assert riv_telemetry.main([str(os.getpid() + 1), "--dir", str(tmp_path)]) == 1
@@ -0,0 +1,56 @@
+# pylint: skip-file
+"""
+Test sharing one Parser and Interpreter between threads
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+import rivulet
+from rivulet.riv_exceptions import LimitExceededError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from rivulet.riv_parser import Parser
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+SOURCES = [p.read_text(encoding="utf-8") for p in sorted(PROGRAMS.glob("*.riv"))]
+
+def test_parsers_share_a_read_only_lexicon():
+    parser = Parser()
+    assert parser.lexicon is Parser().lexicon
+    with pytest.raises(TypeError):
+        parser.lexicon[0]["name"] = "changed"
+    with pytest.raises(TypeError):
+        parser.command_map["0"] = {}
+    # tokens get their own copies of symbols, to change as they like
+    token = parser.parse_program(SOURCES[0])[0]["tokens"][0]
+    token["symbol"].append("changed")
+    assert "changed" not in parser.parse_program(SOURCES[0])[0]["tokens"][0]["symbol"]
+
+def test_one_parser_parses_in_many_threads():
+    parser = Parser()
+    expected = [parser.parse_program(source) for source in SOURCES]
+    with ThreadPoolExecutor(8) as pool:
+        parsed = list(pool.map(parser.parse_program, SOURCES * 8))
+    assert parsed == expected * 8
+
+def test_one_interpreter_runs_in_many_threads():
+    expected = [Interpreter().interpret_program(source, False, None) for source in SOURCES]
+    intr = Interpreter()
+    def run(source):
+        return intr.interpret_program(source, False, None)
+    with ThreadPoolExecutor(8) as pool:
+        states = list(pool.map(run, SOURCES * 8))
+    assert states == expected * 8
+
+def test_limits_of_one_run_dont_reach_another():
+    program = rivulet.compile(SOURCES[0])
+    expected = program.run().state
+    def run(limited):
+        try:
+            return program.run(limits=Limits(max_glyphs=5) if limited else None).state
+        except LimitExceededError:
+            return None
+    with ThreadPoolExecutor(8) as pool:
+        states = list(pool.map(run, [n % 2 == 0 for n in range(64)]))
+    assert states == [None, expected] * 32
+    assert not program.interpreter.limits.active
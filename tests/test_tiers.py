@@ -0,0 +1,99 @@
+# pylint: skip-file
+"""
+Test compiling hot while blocks to Python functions
+"""
+from pathlib import Path
+import pytest
+from rivulet.riv_exceptions import LimitExceededError, RivuletSyntaxError
+from rivulet.riv_interpreter import Interpreter
+from rivulet.riv_limits import Limits
+from helpers import glyph, parse_as, question, ref, value
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+# loops running each kind of command, counting list2[0] down from 300
+loops = {
+    "arithmetic": [
+        glyph(1, value(2, 0, 300), value(3, 0, 1), value(3, 1, 2.5)),
+        glyph(2, value(3, 0, 3, "multiplication_assignment"), value(3, 0, 1000003, "mod_assignment"),
+              value(3, 1, 2, "division_assignment"), value(3, 2, 5, "overwrite")),
+        glyph(2, ref(3, 1, (3, 0), "addition_assignment"), value(3, 1, 2, "root_assignment"),
+              value(2, 0, -1), question((2, 0), "while")),
+    ],
+    "list commands": [
+        glyph(1, value(2, 0, 300), value(5, 0, 1)),
+        glyph(2, value(3, 0, 7, "append"), ref(5, 0, (3, 0), "insert")),
+        glyph(2, ref(3, 0, (5, 1), "pop"), ref(5, 0, (3, 0), "pop_and_append")),
+        glyph(2, value(5, 0, 3, "addition_assignment", "list"), value(2, 0, -1), question((2, 0), "while")),
+    ],
+    "if": [
+        glyph(1, value(2, 0, 300), value(3, 0, 1), value(3, 1, 2), value(5, 0, 1), value(5, 1, 1000)),
+        glyph(2, ref(3, 0, (5, 0), "exponent_assignment"), value(3, 1, 5, "exponent_assignment"),
+              value(3, 1, 1009, "mod_assignment")),
+        glyph(2, value(5, 1, -1), question((5, 1), "if")),
+        glyph(2, value(2, 0, -1), question((2, 0), "while")),
+    ],
+    "middle repeat": [
+        glyph(1, value(2, 0, 300)),
+        glyph(2, value(2, 0, -1), value(3, 0, 1), question((2, 0), "while")),
+        glyph(2, value(3, 1, 5)),
+    ],
+}
+
+def run(glyphs, monkeypatch, threshold=None, limits=None, step=None):
+    parse_as(monkeypatch, glyphs)
+    intr = Interpreter()
+    intr.memoize = intr.closed_form = False
+    if threshold is None:
+        intr.tier = False
+    else:
+        intr.tier_threshold = threshold
+    intr.limits = limits or Limits()
+    execution = intr.start("")
+    while not execution.done:
+        intr.advance(execution, step)
+    return execution.state.to_dict(), execution.glyphs_run, intr
+
+@pytest.mark.parametrize("name", loops)
+@pytest.mark.parametrize("threshold", [1, 50])
+def test_compiled_blocks_run_as_interpreted(name, threshold, monkeypatch):
+    state, glyphs_run, _ = run(loops[name], monkeypatch)
+    tiered_state, tiered_glyphs, intr = run(loops[name], monkeypatch, threshold)
+    assert tiered_state == state
+    assert tiered_glyphs == glyphs_run
+    assert intr.tiers.iterations_run > 0
+    assert len(intr.tiers.report) == 1
+
+def test_stepping_hands_back_at_iteration_boundaries(monkeypatch):
+    expected = run(loops["list commands"], monkeypatch)
+    assert run(loops["list commands"], monkeypatch, 1, step=37)[:2] == expected[:2]
+
+@pytest.mark.parametrize("progfile", sorted(p.name for p in PROGRAMS.glob("*.riv")))
+def test_programs_run_the_same_compiled(progfile):
+    intr = Interpreter()
+    intr.tier_threshold = 1
+    expected = Interpreter()
+    expected.tier = False
+    assert intr.interpret_file(PROGRAMS / progfile, False, "default") == \
+        expected.interpret_file(PROGRAMS / progfile, False, "default")
+
+@pytest.mark.parametrize("limits", [{"max_glyphs": 500}, {"max_iterations": 150}])
+def test_limits_are_exact_in_compiled_blocks(limits, monkeypatch):
+    with pytest.raises(LimitExceededError) as untiered:
+        run(loops["arithmetic"], monkeypatch, limits=Limits(**limits))
+    with pytest.raises(LimitExceededError) as tiered:
+        run(loops["arithmetic"], monkeypatch, 1, limits=Limits(**limits))
+    assert str(tiered.value) == str(untiered.value)
+
+def test_bad_reference_in_compiled_block(monkeypatch):
+    # list3 runs out of cells to move on the sixth iteration
+    glyphs = [
+        glyph(1, value(2, 0, 300), *(value(3, cell, 1) for cell in range(5))),
+        glyph(2, ref(5, 0, (3, 0), "pop_and_append"), value(2, 0, -1), question((2, 0), "while")),
+    ]
+    with pytest.raises(RivuletSyntaxError):
+        run(glyphs, monkeypatch, 1)
+
+def test_cold_blocks_are_not_compiled(monkeypatch):
+    _, _, intr = run(loops["arithmetic"], monkeypatch, 1000)
+    assert intr.tiers.blocks and not intr.tiers.compiled and intr.tiers.report == []
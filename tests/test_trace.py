@@ -0,0 +1,59 @@
+# pylint: skip-file
+"""
+Test recording and replaying binary execution traces
+"""
+import io
+from pathlib import Path
+import pytest
+from rivulet.riv_interpreter import Interpreter
+from rivulet import riv_trace
+from rivulet.riv_trace import TraceReader
+
+PROGRAMS = Path(__file__).parent.parent / "programs"
+
+@pytest.mark.parametrize("progfile", ["fibonacci1.riv", "fibonacci3.riv", "zero.riv"])
+def test_trace_replays_to_final_state(progfile, tmp_path):
+    tracefile = tmp_path / "trace.bin"
+    state = Interpreter().interpret_file(PROGRAMS / progfile, False, "default", tracefile)
+
+    reader = TraceReader(tracefile.read_bytes())
+    assert reader.program == (PROGRAMS / progfile).read_text(encoding="utf-8")
+    for _, _, replayed in reader.records():
+        pass
+    assert replayed == state
+
+def test_trace_records_loop_iterations_and_rollback(tmp_path):
+    tracefile = tmp_path / "trace.bin"
+    Interpreter().interpret_file(PROGRAMS / "fibonacci1.riv", False, "default", tracefile)
+
+    kinds = [(kind, info) for kind, info, _ in TraceReader(tracefile.read_bytes()).records()]
+    iterations = [info[1] for kind, info in kinds if kind == riv_trace.GLYPH and info[0] == 4]
+    assert iterations == list(range(len(iterations)))
+    assert (riv_trace.ROLLBACK, 4) in kinds
+
+def test_trace_holds_long_runs_and_many_writes():
+    stream = io.BytesIO()
+    recorder = riv_trace.TraceRecorder(stream, "", [2])
+    recorder.enter(0)
+    recorder.repeat(2 ** 40)
+    recorder.glyph(0, 2 ** 40, [(riv_trace.APPEND, 2, 0, v) for v in range(70000)])
+
+    records = list(TraceReader(stream.getvalue()).records())
+    assert records[1][:2] == (riv_trace.REPEAT, 2 ** 40)
+    kind, (glyph_id, iteration, writes), state = records[2]
+    assert (kind, glyph_id, iteration, len(writes)) == (riv_trace.GLYPH, 0, 2 ** 40, 70000)
+    assert state[2] == list(range(70000))
+
+def test_trace_values_round_trip():
+    for value in [0, -5, 2 ** 63, -(2 ** 70), 1.5, complex(1, -2)]:
+        packed = riv_trace._pack_value(value)
+        assert riv_trace._unpack_value(packed, 0) == (value, len(packed))
+
+def test_trace_show_prints_each_glyph_once(tmp_path, capsys):
+    tracefile = tmp_path / "trace.bin"
+    Interpreter().interpret_file(PROGRAMS / "fibonacci1.riv", False, "default", tracefile)
+
+    riv_trace.main(["show", str(tracefile)])
+    out = capsys.readouterr().out
+    assert out.count("level: 2\nlist3[0] += 0\nlist3[1] += 0\nlist3[2] -= list3[1]") == 1
+    assert "rollback at glyph 4" in out